@@ -31,6 +31,21 @@ CRGB led_color = CRGB::Blue;  // LED color, default= Blue
 
 CRGB leds[numColumns * numRows];
 
+/* Step program: the host uploads a sliding window of steps (PS), shows one (PG) */
+/* and then advances with a single '+' or '-' byte sent outside of a <...> frame  */
+const int PROGRAM_SLOTS = 16;                            // step n is kept in slot n % PROGRAM_SLOTS
+const int MASK_BYTES = (numColumns * numRows + 7) / 8;   // 12
+struct ProgramStep {
+  long number;                                           // -1 = empty slot
+  uint8_t mask[MASK_BYTES];
+  CRGB color;
+};
+ProgramStep program[PROGRAM_SLOTS];
+long currentStep = -1;
+long stepNumber = 0;           // column field of PS / PG frames, read as a long
+CRGB frameColor = CRGB::Blue;  // RGB fields of the last frame (PS keeps them for its step)
+bool frameHasColor = false;
+
 inline uint8_t clamp8(long v) {
   if (v < 0) return 0;
   if (v > 255) return 255;
@@ -206,18 +221,24 @@ void setBright(void) {
 }
 
 /* Set LEDs once using a 96-bit mask (LSB-first, row-major: bit0=A01, ... bit95=H12) */
-bool applyMaskHex(const char* maskHex) {
-  if (!maskHex) return false;
+/* clearFirst=false (MA command) keeps the LEDs outside the mask, so several colours can be layered */
+/* A mask too long for one frame comes in parts: firstByte (the column field) is the mask byte the   */
+/* part starts at, 1 = A01, and the part may be shorter than the whole mask                         */
+bool applyMaskHex(const char* maskHex, int firstByte = 1, bool clearFirst = true) {
+  if (!maskHex || firstByte < 1) return false;
   const int total = numRows * numColumns;  // 96
   const int BYTES = (total + 7) / 8;       // 12
+  const int offset = firstByte - 1;
+  const int count = strlen(maskHex) / 2;
+  if (count < 1 || offset + count > BYTES) return false;
   uint8_t mask[BYTES];
-  if (!hexToBytes(maskHex, mask, BYTES)) return false;
+  if (!hexToBytes(maskHex, mask, count)) return false;
 
-  // Strategy here: Unselected items are cleared as black, selected items are set to led_color.
-  FastLED.clear();
-  for (int idx = 0; idx < total; ++idx) {
-    int byte_i = idx >> 3;  // /8
-    int bit_i = idx & 7;    // %8, LSB-first
+  // Strategy here: Unselected items are cleared as black (M) or left untouched (MA), selected items are set to led_color.
+  if (clearFirst) FastLED.clear();
+  for (int idx = offset * 8; idx < total && idx < (offset + count) * 8; ++idx) {
+    int byte_i = (idx >> 3) - offset;  // /8
+    int bit_i = idx & 7;               // %8, LSB-first
     if (mask[byte_i] & (1 << bit_i)) {
       leds[idx] = led_color;
     }
@@ -226,6 +247,49 @@ bool applyMaskHex(const char* maskHex) {
   return true;
 }
 
+/* Forget every uploaded step */
+void clearProgram() {
+  for (int i = 0; i < PROGRAM_SLOTS; i++) program[i].number = -1;
+  currentStep = -1;
+  Serial.println(F("Program cleared."));
+}
+
+/* PS: keep step <number> (mask + color) until the slot is reused */
+bool storeStep(long number, const char* maskHex) {
+  if (number < 0) return false;
+  ProgramStep& step = program[number % PROGRAM_SLOTS];
+  if (!hexToBytes(maskHex, step.mask, MASK_BYTES)) return false;
+  step.number = number;
+  step.color = frameHasColor ? frameColor : led_color;
+  return true;
+}
+
+/* Show an uploaded step; replies <STEP:n>, or <MISS:n> when it is not loaded (host resyncs) */
+bool showStep(long number) {
+  if (number < 0 || program[number % PROGRAM_SLOTS].number != number) {
+    Serial.printf_P(PSTR("<MISS:%ld>\n"), number);
+    return false;
+  }
+  const ProgramStep& step = program[number % PROGRAM_SLOTS];
+  FastLED.clear();
+  for (int idx = 0; idx < numRows * numColumns; ++idx) {
+    if (step.mask[idx >> 3] & (1 << (idx & 7))) leds[idx] = step.color;
+  }
+  FastLED.show();
+  currentStep = number;
+  Serial.printf_P(PSTR("<STEP:%ld>\n"), number);
+  return true;
+}
+
+/* Single-byte next / previous */
+void stepBy(int delta) {
+  if (currentStep < 0) {
+    Serial.println(F("<MISS:-1>"));
+    return;
+  }
+  showStep(currentStep + delta);
+}
+
 /* Software restart */
 void restart(uint32_t wait_ms = 100) {
   FastLED.clear();
@@ -285,6 +349,10 @@ void recvWithStartEndMarkers() {
       }
     } else if (receivedCharacter == startMarker) {
       recvInProgress = true;
+    } else if (receivedCharacter == '+') {
+      stepBy(1);
+    } else if (receivedCharacter == '-') {
+      stepBy(-1);
     }
   }
 }
@@ -296,7 +364,10 @@ void parseData() {
   if (strtokIndx) strcpy(rowLetter, strtokIndx);
   else rowLetter[0] = '\0';
   strtokIndx = strtok(NULL, ",");  // column (1-based)
-  if (strtokIndx) columnNumber = atoi(strtokIndx);
+  if (strtokIndx) {
+    columnNumber = atoi(strtokIndx);
+    stepNumber = atol(strtokIndx);  // PS / PG: step number (an int is 16 bits on AVR)
+  }
   strtokIndx = strtok(NULL, ",");  // command
   if (strtokIndx) strcpy(illuminationCommand, strtokIndx);
   else illuminationCommand[0] = '\0';
@@ -312,8 +383,10 @@ void parseData() {
   if (strtokIndx) b = strtol(strtokIndx, NULL, 10);
   strtokIndx = strtok(NULL, ",");
   if (strtokIndx) bri = strtol(strtokIndx, NULL, 10);
-  // If R/G/B values are provided, update the color (no command restrictions)
-  if (r >= 0 && g >= 0 && b >= 0) {
+  frameHasColor = r >= 0 && g >= 0 && b >= 0;
+  if (frameHasColor) frameColor = CRGB(clamp8(r), clamp8(g), clamp8(b));
+  // If R/G/B values are provided, update the color (except PS, which stores it with the step)
+  if (frameHasColor && strcmp(illuminationCommand, "PS") != 0) {
     led_color = CRGB(clamp8(r), clamp8(g), clamp8(b));
     Serial.printf_P(PSTR("Color set to R=%u G=%u B=%u\n"),
                     led_color.r, led_color.g, led_color.b);
@@ -367,8 +440,20 @@ bool parseIlluminationCommand(const char* cmd) {
     return true;
   } else if (strcmp(cmd, "M") == 0) {
     // Here, plateBarcode is used as the 24Hex mask carrier (the 4th field in parseData)
-    if (applyMaskHex(plateBarcode)) return true;
+    if (applyMaskHex(plateBarcode, columnNumber)) return true;
     else return false;
+  } else if (strcmp(cmd, "MA") == 0) {
+    // Same mask carrier as M, but adds to the LEDs already lit
+    return applyMaskHex(plateBarcode, columnNumber, false);
+  } else if (strcmp(cmd, "PS") == 0) {
+    // <K,n,PS,MASK_HEX,R,G,B>: store step n (column field) for '+' / '-'
+    return storeStep(stepNumber, plateBarcode);
+  } else if (strcmp(cmd, "PG") == 0) {
+    // <A,n,PG,>: show step n and make it the current step
+    return showStep(stepNumber);
+  } else if (strcmp(cmd, "PX") == 0) {
+    clearProgram();
+    return true;
   } else {
     Serial.println(F("ERROR Appropriate value not received."));
     return false;
@@ -389,9 +474,11 @@ void setup() {
   Serial.println(F("1 is row letter, 2 is column, 3 is illumination command, 4,5,6 is RGB color, 7 is Bright."));
   Serial.println(F("Valid row and columns are plate density dependent."));
   Serial.println(F("Valid illumination commands are: S - illuminate single well, R - illuminate entire row, C - illuminate entire column."));
+  Serial.println(F("Step program: <K,n,PS,MASK,R,G,B> stores step n, <A,n,PG,> shows it, <A,1,PX,> clears; then send + or -."));
   Serial.println();
 
   //illuminationTest();
+  for (int i = 0; i < PROGRAM_SLOTS; i++) program[i].number = -1;
   clearDisplay();
 }
 
@@ -211,15 +211,16 @@ void setBright(void) {
 }
 
 /* Set LEDs once using a 96-bit mask (LSB-first, row-major: bit0=A01, ... bit95=H12) */
-bool applyMaskHex(const char* maskHex) {
+/* clearFirst=false (MA command) keeps the LEDs outside the mask, so several colours can be layered */
+bool applyMaskHex(const char* maskHex, bool clearFirst = true) {
   if (!maskHex) return false;
   const int total = numRows * numColumns;  // 96
   const int BYTES = (total + 7) / 8;       // 12
   uint8_t mask[BYTES];
   if (!hexToBytes(maskHex, mask, BYTES)) return false;
 
-  // Strategy here: Unselected items are cleared as black, selected items are set to led_color.
-  FastLED.clear();
+  // Strategy here: Unselected items are cleared as black (M) or left untouched (MA), selected items are set to led_color.
+  if (clearFirst) FastLED.clear();
   for (int idx = 0; idx < total; ++idx) {
     int byte_i = idx >> 3;  // /8
     int bit_i = idx & 7;    // %8, LSB-first
@@ -383,6 +384,9 @@ bool parseIlluminationCommand(const char* cmd) {
     // Here, plateBarcode is used as the 24Hex mask carrier (the 4th field in parseData)
     if (applyMaskHex(plateBarcode)) return true;
     else return false;
+  } else if (strcmp(cmd, "MA") == 0) {
+    // Same mask carrier as M, but adds to the LEDs already lit
+    return applyMaskHex(plateBarcode, false);
   } else {
     Serial.println(F("ERROR Appropriate value not received."));
     return false;
@@ -1,260 +1,98 @@
 import tkinter as tk
-from tkinter import Frame,colorchooser
-import serial
-import serial.tools.list_ports
-from threading import Thread, Lock
-from threading import Event
-import queue
-import time
-
-# LED板基本參數設定
-boxRow = 8 # 8 rows
-boxColumn = 12 # 12 columns
-
-# 取得可用 COM ports
-def get_available_ports():
-    ports = serial.tools.list_ports.comports()
-    return [port.device for port in ports]
-
-# 串口連接類別
-class SerialConnection:
-    def __init__(self):
-        self.connection = None
-        self._lock = Lock()  # 保證同時間只有一個 write
-
-    # 連接指定的 COM port
-    def connect(self, port):
-        try:
-            if self.connection:
-                self.connection.close()
-            self.connection = serial.Serial(
-                port,
-                500000,
-                timeout=0,            # 非阻塞讀
-                write_timeout=1.0,    # 寫入逾時避免死等
-                stopbits=serial.STOPBITS_TWO,
-                # 視硬體情況可開：rtscts=True 或 xonxoff=True
-            )
-            # 確認連接成功
-            try:
-                self.connection.reset_input_buffer()
-                self.connection.reset_output_buffer()
-            except Exception:
-                pass
-            return True
-        # 連接失敗
-        except Exception as e:
-            print(f"Connect fail: {str(e)}")
-            return False
-    
-    # 安全寫入並排空輸出佇列
-    def write_and_drain(self, data: bytes, inter_delay: float = 0.001):
-        """
-        安全寫入：write -> flush -> out_waiting 清空 -> 可選間隔
-        不要在 UI 執行緒大量呼叫；建議搭配 SerialSender 佇列背景送。
-        """
-        if not (self.connection and self.connection.is_open):
-            return False
-        with self._lock:
-            self.connection.write(data)
-            # 1) 等待 Driver/OS 緩衝送出
-            self.connection.flush()
-            # 2) 確認輸出佇列已空（有些平台 out_waiting 可能一直是 0，也沒關係）
-            while getattr(self.connection, "out_waiting", 0) > 0:
-                time.sleep(0.001)
-            # 3) 留一點處理縫隙給對端 MCU（必要時可調大）
-            if inter_delay > 0:
-                time.sleep(inter_delay)
-        return True
-    #  write不等待的版本（保留）
-    def write(self, data):
-        if self.connection and self.connection.is_open:
-            self.connection.write(data)
-    
-    # 關閉COM port連接
-    def close(self):
-        if self.connection:
-            try:
-                self.connection.close()
-            except Exception:
-                pass
-            self.connection = None
-
-# 專責安序（序列化）送資料的背景執行緒
-class SerialSender:
-    """
-    專責安序（序列化）送資料的背景執行緒。
-    UI 呼叫 send(payload) -> 背景逐筆 write_and_drain -> (可選) 等 ACK
-    """
-    def __init__(self, ser_conn: SerialConnection,
-                 inter_delay: float = 0.001,
-                 wait_ack: bool = False, ack_token: bytes = b"<ACK>", ack_timeout: float = 0.3):
-        self.ser_conn = ser_conn
-        self.q = queue.Queue()
-        self.stop_evt = Event()
-        self.inter_delay = inter_delay
-        self.wait_ack = wait_ack
-        self.ack_token = ack_token
-        self.ack_timeout = ack_timeout
-        self.thread = Thread(target=self._run, daemon=True)
-    
-    # 啟動背景執行緒
-    def start(self):
-        if not self.thread.is_alive():
-            self.thread.start()
-
-    # 停止背景執行緒
-    def stop(self):
-        self.stop_evt.set()
-        self.q.put(None)  # 喚醒
-        self.thread.join(timeout=1)
-
-    # 放入佇列等待送出
-    def send(self, payload: bytes):
-        self.q.put(payload)
-
-    # 等待 ACK 標記
-    def _wait_for_ack(self) -> bool:
-        """
-        等待直到讀到一段以 '>' 結尾的資料，且內容含有 ack_token（例如 <ACK>）。
-        若超時則回 False。
-        """
-        conn = self.ser_conn.connection
-        if not (conn and conn.is_open):
-            return False
-        deadline = time.monotonic() + float(self.ack_timeout)
-        buf = b""
-        # 設置臨時讀逾時
-        old_to = conn.timeout
-        conn.timeout = min(self.ack_timeout, 0.5)
-        try:
-            while time.monotonic() < deadline:
-                # 裝置會用 println("<ACK>")，所以讀到 '>' 為止即可湊齊一個標記
-                chunk = conn.read_until(b'>')
-                if chunk:
-                    buf += chunk
-                    if self.ack_token in buf:
-                        # print("ACK:", buf)  # 需要除錯可打開
-                        return True
-                else:
-                    # 沒資料就小睡一下，避免空轉
-                    time.sleep(0.001)
-        finally:
-            conn.timeout = old_to
-        print("WARN: missing ACK, got:", buf)
-        return False
-    
-    # 主要執行緒函式
-    def _run(self):
-        while not self.stop_evt.is_set():
-            item = self.q.get()
-            if item is None:
-                break
-            # 等待串口連接
-            if self.wait_ack and self.ser_conn.connection:
-                try:
-                    self.ser_conn.connection.reset_input_buffer()
-                except Exception:
-                    pass
-            # 寫出 + 排空 + 小延遲
-            self.ser_conn.write_and_drain(item, inter_delay=self.inter_delay)
-            # 等 ACK
-            if self.wait_ack:
-                _ok = self._wait_for_ack()
-            self.q.task_done()
-
-# 建立全域串口連接物件
-serial_connection = SerialConnection()
-
-# 統一的送指令介面
-def sendSerialCommand(command="S", s_row='A', s_col=1, textNote="empty", rgb=(0, 0, 255), bright=None):
-    """
-    L: <A,1,L,empty,0,0,0,BRIGHT>   只送一次（全域亮度）
-    S: <ROW,COL,S,NOTE,R,G,B>       逐孔位顏色（不帶亮度）
-    X: <A,1,X,empty>
-    """
-    # L:設定亮度指令處理
-    if command == "L":
-        if bright is None:
-            raise ValueError("sendSerialCommand(L): bright is required")
-        br = int(max(0, min(255, bright)))
-        serialString = f"<A,1,L,empty,0,0,0,{br}>"
-    # M:LED陣列資料傳送指令處理
-    elif command == "M":
-        # textNote 這裡放 mask_hex（24 hex chars）
-        r, g, b = [int(max(0, min(255, v))) for v in rgb]
-        mask_hex = textNote
-        if not isinstance(mask_hex, str) or len(mask_hex) != 24:
-            raise ValueError("sendSerialCommand(M): mask_hex must be 24 hex chars")
-        serialString = f"<A,1,M,{mask_hex.upper()},{r},{g},{b}>"
-    # S:單孔位資料傳送指令處理
-    elif command == "S":
-        r, g, b = [int(max(0, min(255, v))) for v in rgb]
-        serialString = f"<{s_row},{s_col},S,{textNote},{r},{g},{b}>"
-    # X:關閉面板指令處理
-    elif command == "X":
-        serialString = "<A,1,X,empty>"
-    # 其他指令不支援
-    else:
-        raise ValueError("Invalid parameters for sendSerialCommand()")
-    
-    print(serialString)
-    payload = serialString.encode("us-ascii")
-
-    # 優先用背景 sender；沒有的話就同步送（含排空）
-    if 'lightPanelGUIinstance' in globals() and hasattr(lightPanelGUIinstance, 'sender') and lightPanelGUIinstance.sender:
-        lightPanelGUIinstance.sender.send(payload)
-    else:
-        serial_connection.write_and_drain(payload, inter_delay=0.005)
-
-# 統一透過 sender 送出 X 指令，並等待 ACK
-def turnPanelOff():
-    sendSerialCommand(command="X")
-
-# 關閉視窗時的清理工作
-def onClosing():
-    try:
-        if lightPanelGUIinstance and lightPanelGUIinstance.timer_job is not None:
-            lightPanelGUIinstance.after_cancel(lightPanelGUIinstance.timer_job)
-            lightPanelGUIinstance.timer_job = None
-    except Exception:
-        pass
-
-    # 先送 X 指令關閉面板
-    try:
-        turnPanelOff()
-        # 等佇列清空，避免關太快丟包
-        if lightPanelGUIinstance and hasattr(lightPanelGUIinstance, 'sender') and lightPanelGUIinstance.sender:
-            lightPanelGUIinstance.sender.q.join()
-    except Exception:
-        pass
-
-    # 再停 sender
-    try:
-        if lightPanelGUIinstance and hasattr(lightPanelGUIinstance, 'sender') and lightPanelGUIinstance.sender:
-            lightPanelGUIinstance.sender.stop()
-            lightPanelGUIinstance.sender = None
-    except Exception:
-        pass
-    # 最後關串口
-    serial_connection.close()
+from tkinter import Frame,colorchooser,filedialog
+import multiprocessing
+from maple_serial import get_available_ports
+from maple_session import Session, defaultCore, LinkMonitor
+from panel_protocol import boxRow, boxColumn, encodeSerialCommand
+from plate_layout import PLATE_DENSITIES, parseDensity
+from well_grid import WellGrid
+from plate_mirror import PlateMirror
+from colour_map import loadColourMap
+from worklist_io import WORKLIST_FILETYPES
+from timed_program import Stage, TimedProgram
+from stall_watchdog import startWatchdog
+
+# 關掉所有工作階段視窗後再關 I/O 核心（送完佇列、關埠）
+def onClosing(root, watchdog=None):
+    for gui in list(lightPanelGUI.open_windows):
+        gui.close()
+    defaultCore.shutdown()
     print("Closing serial port!")
-    mainWindow.destroy()
+    if watchdog:
+        watchdog.stop()
+    root.destroy()
 
 # 主視窗類別
 class lightPanelGUI(Frame):
-    checkboxes = [] # 96 個 checkbox 的 IntVar
-    row_checkboxes = [] # 8 個列 checkbox 的 IntVar
-    column_checkboxes = [] # 12 個行 checkbox 的 IntVar
+
+    # 目前開著的工作階段視窗
+    open_windows = []
 
     # 初始化 
-    def __init__(self, master=None):
+    def __init__(self, master=None, session=None):
         super().__init__(master)
         self.pack(fill="both", expand=True)
-        # 倒數狀態
+        # 這個視窗自己的工作階段（面板連線、送出佇列）；排程器由同一行程的 session 共用
+        self.session = session or Session()
+        # 倒數狀態：時間由 scheduler 的單調時鐘決定，timer_job 只負責刷新畫面
         self.remaining = 0
         self.timer_job = None
+        self.scheduler = self.session.core.scheduler
+        self.stages = []   # 使用者加入的多段程式
+        self.run_name = self.session.name
         self.create_widgets()
+        # 面板跟不上（佇列滿、指令被丟掉）時顯示出來；面板內容要重新設定（定時程式的下一段會自己重畫）
+        self.link_monitor = LinkMonitor(self, self.session,
+                                        lambda text: self.countdown_var.set(text or "Panel caught up; set the wells again")).start()
+        lightPanelGUI.open_windows.append(self)
+
+    # 統一的送指令介面
+    def send_command(self, command="S", s_row='A', s_col=1, textNote="empty", rgb=(0, 0, 255), bright=None):
+        """
+        L: <A,1,L,empty,0,0,0,BRIGHT>   只送一次（全域亮度）
+        S: <ROW,COL,S,NOTE,R,G,B>       逐孔位顏色（不帶亮度）
+        X: <A,1,X,empty>
+        編碼細節見 panel_protocol.encodeSerialCommand
+        """
+        self.send_frames([encodeSerialCommand(command, s_row, s_col, textNote, rgb, bright)])
+
+    # 送出已編碼好的指令（定時程式預先編碼後直接呼叫，會在排程執行緒上執行）
+    def send_frames(self, frames):
+        self.session.send(frames)
+
+    # 透過 sender 送出 X 指令關閉面板
+    def turn_panel_off(self):
+        self.send_command(command="X")
+
+    # 再開一個工作階段視窗（共用同一個 I/O 核心，可接另一片面板）
+    def new_window(self):
+        window = tk.Toplevel(self._root())
+        gui = lightPanelGUI(window)
+        window.title(f"Timing Light Panel Controller - {gui.session.name}")
+        window.protocol("WM_DELETE_WINDOW", gui.close)
+
+    # 關閉這個工作階段：停定時程式、關面板、送完佇列再釋放埠
+    def close(self):
+        self.link_monitor.stop()
+        try:
+            if self.timer_job is not None:
+                self.after_cancel(self.timer_job)
+                self.timer_job = None
+            self.scheduler.cancel(self.run_name)
+        except Exception:
+            pass
+        try:
+            if self.session.connected():
+                self.turn_panel_off()
+        except Exception:
+            pass
+        if self.mirror is not None:
+            self.mirror.detach()
+        self.session.close()
+        if self in lightPanelGUI.open_windows:
+            lightPanelGUI.open_windows.remove(self)
+        if isinstance(self.master, tk.Toplevel):
+            self.master.destroy()
     # 建立元件
     def create_widgets(self):
         # 第一排 COM port 選單與連接按鈕
@@ -285,6 +123,9 @@ class lightPanelGUI(Frame):
         self.disconnect_button = tk.Button(fm1, text="Disconnect", command=self.disconnect_serial)
         self.disconnect_button.config(state='disabled')
         self.disconnect_button.pack(side="left", fill="y", expand=False, padx=2, pady=2)
+        # 新工作階段視窗
+        self.new_window_button = tk.Button(fm1, text="New window", command=self.new_window)
+        self.new_window_button.pack(side="right", fill="y", expand=False, padx=2, pady=2)
         # 第二排 顏色與亮度
         fm2 = tk.LabelFrame(self.master)
         fm2.config(text="LED Color and Brightness")
@@ -321,6 +162,18 @@ class lightPanelGUI(Frame):
             command=self.timer_sprinbox_changed
         )
         self.timer_spinbox.pack(side="left", fill="y", expand=False, padx=2, pady=2)
+        # 重複次數 Spinbox
+        tk.Label(fm3, text="Repeat:").pack(side="left", fill="y", expand=False, padx=2, pady=2)
+        self.repeat_var = tk.IntVar(value=1)
+        self.repeat_spinbox = tk.Spinbox(fm3, from_=1, to=999, width=4, textvariable=self.repeat_var)
+        self.repeat_spinbox.pack(side="left", fill="y", expand=False, padx=2, pady=2)
+        # 加入段落 / 清除段落按鈕
+        self.add_stage_button = tk.Button(fm3, text="Add stage", command=self.add_stage)
+        self.add_stage_button.pack(side="left", fill="y", expand=False, padx=2, pady=2)
+        self.clear_stage_button = tk.Button(fm3, text="Clear stages", command=self.clear_stages)
+        self.clear_stage_button.pack(side="left", fill="y", expand=False, padx=2, pady=2)
+        self.stage_count_var = tk.StringVar(value="0 stages")
+        tk.Label(fm3, textvariable=self.stage_count_var).pack(side="left", padx=2, pady=2)
         # 開始按鈕
         self.start_button = tk.Button(
             fm3, text="Start", fg="blue", padx= 20, command=self.start_countdown, state='disabled'
@@ -337,118 +190,86 @@ class lightPanelGUI(Frame):
         self.countdown_label = tk.Label(fm3, textvariable=self.countdown_var)
         self.countdown_label.pack(side="left", padx=12, pady=2)
         
-        # 第四排 96 個 checkbox
+        # 第四排 孔位選取格子（單一 Canvas，點選/拖曳框選/表頭整列整欄）
         fm4 = tk.LabelFrame(self.master)
         fm4.config(text="LED Select")
         fm4.pack(side="top", fill="x", padx=6, pady=6, anchor="nw")
+        tools = tk.Frame(fm4)
+        tools.pack(side="top", fill="x")
+        # 板子密度
+        self.density_var = tk.StringVar(value=f"{boxRow * boxColumn} well")
+        tk.OptionMenu(tools, self.density_var, *[f"{d} well" for d in PLATE_DENSITIES],
+                      command=lambda _v: self._build_grid()).pack(side="left", padx=2, pady=2)
+        tk.Button(tools, text="Fill", command=lambda: self.grid_view.fill()).pack(side="left", padx=2, pady=2)
+        tk.Button(tools, text="Clear", command=lambda: self.grid_view.clear()).pack(side="left", padx=2, pady=2)
+        tk.Button(tools, text="Invert", command=lambda: self.grid_view.invert()).pack(side="left", padx=2, pady=2)
+        tk.Button(tools, text="Colour map...", command=self.load_colour_map).pack(side="left", padx=2, pady=2)
+        self.selected_count_var = tk.StringVar(value="0 selected")
+        tk.Label(tools, textvariable=self.selected_count_var).pack(side="left", padx=12, pady=2)
+        self.grid_frame = tk.Frame(fm4)
+        self.grid_frame.pack(side="top", anchor="nw", padx=2, pady=2)
+        self.grid_view = None
+
+        # 第五排 面板鏡像（依已確認的指令畫出面板目前的狀態，框線為排隊中 / 等 ACK 的指令）
+        fm5 = tk.LabelFrame(self.master)
+        fm5.config(text="Panel Mirror")
+        fm5.pack(side="top", fill="x", padx=6, pady=3, anchor="nw")
+        self.mirror_frame = tk.Frame(fm5)
+        self.mirror_frame.pack(side="top", anchor="nw", padx=2, pady=2)
+        self.mirror = None
+        self._build_grid()
+
+    # 依密度建立（或重建）孔位格子
+    def _build_grid(self):
+        rows, columns = PLATE_DENSITIES[parseDensity(self.density_var.get())]
+        if self.grid_view is not None:
+            self.grid_view.destroy()
+        self.grid_view = WellGrid(self.grid_frame, rows, columns, on_change=self._selection_changed)
+        self.grid_view.set_on_color(self.color_var.get())
+        self.grid_view.pack()
+        self._selection_changed(self.grid_view.selection)
+        self._build_mirror()
+
+    # 面板鏡像跟著密度重建，連線中就重新接上
+    def _build_mirror(self):
+        rows, columns = PLATE_DENSITIES[parseDensity(self.density_var.get())]
+        if self.mirror is not None:
+            self.mirror.destroy()
+        self.mirror = PlateMirror(self.mirror_frame, rows, columns)
+        self.mirror.pack()
+        link = self.session.link("panel")
+        if link is not None:
+            self.mirror.attach(link.sender)
+
+    # 選取變更時更新計數
+    def _selection_changed(self, selection):
+        self.selected_count_var.set(f"{selection.count()} selected")
 
-        # 建立 96 個 checkbox（8x12）+ 左側列標頭 + 上方欄標頭
-        for i in range(boxRow + 1):
-            for j in range(boxColumn + 1):
-                var = tk.IntVar()
-                if i == 0 and j == 0:
-                    continue
-                elif i == 0:
-                # 欄表頭（1..boxColumn）
-                    cb = tk.Checkbutton(
-                        fm4, variable=var, text=f"{j}",
-                        command=lambda column=j, v=var: self.column_checkbox_clicked(column, v)
-                    )
-                    cb.grid(row=i, column=j, padx=2, pady=2)
-                    self.column_checkboxes.append(var)
-                elif j == 0:
-                # 列表頭（A..H）
-                    cb = self.make_left_text_checkbutton(
-                        fm4, text=chr(ord('A') + i - 1), var=var,
-                        command=lambda row=i, v=var: self.row_checkbox_clicked(row, v)
-                    )
-                    cb.grid(row=i, column=j, padx=2, pady=2)
-                    self.row_checkboxes.append(var)
-                else:
-                    cb = tk.Checkbutton(fm4, text= f"{chr(ord('A') + i - 1)}{j:02d}", variable=var)
-                    cb.grid(row=i, column=j, padx=2, pady=2)
-                    self.checkboxes.append(var)
-    
-    # 建立文字朝左的 Checkbutton
-    def make_left_text_checkbutton(self, parent, text, var, command=None):
-        wrapper = tk.Frame(parent)
-        lbl = tk.Label(wrapper, text=text)
-        # 只有在有 command 的情況才加上該參數
-        if command is not None:
-            cb = tk.Checkbutton(wrapper, variable=var, command=command)
-        else:
-            cb = tk.Checkbutton(wrapper, variable=var)
-        lbl.pack(side="left", padx=(0,4))
-        cb.pack(side="left")
-
-        # 讓點文字也能切換勾選
-        def toggle(_event=None, v=var):
-            v.set(0 if v.get() else 1)
-            if command:
-                command()
-        lbl.bind("<Button-1>", toggle)
-
-        return wrapper
-    
     # 建立COM port連接
     def connect_serial(self):
         port = self.port_var.get()
-        if serial_connection.connect(port):
+        # 背景 sender 等 <ACK>；連線後先校正面板，間隔與逾時依量到的 ACK 延遲調整（下面只是校正前的預設值）
+        if self.session.connect("panel", port, wait_ack=True, inter_delay=0.002, ack_timeout=0.5):
             print(f"Connected to {port}")
+            self.mirror.attach(self.session.link("panel").sender)
             self.countdown_var.set(f"{port} connected")
             self.connect_button.config(state='disabled')
             self.disconnect_button.config(state='normal')
             self.start_button.config(state='normal')
-
-            if not hasattr(self, 'sender') or self.sender is None:
-                self.sender = SerialSender(
-                    serial_connection,
-                    inter_delay=0.002,     # 1~5ms 視裝置負載可調
-                    wait_ack=True,         # 等 <ACK>
-                    ack_token=b"<ACK>",
-                    ack_timeout=0.5        # 0.2~0.5 視需求調整
-                )
-                self.sender.start()
         else:
             print(f"Failed to connect to {port}")
 
     # 斷開COM port連接
     def disconnect_serial(self):
-        # 先停 sender
-        if hasattr(self, 'sender') and self.sender:
-            try:
-                self.sender.stop()
-            except Exception:
-                pass
-            self.sender = None
-
-        serial_connection.close()
+        # 送完佇列後釋放埠（其他工作階段還在用就不會真的關）
+        self.session.disconnect()
+        self.mirror.detach()
         print("Disconnected from serial port")
         self.countdown_var.set("Device disconnected")
         self.connect_button.config(state='normal')
         self.disconnect_button.config(state='disabled')
         self.start_button.config(state='disabled')
     
-    # 處理列 checkbox 點擊事件
-    def row_checkbox_clicked(self, row_index, row_var):
-        state = row_var.get()
-        print(f"Row {row_index} clicked, state: {state}")
-        print(f"Total checkboxes: {len(self.checkboxes)}")
-        base = (row_index - 1) * boxColumn
-        for j in range(boxColumn):
-            index = base +j
-            if index < len(self.checkboxes):
-                self.checkboxes[index].set(state)
-    # 處理行 checkbox 點擊事件
-    def column_checkbox_clicked(self, column_index, column_var):
-        state = column_var.get()
-        print(f"Column {column_index} clicked, state: {state}")
-        print(f"Total checkboxes: {len(self.checkboxes)}")
-        for i in range(boxRow):
-            index = i * boxColumn + (column_index - 1)
-            if index < len(self.checkboxes):
-                self.checkboxes[index].set(state)
-    
     # 顏色選擇器
     def color_pick_box(self):
         color_code = colorchooser.askcolor(
@@ -466,49 +287,86 @@ class lightPanelGUI(Frame):
         except ValueError:
             print("Invalid input for timer")
 
+    # 以目前勾選、顏色、亮度與倒數秒數建立一個段落
+    def _current_stage(self) -> Stage:
+        try:
+            duration = int(self.timer_spinbox.get())
+        except ValueError:
+            duration = 5
+            self.countDownTime_var.set(duration)
+        r, g, b = self._hex_to_rgb(self.color_var.get())
+        bright = int(max(0, min(255, self.bright_var.get())))
+        return Stage(duration, mask_hex=self._selected_mask_hex(), rgb=(r, g, b), bright=bright)
+
+    # 把目前設定加入多段程式
+    def add_stage(self):
+        try:
+            stage = self._current_stage()
+        except ValueError as e:
+            print(f"Invalid stage: {e}")
+            return
+        stage.label = f"stage {len(self.stages) + 1}"
+        self.stages.append(stage)
+        self.stage_count_var.set(f"{len(self.stages)} stages")
+
+    # 清除多段程式
+    def clear_stages(self):
+        self.stages = []
+        self.stage_count_var.set("0 stages")
+
     # 倒數啟動
     def start_countdown(self):
-        """開始倒數：使用 after() 每秒更新一次，避免 UI 卡住"""
+        """
+        開始定時程式：沒有加入段落時就以目前設定當作單一段落（原本的倒數行為）。
+        時間由 ProgramScheduler 背景執行緒控制，after() 只用來刷新顯示。
+        """
         if self.timer_job is not None:
             return  # 已在倒數中，避免重複啟動
 
         try:
-            self.remaining = int(self.timer_spinbox.get())
+            stages = self.stages or [self._current_stage()]
+            repeats = int(self.repeat_spinbox.get())
         except ValueError:
-            self.remaining = 5
-            self.countDownTime_var.set(self.remaining)
-
-        if self.remaining <= 0:
+            stages = self.stages or [Stage(5)]
+            repeats = 1
+        program = TimedProgram(stages, repeats=repeats)
+        try:
+            self.scheduler.start(self.run_name, program, self.send_frames)
+        except ValueError as e:
+            # 遮罩無法編碼（長度不是任何一種板子）
+            print(f"Cannot start program: {e}")
+            self.countdown_var.set(str(e))
             return
-        self.setallwell()
+        self.remaining = program.duration()
+
         self.timer_spinbox.config(state='disabled')
         self.start_button.config(state='disabled')
         self.disconnect_button.config(state='disabled')
         self.stop_button.config(state='normal')
         self._update_countdown_label()
-        self.timer_job = self.after(1000, self._countdown_tick)
+        self.timer_job = self.after(100, self._countdown_tick)
 
-    # 每秒倒數更新 
+    # 定期刷新倒數顯示（剩餘時間由時鐘計算，不會因 UI 忙碌而漂移）
     def _countdown_tick(self):
-        self.remaining -= 1
-        if self.remaining <= 0:
-            self.countdown_var.set("Time's up!")
-            # 這裡可加入時間到的動作，例如：
-            # turnPanelOff() 或 sendSerialCommand(...)
-            turnPanelOff()
+        run = self.scheduler.get(self.run_name)
+        if run is None:
+            count, mean_ms, worst_ms = self.scheduler.jitter_stats()
+            self.countdown_var.set(f"Time's up! (jitter avg {mean_ms:+.1f} ms, max {worst_ms:.1f} ms)")
             self._finish_countdown_ui()
             self.timer_job = None
             return
 
-        self._update_countdown_label()
-        self.timer_job = self.after(1000, self._countdown_tick)
+        self.remaining = run.remaining()
+        self._update_countdown_label(run.current_label())
+        self.timer_job = self.after(100, self._countdown_tick)
 
     # 手動停止倒數
     def stop_countdown(self):
         if self.timer_job is not None:
             self.after_cancel(self.timer_job)
             self.timer_job = None
-        turnPanelOff()
+        self.scheduler.cancel(self.run_name)
+        self.turn_panel_off()
         self.countdown_var.set("Stopped")
         self._finish_countdown_ui()
 
@@ -520,8 +378,11 @@ class lightPanelGUI(Frame):
         self.stop_button.config(state='disabled')
 
     # 更新倒數顯示標籤
-    def _update_countdown_label(self):
-        self.countdown_var.set(f"{self.remaining} seconds remaining...")
+    def _update_countdown_label(self, label=""):
+        text = f"{self.remaining:.1f} seconds remaining..."
+        if label:
+            text = f"{label}: {text}"
+        self.countdown_var.set(text)
 
     # 顏色工具：依背景自動選擇文字顏色（黑/白）
     def _hex_to_rgb(self, hex_color: str):
@@ -550,6 +411,8 @@ class lightPanelGUI(Frame):
         fg = self._best_text_color(hex_color)
         self.color_var.set(hex_color.upper())
         self.color_display.config(bg=hex_color, fg=fg, textvariable=self.color_var)
+        if getattr(self, 'grid_view', None) is not None:
+            self.grid_view.set_on_color(hex_color)
 
     # 取得目前選擇的 RGB 顏色（0~255）
     def get_current_rgb255(self):
@@ -564,42 +427,38 @@ class lightPanelGUI(Frame):
     # 產生目前勾選的孔位遮罩字串
     def _selected_mask_hex(self) -> str:
         """
-        依 row-major 映射產生 96-bit 遮罩（A01 為 bit0, A02 為 bit1, …, H12 為 bit95）
-        回傳 12 bytes 的十六進位字串（24 chars, 大寫）。
+        依 row-major 映射產生遮罩（A01 為 bit0, A02 為 bit1, …；96 孔到 H12 為 bit95）
+        bitset 直接轉 bytes，回傳十六進位字串（96 孔為 24 chars, 大寫）。
         """
-        total_bits = boxRow * boxColumn  # 96
-        mask = bytearray((total_bits + 7) // 8)  # 12 bytes
-        # self.checkboxes 的順序就是 row-major：i 往下、j 往右
-        for i in range(1, boxRow + 1):          # A..H
-            for j in range(1, boxColumn + 1):   # 01..12
-                idx = (i - 1) * boxColumn + (j - 1)  # 0..95
-                if idx < len(self.checkboxes) and self.checkboxes[idx].get():
-                    byte_i = idx // 8
-                    bit_i  = idx % 8             # LSB-first：bit0=A01
-                    mask[byte_i] |= (1 << bit_i)
-        return mask.hex().upper()
-    
-    # 送出目前設定的全域亮度與選擇的孔位顏色
-    def setallwell(self):
-        """
-        L：只送一次全域亮度
-        S：逐孔位送顏色（只針對已勾選的孔位）
-        """
-        # 取得 UI 的顏色與亮度
-        r, g, b = self._hex_to_rgb(self.color_var.get())
-        bright = int(max(0, min(255, self.bright_var.get())))
-
-        # 1) 先送一次全域亮度（只需一次）
-        sendSerialCommand(command="L", bright=bright)
+        return self.grid_view.selection.mask_hex()
 
-        # 2) 逐孔位送顏色（只處理勾選的）
-        mask_hex = self._selected_mask_hex()
-        if int(mask_hex, 16) != 0:  # 有至少一顆要亮
-            sendSerialCommand(command="M", textNote=mask_hex, rgb=(r, g, b))
+    # 載入每孔顏色/數值表（Well + Colour 或 Value/Transfer_volume），依顏色分組成遮罩指令送出
+    def load_colour_map(self):
+        path = filedialog.askopenfilename(filetypes=WORKLIST_FILETYPES)
+        if not path:
+            return
+        selection = self.grid_view.selection
+        bright = int(max(0, min(255, self.bright_var.get())))
+        try:
+            colour_map = loadColourMap(path, selection.rows, selection.columns)
+            frames = colour_map.frames(bright=bright)
+        except (ValueError, ImportError) as e:
+            print(f"Colour map error: {e}")
+            self.countdown_var.set("Colour map error")
+            return
+        self.send_frames(frames)
+        # 格子顯示有顏色的孔位
+        selection.bits = colour_map.lit_bits()
+        self.grid_view.redraw()
+        self.countdown_var.set(f"Colour map: {len(colour_map.groups())} colours, {len(frames)} frames")
 # 主程式 入口
 if __name__ == '__main__':
+    # 打包成執行檔時，獨立寫入行程（MAPLE_WRITER=process）需要
+    multiprocessing.freeze_support()
     mainWindow = tk.Tk()
     mainWindow.title("Timing Light Panel Controller")
-    lightPanelGUIinstance = lightPanelGUI(mainWindow)
-    mainWindow.protocol("WM_DELETE_WINDOW", onClosing)
+    lightPanelGUI(mainWindow)
+    # MAPLE_WATCHDOG=1 時記錄卡住視窗的事件處理（stall_watchdog）；由 onClosing 停掉
+    watchdog = startWatchdog(mainWindow)
+    mainWindow.protocol("WM_DELETE_WINDOW", lambda: onClosing(mainWindow, watchdog))
     mainWindow.mainloop()
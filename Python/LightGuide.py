@@ -1,20 +1,35 @@
 # to compile to deployable executable use pyinstaller LightGuide.py
 import tkinter
-from tkinter.filedialog import askopenfilename
+from tkinter.filedialog import askopenfilenames, askopenfilename
 from tkinter import *
 import serial
-import pandas as pd
 from pandastable import Table, TableModel
+from maple_session import Session, defaultCore, LinkMonitor
+from worklist_io import readWorklist, askSheetName, parseVolume, CHERRYPICK_COLUMNS, WORKLIST_FILETYPES
+from worklist_watch import WorklistWatcher, reloadWorklist, rowHashes, WATCH_INTERVAL_MS
+from worklist_import import importWorklists
+from worklist_cache import readWorklistCached
+from worklist_import import FILE_COLUMN
+from volume_ledger import VolumeLedger, WARNING_COLOUR, NORMAL_COLOUR, FLUSH_MS
+from step_timing import StepTimer
+from stall_watchdog import startWatchdog
+from progress_overlay import ProgressOverlay
+from plate_layout import PLATE_DENSITIES, parseDensity
+import multiprocessing
 
-file = open("C:\PipettingLightGuide\config.txt","r")
-if file.mode == "r":
-    serialPorts = file.readlines()
-    COMportOne = serialPorts[0].strip('\n')
-    COMportTwo = serialPorts[1].strip('\n')
-    sourcePanelSerialConnection = serial.Serial(COMportOne, '9600', timeout=0, stopbits=serial.STOPBITS_TWO)
-    destinationPanelSerialConnection = serial.Serial(COMportTwo, '9600', timeout=0, stopbits=serial.STOPBITS_TWO)
-else:
-    print("Error reading serial ports config file.")
+# only called from the main process: worker processes used for importing worklists
+# re-import this script and must not grab the COM ports
+def openPanels(session):
+    file = open("C:\PipettingLightGuide\config.txt","r")
+    if file.mode == "r":
+        serialPorts = file.readlines()
+        COMportOne = serialPorts[0].strip('\n')
+        COMportTwo = serialPorts[1].strip('\n')
+        # goes through panel_daemon.py when it is running, so the panels are not reset on every launch
+        session.connect("source", COMportOne, 9600, serial.STOPBITS_TWO, wait_ack=False, inter_delay=0.001)
+        session.connect("destination", COMportTwo, 9600, serial.STOPBITS_TWO, wait_ack=False, inter_delay=0.001)
+    else:
+        print("Error reading serial ports config file.")
 
 def getRowNameFromWell(well):
     rowName = well[0:1]  # for row
@@ -24,54 +39,115 @@ def getColumnNumberFromWell(well):
     columnNumber = well[1:3]
     return columnNumber
 
-def sendSerialCommand(wellName,destination,barcode):
+# destination is the session's panel role: "source" or "destination"
+# rgb sets the LED colour on panels whose firmware reads it (older firmware ignores the extra fields)
+def sendSerialCommand(session,wellName,destination,barcode,rgb=None):
     rowName = getRowNameFromWell(wellName)
     columnNumber = getColumnNumberFromWell(wellName)
-    serialString = destination + " <" + rowName + "," + columnNumber + ",S," + barcode +">"
+    colour = "" if rgb is None else ",%d,%d,%d" % rgb
+    serialString = destination + " <" + rowName + "," + columnNumber + ",S," + barcode + colour + ">"
     serialString = bytes(serialString, 'us-ascii')
-    print(serialString)
-    if destination=="source":
-        sourcePanelSerialConnection.write(serialString)
-    else:
-        destinationPanelSerialConnection.write(serialString)
+    session.send([serialString], destination)
 
-def turnPanelsOff():
+def turnPanelsOff(session):
     serialString = "<A,1,X,>"
     serialString = bytes(serialString, 'us-ascii')
-    print(serialString)
-    sourcePanelSerialConnection.write(serialString)
-    destinationPanelSerialConnection.write(serialString)
+    session.send([serialString], "source")
+    session.send([serialString], "destination")
 
 def parseCommands(self):
 
     # update the row currently highlighted in the pandastable
-    pt.setSelectedRow(self.currentCsvPosition)
-    #pt.setRowColors(rows=self.currentCsvPosition, clr="#95D680", cols='all')
-    pt.redraw()
+    self.pt.setSelectedRow(self.session.currentCsvPosition)
+    #self.pt.setRowColors(rows=self.session.currentCsvPosition, clr="#95D680", cols='all')
+    self.pt.redraw()
 
     # get the current source and destination wells, then send them to the sendSerialCommand for LEDs to be lit
-    sourceWellName = self.csvData.at[self.currentCsvPosition, 'Source_well']
-    destinationWellName = self.csvData.at[self.currentCsvPosition, 'Destination_well']
-    sourceBarcode = self.csvData.at[self.currentCsvPosition,'Source_barcode']
-    destinationBarcode = self.csvData.at[self.currentCsvPosition,'Destination_barcode']
-    sendSerialCommand(sourceWellName, "source",sourceBarcode)
-    sendSerialCommand(destinationWellName, "destination",destinationBarcode)
-
-def onClosing():
-    turnPanelsOff()
-    sourcePanelSerialConnection.close()
-    destinationPanelSerialConnection.close()
+    sourceWellName = self.session.csvData.at[self.session.currentCsvPosition, 'Source_well']
+    destinationWellName = self.session.csvData.at[self.session.currentCsvPosition, 'Destination_well']
+    sourceBarcode = self.session.csvData.at[self.session.currentCsvPosition,'Source_barcode']
+    destinationBarcode = self.session.csvData.at[self.session.currentCsvPosition,'Destination_barcode']
+    sendSerialCommand(self.session, sourceWellName, "source",sourceBarcode, sourceWellColour(self))
+    if self.showProgress.get():
+        # completed destination wells stay dimly lit; only the wells that change are sent
+        self.session.send(self.overlay.show(self.session.currentCsvPosition), "destination")
+    else:
+        sendSerialCommand(self.session, destinationWellName, "destination",destinationBarcode)
+
+# volume in uL of a worklist row, None when it cannot be read
+def rowVolume(self, row):
+    try:
+        return parseVolume(self.session.csvData.at[row, 'Transfer_volume'])
+    except ValueError:
+        return None
+
+# warning colour when the current transfer would leave the source well below the ledger threshold;
+# once a warning was shown every source well gets an explicit colour, as the panel keeps the last one
+def sourceWellColour(self):
+    row = self.session.currentCsvPosition
+    volume = rowVolume(self, row)
+    if volume is None:
+        return NORMAL_COLOUR if self.coloursSent else None
+    barcode = self.session.csvData.at[row, 'Source_barcode']
+    well = self.session.csvData.at[row, 'Source_well']
+    if self.ledger.isLow(barcode, well, volume, row):
+        print("Low volume: %s %s would have %.1f uL left" % (barcode, well, self.ledger.projected(barcode, well, volume, row)))
+        self.coloursSent = True
+        return WARNING_COLOUR
+    return NORMAL_COLOUR if self.coloursSent else None
+
+# completed-wells bitsets of the destination plates, rebuilt when a worklist is shown or reloaded
+def loadOverlay(self):
+    data = self.session.csvData
+    self.overlay.load(data['Destination_barcode'], data['Destination_well'], self.session.completedRows)
+
+# plates of a row for the step timer: when they change between steps it counts as a plate swap
+def rowPlates(self, row):
+    return self.session.csvData.at[row, 'Source_barcode'] + ">" + self.session.csvData.at[row, 'Destination_barcode']
+
+# time the move that was just made and show the rate and ETA; the run ends once every row is done
+def recordStep(self, forward):
+    row = self.session.currentCsvPosition
+    self.timer.step(row, rowPlates(self, row), forward)
+    remaining = self.session.csvRecordCount - len(self.session.completedRows)
+    self.throughputText.set(self.timer.statusText(remaining))
+    if remaining == 0:
+        self.timer.finish()
+
+def onClosing(gui, watchdog=None):
+    gui.linkMonitor.stop()
+    turnPanelsOff(gui.session)
+    gui.timer.finish()
+    gui.ledger.close()
+    # sends what is still queued before the ports are closed
+    gui.session.close()
+    defaultCore.shutdown()
     print("Closing serial ports!")
-    mainWindow.destroy()
+    if watchdog:
+        watchdog.stop()
+    gui.master.destroy()
     exit()
 
 class lightPanelGUI(Frame):
 
-    def __init__(self,master):
-        self.csvData = pd.DataFrame()
-        self.currentCsvPosition=0
-        self.csvRecordCount=0
+    def __init__(self,master,session=None):
+        # worklist, position and panels live on the session instead of module globals
+        self.session = session or Session()
+        self.pt = None
+        self.center = None
+        self.worklistWatcher=None
+        self.watchingWorklist=False
         self.scrollCount=1
+        # source-well volumes, deducted on every completed row
+        self.ledger = VolumeLedger()
+        self.coloursSent = False
+        # dwell time of every step, transfers/min and ETA
+        self.timer = StepTimer()
+        self.throughputText = StringVar()
+        # completed wells on the destination panel (needs the Gen2_96 firmware)
+        self.overlay = ProgressOverlay()
+        self.showProgress = BooleanVar(value=False)
+        self.destinationDensity = StringVar(value="96 well")
 
         self.master = master
         self.master.title("Microplate Assistive Pipetting Light Emitter")
@@ -91,45 +167,188 @@ class lightPanelGUI(Frame):
 
         # create the widgets for the top frame
         self.fileButton = tkinter.Button(top_frame, text="Select cherrypick file", command=self.openFile)
+        self.volumesButton = tkinter.Button(top_frame, text="Source volumes", command=self.loadVolumes)
         self.backButton = tkinter.Button(top_frame, text="Previous well", command=self.previousWell)
         self.nextButton = tkinter.Button(top_frame, text="Next well", command=self.nextWell)
 
         # layout the widgets in the top frame
         self.fileButton.grid(row=0, column=1)
+        self.volumesButton.grid(row=0, column=2)
         top_frame.grid_columnconfigure(2,weight=3)
         self.backButton.grid(row=0, column=3)
         self.nextButton.grid(row=0, column=4)
+        Label(top_frame, textvariable=self.throughputText, bg='grey').grid(row=1, column=1, columnspan=3, sticky="w")
+        Checkbutton(top_frame, text="Show progress", variable=self.showProgress, command=self.toggleProgress,
+                    bg='grey').grid(row=1, column=4)
+        # the destination plate the overlay draws (wells are indexed on this plate, not guessed from the worklist)
+        OptionMenu(top_frame, self.destinationDensity, *["%d well" % d for d in PLATE_DENSITIES],
+                   command=lambda _v: self.changeDestinationDensity()).grid(row=2, column=4)
+        self.master.after(FLUSH_MS, self.flushLedger)
+        # a panel that cannot keep up is shown in the status line; once it catches up the current well is sent again
+        self.linkMonitor = LinkMonitor(self.master, self.session, self.throughputText.set, self.resendPanels).start()
 
+    # starting volumes: Barcode, Well, Volume (a blank well sets the whole plate)
+    def loadVolumes(self):
+        fileName = askopenfilename(filetypes=WORKLIST_FILETYPES)
+        if not fileName:
+            return
+        try:
+            count = self.ledger.importVolumes(fileName)
+        except (ValueError, ImportError) as e:
+            print("Could not read source volumes: " + str(e))
+            return
+        print("Loaded %d source volume(s)" % count)
+        if self.pt is not None and self.session.csvRecordCount:
+            parseCommands(self)
+
+    # switching the overlay on draws the plate's completed wells, switching it off goes back to one well
+    def toggleProgress(self):
+        self.overlay.redraw()
+        if self.pt is None or not self.session.csvRecordCount:
+            return
+        if not self.showProgress.get():
+            self.session.send([bytes("<A,1,X,>", 'us-ascii')], "destination")
+        parseCommands(self)
+
+    def changeDestinationDensity(self):
+        self.overlay = ProgressOverlay(parseDensity(self.destinationDensity.get()))
+        if self.pt is not None:
+            loadOverlay(self)
+            if self.showProgress.get() and self.session.csvRecordCount:
+                parseCommands(self)
+
+    def resendPanels(self):
+        self.overlay.redraw()
+        if self.pt is not None and self.session.csvRecordCount:
+            parseCommands(self)
+
+    def flushLedger(self):
+        self.ledger.flush()
+        self.master.after(FLUSH_MS, self.flushLedger)
 
     def nextWell(self):
         # set the current row to have a grey background to indicate work on this record is complete
-        pt.setRowColors(rows=self.currentCsvPosition,clr="#D3D3D3",cols='all')
-        pt.redraw()
+        self.pt.setRowColors(rows=self.session.currentCsvPosition,clr="#D3D3D3",cols='all')
+        self.session.completedRows.add(self.session.currentCsvPosition)
+        self.overlay.complete(self.session.currentCsvPosition)
+        volume = rowVolume(self, self.session.currentCsvPosition)
+        if volume is not None:
+            self.ledger.deduct(self.session.currentCsvPosition,
+                               self.session.csvData.at[self.session.currentCsvPosition, 'Source_barcode'],
+                               self.session.csvData.at[self.session.currentCsvPosition, 'Source_well'], volume)
+        self.pt.redraw()
         # check to see how many times the next button has been clicked and scroll the table every two clicks
-        if self.currentCsvPosition < self.csvRecordCount - 1:
-            self.currentCsvPosition=self.currentCsvPosition+1
+        if self.session.currentCsvPosition < self.session.csvRecordCount - 1:
+            self.session.currentCsvPosition=self.session.currentCsvPosition+1
         parseCommands(self)
+        recordStep(self, True)
 
     def previousWell(self):
-        if self.currentCsvPosition > 0:
-            self.currentCsvPosition = self.currentCsvPosition - 1
+        if self.session.currentCsvPosition > 0:
+            self.session.currentCsvPosition = self.session.currentCsvPosition - 1
         parseCommands(self)
+        recordStep(self, False)
 
     def openFile(self):
-        global pt
-        self.fileName = askopenfilename()  # show an open file dialog box and return the path to the selected file
-        self.csvData = pd.read_csv(self.fileName,names=['Source_barcode','Destination_barcode','Source_well','Destination_well','Transfer_volume'],header=0)
-        self.csvRecordCount=len(self.csvData.index)
-        self.currentCsvPosition=0;
-        center = Frame(self.master, bg='gray2', width=450, height=500, pady=3)
-        center.grid(row=1, sticky="nsew")
-        pt = Table(center, dataframe=self.csvData, showtoolbar=False, showstatusbar=False, height=450)
-        pt.adjustColumnWidths(30)
-        pt.show()
+        fileNames = askopenfilenames(filetypes=WORKLIST_FILETYPES)  # show an open file dialog box and return the paths to the selected files
+        if not fileNames:
+            return
+        # several files (e.g. one per source plate) are read in parallel and merged with their file name and row
+        if len(fileNames) > 1:
+            importWorklists(self.master, fileNames, CHERRYPICK_COLUMNS, self.worklistsLoaded)
+            return
+        fileName = fileNames[0]
+        # CSV or Excel/ODS worklist; vendor headers are mapped onto our column names
+        sheet = askSheetName(self.master, fileName)
+        if sheet == '':
+            return
+        self.showWorklist(readWorklistCached(fileName, CHERRYPICK_COLUMNS, sheet=sheet), fileName, sheet)
+        self.watchWorklist(fileName)
+
+    def worklistsLoaded(self, data, problems):
+        for problem in problems:
+            print(problem)
+        if len(data.index) == 0:
+            print("No worklist rows loaded.")
+            return
+        self.showWorklist(data)
+        # merged worklists are not reloaded from disk
+        self.watchWorklist(None)
+
+    def showWorklist(self, data, fileName=None, sheet=None):
+        # the timings of the previous worklist are written before it is replaced
+        self.timer.finish()
+        self.session.load_worklist(data, fileName, sheet, rowHashes(data))
+        loadOverlay(self)
+        # deductions are remembered per worklist, so rows done before a restart are not counted twice
+        if fileName:
+            self.ledger.startRun(fileName, self.session.csvHashes)
+        else:
+            self.ledger.startRun("merged:" + ",".join(data[FILE_COLUMN].unique()), self.session.csvHashes)
+        # the previous table and its frame are destroyed, not stacked under the new one
+        if self.center is not None:
+            self.center.destroy()
+        self.center = Frame(self.master, bg='gray2', width=450, height=500, pady=3)
+        self.center.grid(row=1, sticky="nsew")
+        self.pt = Table(self.center, dataframe=self.session.csvData, showtoolbar=False, showstatusbar=False, height=450)
+        self.pt.adjustColumnWidths(30)
+        self.pt.show()
         parseCommands(self)
+        if self.session.csvRecordCount:
+            self.timer.startRun(fileName or "merged", 0, rowPlates(self, 0))
+
+    # reload the worklist when it is saved again, keeping the current row and the completed rows
+    def watchWorklist(self, path):
+        self.worklistWatcher = WorklistWatcher(path) if path else None
+        if not self.watchingWorklist:
+            self.watchingWorklist = True
+            self.master.after(WATCH_INTERVAL_MS, self.checkWorklist)
+
+    def checkWorklist(self):
+        self.master.after(WATCH_INTERVAL_MS, self.checkWorklist)
+        if self.worklistWatcher is None or not self.worklistWatcher.poll():
+            return
+        try:
+            newData = readWorklist(self.session.fileName, CHERRYPICK_COLUMNS, sheet=self.session.sheet)
+        except Exception as e:
+            print("Worklist reload failed, keeping the loaded one: " + str(e))
+            return
+        reload = reloadWorklist(newData, self.session.csvHashes, self.session.currentCsvPosition, self.session.completedRows)
+        if reload.diff.unchanged():
+            return
+        self.session.csvData = reload.frame
+        self.session.csvHashes = reload.hashes
+        self.session.csvRecordCount = len(self.session.csvData.index)
+        self.session.completedRows = reload.completed
+        self.ledger.setRows(reload.hashes)
+        loadOverlay(self)
+        moved = reload.position != self.session.currentCsvPosition
+        self.session.currentCsvPosition = reload.position
+        # swap the model under the existing table instead of building a new widget
+        self.pt.updateModel(TableModel(self.session.csvData))
+        self.pt.resetColors()
+        if self.session.completedRows:
+            self.pt.setRowColors(rows=sorted(self.session.completedRows), clr="#D3D3D3", cols='all')
+        print(reload.summary())
+        if self.session.csvRecordCount == 0:
+            self.pt.redraw()
+        elif reload.currentChanged or moved:
+            parseCommands(self)
+        else:
+            self.pt.setSelectedRow(self.session.currentCsvPosition)
+            self.pt.redraw()
+            # completed rows may have moved to other wells: the overlay draws the plate again
+            if self.showProgress.get():
+                self.session.send(self.overlay.show(self.session.currentCsvPosition), "destination")
 
 if __name__ == '__main__':
+    # needed by the worklist import workers when running as a pyinstaller executable
+    multiprocessing.freeze_support()
     mainWindow = tkinter.Tk()
     lightPanelGUIinstance = lightPanelGUI(mainWindow)
-    mainWindow.protocol("WM_DELETE_WINDOW", onClosing)
+    openPanels(lightPanelGUIinstance.session)
+    # MAPLE_WATCHDOG=1 logs handlers that block the window (stall_watchdog); onClosing stops it
+    # because exit() there means mainloop() never returns
+    watchdog = startWatchdog(mainWindow)
+    mainWindow.protocol("WM_DELETE_WINDOW", lambda: onClosing(lightPanelGUIinstance, watchdog))
     mainWindow.mainloop()
\ No newline at end of file
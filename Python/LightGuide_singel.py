@@ -1,46 +1,25 @@
 # to compile to deployable executable use pyinstaller LightGuide.py
 import tkinter
-from tkinter.filedialog import askopenfilename
+from tkinter.filedialog import askopenfilenames
 from tkinter import Frame, Label, Button, OptionMenu, StringVar, Canvas
 import serial
 import serial.tools.list_ports
-import pandas as pd
-import time
 from pandastable import Table, TableModel
+from maple_session import Session, defaultCore, LinkMonitor
+from worklist_io import readWorklist, askSheetName, SINGLE_PLATE_COLUMNS, WORKLIST_FILETYPES
+from worklist_watch import WorklistWatcher, reloadWorklist, rowHashes, WATCH_INTERVAL_MS
+from worklist_import import importWorklists
+from worklist_cache import readWorklistCached
+from step_timing import StepTimer
+from stall_watchdog import startWatchdog
+from step_program import StepStreamer, compileWells, stepProgramEnabled, POLL_MS
+import multiprocessing
 
 def get_available_ports():
     """取得所有可用的 COM ports"""
     ports = serial.tools.list_ports.comports()
     return [port.device for port in ports]
 
-class SerialConnection:
-    def __init__(self):
-        self.connection = None
-    
-    def connect(self, port):
-        """連接指定的 COM port"""
-        try:
-            if self.connection:
-                self.connection.close()
-            self.connection = serial.Serial(port, 500000, timeout=0, stopbits=serial.STOPBITS_TWO)
-            return True
-        except Exception as e:
-            print(f"連接失敗: {str(e)}")
-            return False
-    
-    def write(self, data):
-        """寫入資料到串口"""
-        if self.connection and self.connection.is_open:
-            self.connection.write(data)
-    
-    def close(self):
-        """關閉串口連接"""
-        if self.connection:
-            self.connection.close()
-
-# 建立全域串口連接物件
-serial_connection = SerialConnection()
-
 def getRowNameFromWell(well):
     rowName = well[0:1]  # for row
     return rowName
@@ -49,50 +28,75 @@ def getColumnNumberFromWell(well):
     columnNumber = well[1:3]
     return columnNumber
 
-def sendSerialCommand(wellName, barcode):
+def sendSerialCommand(session, wellName, barcode):
     rowName = getRowNameFromWell(wellName)
     columnNumber = getColumnNumberFromWell(wellName)
     serialString = "<" + rowName + "," + columnNumber + ",S," + barcode +">"
     serialString = bytes(serialString, 'us-ascii')
-    print(serialString)
-    serial_connection.write(serialString)
+    session.send([serialString])
 
-def turnPanelOff():
+def turnPanelOff(session):
     serialString = "<A,1,X,empty>"
     serialString = bytes(serialString, 'us-ascii')
-    print(serialString)
-    serial_connection.write(serialString)
-    time.sleep(1)  # 等待一段時間以確保命令被處理
+    session.send([serialString])
+    session.drain()  # 等佇列送完以確保命令被處理
     
-def blankPanel():
+def blankPanel(session):
     serialString = "<A,1,X, >"
     serialString = bytes(serialString, 'us-ascii')
-    print(serialString)
-    serial_connection.write(serialString)
+    session.send([serialString])
 
 def parseCommands(self):
     # update the row currently highlighted in the pandastable
-    pt.setSelectedRow(self.currentCsvPosition)
-    pt.redraw()
+    self.pt.setSelectedRow(self.session.currentCsvPosition)
+    self.pt.redraw()
 
     # 只需要處理一個孔位
-    wellName = self.csvData.at[self.currentCsvPosition, 'Well']
-    barcode = self.csvData.at[self.currentCsvPosition, 'Barcode']
-    blankPanel()
-    sendSerialCommand(wellName, barcode)
-
-def onClosing():
-    turnPanelOff()
-    serial_connection.close()
+    # 步驟程式已上傳到面板：只要移到這一步
+    if self.stepper is not None:
+        self.stepper.show(self.session.currentCsvPosition)
+        return
+    wellName = self.session.csvData.at[self.session.currentCsvPosition, 'Well']
+    barcode = self.session.csvData.at[self.session.currentCsvPosition, 'Barcode']
+    blankPanel(self.session)
+    sendSerialCommand(self.session, wellName, barcode)
+
+# 記錄剛剛這一步的時間，顯示速度與預計完成時間；全部孔位完成時輸出這次的紀錄
+def recordStep(self, forward):
+    row = self.session.currentCsvPosition
+    self.timer.step(row, self.session.csvData.at[row, 'Barcode'], forward)
+    remaining = self.session.csvRecordCount - len(self.session.completedRows)
+    self.throughputText.set(self.timer.statusText(remaining))
+    if remaining == 0:
+        self.timer.finish()
+
+# 關閉所有工作階段視窗，最後關 I/O 核心
+def onClosing(root, watchdog=None):
+    for gui in list(lightPanelGUI.open_windows):
+        gui.close()
+    defaultCore.shutdown()
     print("Closing serial port!")
-    mainWindow.destroy()
+    if watchdog:
+        watchdog.stop()
+    root.destroy()
     exit()
 
 class lightPanelGUI(Frame):
-    def __init__(self,master):
-        self.csvData = pd.DataFrame()
-        self.currentCsvPosition=0
-        self.csvRecordCount=0
+    # 目前開著的工作階段視窗
+    open_windows = []
+
+    def __init__(self,master,session=None):
+        # 工作清單、目前位置與面板連線都放在自己的工作階段裡
+        self.session = session or Session()
+        self.pt = None
+        self.worklistWatcher=None
+        self.watchingWorklist=False
+        # MAPLE_STEP_PROGRAM=1 時整份清單上傳成面板的步驟程式（step_program）
+        self.stepper = None
+        self.pollingSteps = False
+        # 每一步停留時間、每分鐘轉移數與預計完成時間
+        self.timer = StepTimer()
+        self.throughputText = StringVar()
 
         self.master = master
         self.master.title("Single Microplate Light Guide")
@@ -139,6 +143,9 @@ class lightPanelGUI(Frame):
         self.refresh_button.grid(row=0, column=2, padx=5)
         self.connect_button = Button(com_frame, text="連接", command=self.connect_port)
         self.connect_button.grid(row=0, column=3, padx=5)
+        # 再開一個工作階段視窗（同一個程式服務另一個實驗台）
+        self.new_window_button = Button(com_frame, text="新視窗", command=self.new_window)
+        self.new_window_button.grid(row=0, column=4, padx=5)
 
         # 建立其他控制元件
         self.fileButton = tkinter.Button(top_frame, text="選擇檔案", command=self.openFile)
@@ -150,6 +157,65 @@ class lightPanelGUI(Frame):
         top_frame.grid_columnconfigure(2,weight=3)
         self.backButton.grid(row=0, column=3)
         self.nextButton.grid(row=0, column=4)
+        Label(top_frame, textvariable=self.throughputText, bg='#f0f0f0').grid(row=1, column=1, columnspan=4, sticky="w")
+        # 面板跟不上（佇列滿、指令被丟掉）時顯示在狀態列，送完後重送目前孔位
+        self.linkMonitor = LinkMonitor(self.master, self.session, self.throughputText.set, self.resendPanel).start()
+        lightPanelGUI.open_windows.append(self)
+
+    def new_window(self):
+        window = tkinter.Toplevel(self.master)
+        gui = lightPanelGUI(window)
+        window.title(f"Single Microplate Light Guide - {gui.session.name}")
+        window.protocol("WM_DELETE_WINDOW", gui.close)
+
+    # 關閉這個工作階段：關面板、送完佇列後釋放埠
+    def close(self):
+        self.linkMonitor.stop()
+        self.stopStepProgram()
+        if self.session.connected():
+            turnPanelOff(self.session)
+        self.timer.finish()
+        self.session.close()
+        if self in lightPanelGUI.open_windows:
+            lightPanelGUI.open_windows.remove(self)
+        if isinstance(self.master, tkinter.Toplevel):
+            self.master.destroy()
+
+    def resendPanel(self):
+        if self.pt is not None and self.session.csvRecordCount:
+            # 上傳的步驟可能也被丟掉了：整段視窗重傳
+            if self.stepper is not None:
+                self.stepper.resync()
+            parseCommands(self)
+
+    # 清單或連線變了就重新編譯、上傳步驟程式；沒開 MAPLE_STEP_PROGRAM 或孔位超出 96 孔盤時照舊送 S 指令
+    def startStepProgram(self):
+        self.stopStepProgram()
+        if not (stepProgramEnabled() and self.session.connected() and self.session.csvRecordCount):
+            return
+        try:
+            steps = compileWells(self.session.csvData['Well'])
+        except ValueError as e:
+            print(f"不使用步驟程式: {str(e)}")
+            return
+        self.stepper = StepStreamer(self.session.link(), steps)
+        self.stepper.start(self.session.currentCsvPosition)
+        if not self.pollingSteps:
+            self.pollingSteps = True
+            self.master.after(POLL_MS, self.pollSteps)
+
+    def stopStepProgram(self):
+        if self.stepper is not None:
+            self.stepper.close()
+            self.stepper = None
+
+    # 比對面板回報的位置，不一致時 StepStreamer 自己重新同步
+    def pollSteps(self):
+        if self.stepper is None:
+            self.pollingSteps = False
+            return
+        self.stepper.poll()
+        self.master.after(POLL_MS, self.pollSteps)
 
     def refresh_ports(self):
         """重新整理可用的 COM ports"""
@@ -168,50 +234,127 @@ class lightPanelGUI(Frame):
     def connect_port(self):
         """連接選擇的 COM port"""
         selected_port = self.port_var.get()
-        if serial_connection.connect(selected_port):
+        # 有常駐服務（panel_daemon.py）就經由服務，板子不會因開埠重開機
+        if self.session.connect("panel", selected_port, 500000, serial.STOPBITS_TWO, wait_ack=False, inter_delay=0.001):
             print(f"成功連接到 {selected_port}")
             self.connect_button.config(text="已連接")
             self.connect_button.config(state='disabled')
             self.port_menu.config(state='disabled')
             self.backButton.config(state='active')
             self.nextButton.config(state='active')
+            if self.pt is not None:
+                self.startStepProgram()
         else:
             print(f"無法連接到 {selected_port}")
             self.connect_button.config(text="連接失敗")
 
     def nextWell(self):
-        pt.setRowColors(rows=self.currentCsvPosition,clr="#D3D3D3",cols='all')
-        pt.redraw()
-        if self.currentCsvPosition < self.csvRecordCount - 1:
-            self.currentCsvPosition=self.currentCsvPosition+1
+        self.pt.setRowColors(rows=self.session.currentCsvPosition,clr="#D3D3D3",cols='all')
+        self.session.completedRows.add(self.session.currentCsvPosition)
+        self.pt.redraw()
+        if self.session.currentCsvPosition < self.session.csvRecordCount - 1:
+            self.session.currentCsvPosition=self.session.currentCsvPosition+1
         parseCommands(self)
+        recordStep(self, True)
 
     def previousWell(self):
-        if self.currentCsvPosition > 0:
-            self.currentCsvPosition = self.currentCsvPosition - 1
+        if self.session.currentCsvPosition > 0:
+            self.session.currentCsvPosition = self.session.currentCsvPosition - 1
         parseCommands(self)
+        recordStep(self, False)
 
     def openFile(self):
-        global pt
-        self.fileName = askopenfilename()
-        # 修改CSV檔案格式，只需要Well和Barcode兩個欄位
-        self.csvData = pd.read_csv(self.fileName,names=['Barcode','Well','Transfer_volume'],header=0)
-        self.csvRecordCount=len(self.csvData.index)
-        self.currentCsvPosition=0
+        fileNames = askopenfilenames(filetypes=WORKLIST_FILETYPES)
+        if not fileNames:
+            return
+        # 一次選多個檔案：各檔在不同行程平行讀取，合併成一份（附來源檔名與列號）
+        if len(fileNames) > 1:
+            importWorklists(self.master, fileNames, SINGLE_PLATE_COLUMNS, self.worklistsLoaded)
+            return
+        fileName = fileNames[0]
+        # CSV 或 Excel/ODS 檔案，只需要Well和Barcode兩個欄位；多個工作表時讓使用者選擇
+        sheet = askSheetName(self.master, fileName)
+        if sheet == '':
+            return
+        self.showWorklist(readWorklistCached(fileName, SINGLE_PLATE_COLUMNS, sheet=sheet), fileName, sheet)
+        self.watchWorklist(fileName)
+
+    # 多檔匯入完成
+    def worklistsLoaded(self, data, problems):
+        for problem in problems:
+            print(problem)
+        if len(data.index) == 0:
+            print("沒有可用的資料")
+            return
+        self.showWorklist(data)
+        # 合併的清單不自動重新載入
+        self.watchWorklist(None)
+
+    def showWorklist(self, data, fileName=None, sheet=None):
+        # 換清單前先輸出上一份的時間紀錄
+        self.timer.finish()
+        self.session.load_worklist(data, fileName, sheet, rowHashes(data))
 
         # 如果已經存在表格，先移除
         for widget in self.center_frame.winfo_children():
             widget.destroy()
 
         # 在中央框架中建立新表格
-        pt = Table(self.center_frame, dataframe=self.csvData, 
+        self.pt = Table(self.center_frame, dataframe=self.session.csvData, 
                   showtoolbar=False, showstatusbar=False, height=450)
-        pt.adjustColumnWidths(30)
-        pt.show()
+        self.pt.adjustColumnWidths(30)
+        self.pt.show()
+        self.startStepProgram()
         parseCommands(self)
+        if self.session.csvRecordCount:
+            self.timer.startRun(fileName or "merged", 0, self.session.csvData.at[0, 'Barcode'])
+
+    # 檔案再次存檔時自動重新載入，保留目前位置與已完成的列
+    def watchWorklist(self, path):
+        self.worklistWatcher = WorklistWatcher(path) if path else None
+        if not self.watchingWorklist:
+            self.watchingWorklist = True
+            self.master.after(WATCH_INTERVAL_MS, self.checkWorklist)
+
+    def checkWorklist(self):
+        self.master.after(WATCH_INTERVAL_MS, self.checkWorklist)
+        if self.worklistWatcher is None or not self.worklistWatcher.poll():
+            return
+        try:
+            newData = readWorklist(self.session.fileName, SINGLE_PLATE_COLUMNS, sheet=self.session.sheet)
+        except Exception as e:
+            print(f"重新載入失敗，保留目前的工作清單: {str(e)}")
+            return
+        reload = reloadWorklist(newData, self.session.csvHashes, self.session.currentCsvPosition, self.session.completedRows)
+        if reload.diff.unchanged():
+            return
+        self.session.csvData = reload.frame
+        self.session.csvHashes = reload.hashes
+        self.session.csvRecordCount = len(self.session.csvData.index)
+        self.session.completedRows = reload.completed
+        moved = reload.position != self.session.currentCsvPosition
+        self.session.currentCsvPosition = reload.position
+        # 沿用原本的表格，只換資料模型
+        self.pt.updateModel(TableModel(self.session.csvData))
+        self.pt.resetColors()
+        if self.session.completedRows:
+            self.pt.setRowColors(rows=sorted(self.session.completedRows), clr="#D3D3D3", cols='all')
+        print(reload.summary())
+        self.startStepProgram()
+        if self.session.csvRecordCount == 0:
+            self.pt.redraw()
+        elif reload.currentChanged or moved:
+            parseCommands(self)
+        else:
+            self.pt.setSelectedRow(self.session.currentCsvPosition)
+            self.pt.redraw()
 
 if __name__ == '__main__':
+    # 打包成執行檔時，匯入用的子行程需要
+    multiprocessing.freeze_support()
     mainWindow = tkinter.Tk()
-    lightPanelGUIinstance = lightPanelGUI(mainWindow)
-    mainWindow.protocol("WM_DELETE_WINDOW", onClosing)
+    lightPanelGUI(mainWindow)
+    # MAPLE_WATCHDOG=1 時記錄卡住視窗的事件處理（stall_watchdog）；由 onClosing 停掉
+    watchdog = startWatchdog(mainWindow)
+    mainWindow.protocol("WM_DELETE_WINDOW", lambda: onClosing(mainWindow, watchdog))
     mainWindow.mainloop()
\ No newline at end of file
@@ -2,20 +2,30 @@
 import tkinter
 from tkinter import *
 import serial
-import string
-import time
+import multiprocessing
+from dilution_plan import DilutionPlan, encodeDilutionCommand
+from plate_layout import PLATE_DENSITIES, parseDensity
+from plate_mirror import PlateMirror
+from maple_session import Session, defaultCore, LinkMonitor
+from step_timing import StepTimer
+from stall_watchdog import startWatchdog
 
-alphabet = list(string.ascii_uppercase)
 last_received = ''
 
-file = open("C:\PipettingLightGuide\config.txt","r")
-if file.mode == "r":
-    serialPorts = file.readlines()
-    COMportOne = serialPorts[0].strip('\n')
-    sourcePanelSerialConnection = serial.Serial(COMportOne, '500000', timeout=0, stopbits=serial.STOPBITS_ONE)
-
-else:
-    print("Error reading serial ports config file.")
+# the panel link lives on the session; its sender measures how long the Gen2 firmware
+# needs per frame (loop() delay included) when it connects and paces the frames to that
+# without blocking the Tk thread; .15 s is only used if the panel never answers
+# the calibration. It also reads the firmware chatter into a device log and reports
+# <ERR:...> replies
+def openPanels(session):
+    file = open("C:\PipettingLightGuide\config.txt","r")
+    if file.mode == "r":
+        serialPorts = file.readlines()
+        COMportOne = serialPorts[0].strip('\n')
+        # goes through panel_daemon.py when it is running, so the panel is not reset on every launch
+        session.connect("source", COMportOne, 500000, serial.STOPBITS_ONE, wait_ack=False, inter_delay=.15)
+    else:
+        print("Error reading serial ports config file.")
 
 def getRowNameFromWell(well):
     rowName = well[0:1]  # for row
@@ -25,107 +35,62 @@ def getColumnNumberFromWell(well):
     columnNumber = well[1:3]
     return columnNumber
 
-# read data from serial port
-def readSerial():
-    dataFromSerial = sourcePanelSerialConnection.read(2000)
-    #print(dataFromSerial)
-
-def sendSerialCommand(value,command):
-
-    #rowName = getRowNameFromWell(wellName)
-    #columnNumber = getColumnNumberFromWell(wellName)
-    serialString = "<" + value + "," +  value + "," + command + ",Titration>\r\n"
-    serialString = bytes(serialString, 'us-ascii')
-    print(serialString)
-    #if destination=="source":
-    sourcePanelSerialConnection.write(serialString)
-    time.sleep(.15)
+def sendSerialCommand(session,value,command):
+    sendSerialFrame(session, encodeDilutionCommand(value, command))
 
-    readSerial()
+# send an already encoded frame, e.g. one precompiled by DilutionPlan
+def sendSerialFrame(session,serialString):
+    session.send([serialString], "source")
 
-def turnPanelsOff():
+def turnPanelsOff(session):
     serialString = "<A,1,X,>"
     serialString = bytes(serialString, 'us-ascii')
-    print(serialString)
-    sourcePanelSerialConnection.write(serialString)
+    session.send([serialString], "source")
 
 def parseCommands(self):
 
-    # send the command to clear existing LEDs
-    sendSerialCommand("1", "X")
-
-    startValueList = self.startValues.get().split(',')
-    #print(startValueList)
-    rowMaskList = self.maskValues.get().split('-')
-    #print(rowMaskList)
-    #print(self.titrationMode.get())
-
-    if(self.titrationMode.get()=="By column"):
-        sendCommand="C"
-        startMaskValue = alphabet.index(rowMaskList[0])
-        endMaskValue = alphabet.index(rowMaskList[1])
-    else:
-        sendCommand="R"
-        startMaskValue = int(rowMaskList[0])
-        endMaskValue = int(rowMaskList[1])
-
-    for value in startValueList:
-        if(self.titrationMode.get()=="By column"):
-            sendSerialCommand(value,sendCommand)
-        else:
-            sendSerialCommand(value, sendCommand)
-
-    # define the upper bound for the mask
-    selectedDensity = self.plateDensitySelection.get()
-    selectedTitrationMode = self.titrationMode.get()
-    if (selectedDensity == "96 well"):
-        if (selectedTitrationMode == "By column"):
-            upperMaskBoundary = 8
-            lowerMaskBoundary = 0
-        else:
-            upperMaskBoundary = 12
-            lowerMaskBoundary = 1
-    else:
-        if (selectedTitrationMode == "By column"):
-            upperMaskBoundary = 16
-            lowerMaskBoundary = 0
-        else:
-            upperMaskBoundary = 25
-            lowerMaskBoundary = 1
-
-
-    for z in range(lowerMaskBoundary, upperMaskBoundary):
-        if(self.titrationMode.get()=="By column"):
-            letterValue = alphabet[z]
-            if(z < startMaskValue):
-                sendSerialCommand(letterValue,"CR")
-            if (z > endMaskValue):
-                sendSerialCommand(letterValue, "CR")
-        else:
-            if (z < startMaskValue):
-                sendSerialCommand(str(z), "CC")
-            if (z > endMaskValue):
-                sendSerialCommand(str(z), "CC")
-
-    # send the command to toggle LEDs on for previous LED instructions sent
-    sendSerialCommand(value, "U")
-
-
-def onClosing():
-    turnPanelsOff()
-    # sourcePanelSerialConnection.close()
+    # look up the precompiled frames for the current step; the plan is only
+    # rebuilt when the parameters (or the start values typed by the user) change
+    try:
+        plan = self.currentPlan()
+    except ValueError as e:
+        print("Invalid titration parameters: " + str(e))
+        return
+    step = plan.step(self.stepIndex)
+    self.startValues.set(step.startText)
+    for serialString in step.frames:
+        sendSerialFrame(self.session, serialString)
+
+
+# time the move that was just made and show the rate and ETA; `finished` ends the run
+def recordStep(self, forward, finished=False):
+    self.timer.step(self.stepIndex, '', forward)
+    remaining = 0 if finished else len(self.plan) - self.stepIndex
+    self.throughputText.set(self.timer.statusText(remaining))
+    if finished:
+        self.timer.finish()
+
+def onClosing(gui, watchdog=None):
+    gui.linkMonitor.stop()
+    turnPanelsOff(gui.session)
+    gui.timer.finish()
+    gui.session.close()
+    defaultCore.shutdown()
     print("Closing serial ports!")
-    mainWindow.destroy()
+    if watchdog:
+        watchdog.stop()
+    gui.master.destroy()
     exit()
 
 class lightPanelGUI(Frame):
 
-    def __init__(self,master):
+    def __init__(self,master,session=None):
 
+        self.session = session or Session()
         self.master = master
         self.master.title("Microplate Assistive Pipetting Light Emitter")
-        self.master.maxsize(425,300)
-        self.master.minsize(425,300)
+        self.master.maxsize(425,320)
+        self.master.minsize(425,320)
 
         c = Canvas(self.master)
         c.configure(yscrollincrement='10c')
@@ -144,7 +109,16 @@ class lightPanelGUI(Frame):
         self.maskValues = StringVar()
         self.maskValues.set("A-P")
         self.plateDensitySelection.set('384 well')
-        self.plateDensityOptions = {'384 well', '96 well'}
+        self.plateDensityOptions = ['96 well', '384 well', '1536 well']
+        self.replicateCount = IntVar(value=1)
+        self.plan = None
+        self.planKey = None
+        self.stepIndex = 0
+        self.mirrorWindow = None
+        self.mirror = None
+        # dwell time of every step, steps/min and ETA; a new plan starts a new run
+        self.timer = StepTimer()
+        self.throughputText = tkinter.StringVar()
         self.nextButtonText = tkinter.StringVar(value="Next column")
         self.previousButtonText = tkinter.StringVar(value="Previous column")
         self.startValuesText=tkinter.StringVar(value="Start column(s)")
@@ -156,8 +130,9 @@ class lightPanelGUI(Frame):
         self.backButton = tkinter.Button(self.master, textvariable=self.previousButtonText, command=self.previousSelection)
         self.nextButton = tkinter.Button(self.master, textvariable=self.nextButtonText, command=self.nextSelection)
         self.plateDensityDropdown = tkinter.OptionMenu(self.master, self.plateDensitySelection, *self.plateDensityOptions, command=self.updateParameters)
-        self.startValuesEntry = tkinter.Entry(self.master, textvariable=self.startValues, width=4)
-        self.maskEntry = tkinter.Entry(self.master, textvariable=self.maskValues, width=4)
+        self.startValuesEntry = tkinter.Entry(self.master, textvariable=self.startValues, width=12)
+        self.maskEntry = tkinter.Entry(self.master, textvariable=self.maskValues, width=12)
+        self.replicateSpinbox = tkinter.Spinbox(self.master, from_=1, to=8, width=4, textvariable=self.replicateCount, command=self.updateReplicates)
 
 
         Label(self.master, text="Titration Mode", font="Helvetica 18 bold").grid(row=0, column=0, sticky=W, padx=20, pady=0)
@@ -165,17 +140,51 @@ class lightPanelGUI(Frame):
         self.titrationModeRow.grid(row=2, column=0, sticky=W, padx=30, pady=0)
         self.nextButton.grid(row=1, column=3, padx=(0, 10), pady=0)
         self.backButton.grid(row=1, column=4, padx=(0,10), pady=0)
+        tkinter.Button(self.master, text="Panel mirror", command=self.showMirror).grid(row=2, column=3, columnspan=2, padx=(0,10), pady=0)
         Label(self.master, text="Plate Density", font="Helvetica 18 bold").grid(row=3, column=0, sticky=W, padx=20, pady=(10,0))
         self.plateDensityDropdown.grid(row=4, column=0, sticky=W, padx=30, pady=0)
         Label(self.master, textvariable=self.startValuesText, font="Helvetica 18 bold").grid(row=5, column=0, sticky=W, padx=20, pady=(10,0))
         self.startValuesEntry.grid(row=6, column=0, sticky=W, padx=30, pady=0)
         Label(self.master, textvariable=self.maskText, font="Helvetica 18 bold").grid(row=7, column=0, sticky=W, padx=20, pady=(10,0))
         self.maskEntry.grid(row=8, column=0, sticky=W, padx=30, pady=(0,10))
+        Label(self.master, text="Replicates", font="Helvetica 18 bold").grid(row=5, column=3, columnspan=2, sticky=W, padx=0, pady=(10,0))
+        self.replicateSpinbox.grid(row=6, column=3, sticky=W, padx=0, pady=0)
+        Label(self.master, textvariable=self.throughputText).grid(row=9, column=0, columnspan=5, sticky=W, padx=20, pady=0)
 
-        time.sleep(2)
-        readSerial()
+        # opening the port resets the board; the sender waits for it to boot and calibrates
+        # before it writes anything queued here
+        openPanels(self.session)
         # send the initial command to light up the panel with the default parameters
         parseCommands(self)
+        # a panel that cannot keep up is shown in the status line; once it catches up the step is sent again
+        self.linkMonitor = LinkMonitor(self.master, self.session, self.throughputText.set, lambda: parseCommands(self)).start()
+
+    # a separate window drawing the panel from the frames the sender actually wrote;
+    # frames sent before it was opened are not shown until the next step redraws the plate
+    def showMirror(self):
+        if self.mirrorWindow is not None:
+            self.mirrorWindow.lift()
+            return
+        self.mirrorWindow = Toplevel(self.master)
+        self.mirrorWindow.title("Panel mirror")
+        self.mirrorWindow.protocol("WM_DELETE_WINDOW", self.closeMirror)
+        self.buildMirror()
+
+    def buildMirror(self):
+        if self.mirror is not None:
+            self.mirror.destroy()
+        rows, columns = PLATE_DENSITIES[parseDensity(self.plateDensitySelection.get())]
+        self.mirror = PlateMirror(self.mirrorWindow, rows, columns)
+        self.mirror.pack(padx=4, pady=4)
+        link = self.session.link("source")
+        if link is not None:
+            self.mirror.attach(link.sender)
+
+    def closeMirror(self):
+        self.mirror.destroy()
+        self.mirrorWindow.destroy()
+        self.mirror = None
+        self.mirrorWindow = None
 
     def columnSelection(self):
         self.nextButtonText.set("Next column")
@@ -191,6 +200,20 @@ class lightPanelGUI(Frame):
         self.maskText.set("Column mask")
         self.updateParameters(self)
 
+    # compile (or reuse) the plan for the parameters currently shown in the GUI
+    def currentPlan(self):
+        key = (self.plateDensitySelection.get(), self.titrationMode.get(), self.maskValues.get(), self.replicateCount.get())
+        if self.plan is None or key != self.planKey or self.startValues.get() != self.plan.step(self.stepIndex).startText:
+            self.plan = DilutionPlan(parseDensity(key[0]), key[1] == "By column", self.startValues.get(), key[2], key[3])
+            self.planKey = key
+            self.stepIndex = self.plan.startIndex
+            self.timer.finish()
+            self.timer.startRun("dilution-%d" % parseDensity(key[0]), self.stepIndex)
+        return self.plan
+
+    def updateReplicates(self):
+        parseCommands(self)
+
     def updateParameters(self, parameters):
         selectedDensity = self.plateDensitySelection.get()
         selectedTitrationMode = self.titrationMode.get()
@@ -201,6 +224,13 @@ class lightPanelGUI(Frame):
             else:
                 self.startValues.set("B,E")
                 self.maskValues.set("1-12")
+        elif(selectedDensity == "1536 well"):
+            if(selectedTitrationMode == "By column"):
+                self.startValues.set("5,29")
+                self.maskValues.set("A-AF")
+            else:
+                self.startValues.set("C,Q")
+                self.maskValues.set("1-48")
         else:
             if (selectedTitrationMode == "By column"):
                 self.startValues.set("3,13")
@@ -209,52 +239,40 @@ class lightPanelGUI(Frame):
                 self.startValues.set("C,F")
                 self.maskValues.set("1-24")
 
+        if self.mirror is not None and self.mirror.model.rows * self.mirror.model.columns != parseDensity(selectedDensity):
+            self.buildMirror()
         parseCommands(self)
 
     def nextSelection(self):
-        startValueList = self.startValues.get().split(',')
-        selectedDensity = self.plateDensitySelection.get()
-        if(selectedDensity == '384 well'):
-            upperColumnLimit=24
-            upperRowLimit=15
-        else:
-            upperColumnLimit=12
-            upperRowLimit=7
-        if (self.titrationMode.get() == "By column"):
-            if (int(startValueList[1]) < upperColumnLimit):
-                lowerStartValue = int(startValueList[0]) + 1
-                upperStartValue = int(startValueList[1]) + 1
-                newStartValue = str(lowerStartValue) + "," + str(upperStartValue)
-                self.startValues.set(newStartValue)
-        else:
-            if (alphabet.index(startValueList[1]) < upperRowLimit):
-                lowerStartValue = alphabet[alphabet.index(startValueList[0]) + 1]
-                upperStartValue = alphabet[alphabet.index(startValueList[1]) + 1]
-                newStartValue = str(lowerStartValue) + "," + str(upperStartValue)
-                self.startValues.set(newStartValue)
-
+        try:
+            plan = self.currentPlan()
+        except ValueError as e:
+            print("Invalid titration parameters: " + str(e))
+            return
+        finished = self.stepIndex >= len(plan) - 1
+        if self.stepIndex < len(plan) - 1:
+            self.stepIndex = self.stepIndex + 1
         parseCommands(self)
+        recordStep(self, True, finished)
 
     def previousSelection(self):
-
-        startValueList = self.startValues.get().split(',')
-        if (self.titrationMode.get() == "By column"):
-            if (int(startValueList[0]) > 1):
-                lowerStartValue = int(startValueList[0]) - 1
-                upperStartValue = int(startValueList[1]) - 1
-                newStartValue = str(lowerStartValue) + "," + str(upperStartValue)
-                self.startValues.set(newStartValue)
-        else:
-            if (alphabet.index(startValueList[0]) > 0):
-                lowerStartValue = alphabet[alphabet.index(startValueList[0]) - 1]
-                upperStartValue = alphabet[alphabet.index(startValueList[1]) - 1]
-                newStartValue = str(lowerStartValue) + "," + str(upperStartValue)
-                self.startValues.set(newStartValue)
-
+        try:
+            self.currentPlan()
+        except ValueError as e:
+            print("Invalid titration parameters: " + str(e))
+            return
+        if self.stepIndex > 0:
+            self.stepIndex = self.stepIndex - 1
         parseCommands(self)
+        recordStep(self, False)
 
 if __name__ == '__main__':
+    # needed by the writer process (MAPLE_WRITER=process) when running as a pyinstaller executable
+    multiprocessing.freeze_support()
     mainWindow = tkinter.Tk()
     lightPanelGUIinstance = lightPanelGUI(mainWindow)
-    mainWindow.protocol("WM_DELETE_WINDOW", onClosing)
+    # MAPLE_WATCHDOG=1 logs handlers that block the window (stall_watchdog); onClosing stops it
+    # because exit() there means mainloop() never returns
+    watchdog = startWatchdog(mainWindow)
+    mainWindow.protocol("WM_DELETE_WINDOW", lambda: onClosing(lightPanelGUIinstance, watchdog))
     mainWindow.mainloop()
\ No newline at end of file
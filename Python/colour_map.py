@@ -0,0 +1,148 @@
+# 孔位色彩圖（plate map / heatmap）：每孔一個顏色或數值 -> 量化到調色盤 ->
+# 每種顏色一個遮罩指令。96 孔熱圖只要「1 個 L + 色數個 M/MA」，而不是 96 個 S。
+import numpy as np
+import pandas as pd
+
+from panel_protocol import encodeSerialCommand, encodeMaskFrames
+from worklist_io import readTable, normalizeHeader, parseVolumes
+
+# 數值熱圖預設的色階（低 -> 高）
+DEFAULT_PALETTE = np.array([
+    (0, 0, 255),     # 藍
+    (0, 255, 255),   # 青
+    (0, 255, 0),     # 綠
+    (255, 255, 0),   # 黃
+    (255, 128, 0),   # 橘
+    (255, 0, 0),     # 紅
+], dtype=np.int32)
+# 明確指定顏色時最多保留幾種，超過就對應到 DEFAULT_PALETTE
+MAX_COLOURS = 8
+
+
+# 孔位名稱（A1 / A01 / AA12）-> row-major index，無法辨識的為 -1
+def wellIndexArray(names, rows, columns):
+    parts = pd.Series(names).astype(str).str.upper().str.strip().str.extract(r'^([A-Z]{1,2})0*([0-9]+)$')
+    letters = parts[0].fillna('')
+    first = letters.str[0].fillna('@').map(ord).to_numpy() - ord('A')
+    second = letters.str[1].fillna('@').map(ord).to_numpy() - ord('A')
+    two = letters.str.len().to_numpy() == 2
+    row = np.where(two, (first + 1) * 26 + second, first)
+    col = pd.to_numeric(parts[1], errors='coerce').fillna(0).to_numpy(dtype=np.int64) - 1
+    valid = (letters.str.len().to_numpy() > 0) & (row >= 0) & (row < rows) & (col >= 0) & (col < columns)
+    return np.where(valid, row * columns + col, -1)
+
+
+# "#RRGGBB" / "RRGGBB" / "R,G,B" -> (n,3)，無法辨識的為 -1
+def parseColours(series):
+    text = pd.Series(series).astype(str).str.strip()
+    hex_parts = text.str.extract(r'^#?([0-9A-Fa-f]{2})([0-9A-Fa-f]{2})([0-9A-Fa-f]{2})$')
+    rgb = np.full((len(text), 3), -1, dtype=np.int32)
+    is_hex = hex_parts[0].notna().to_numpy()
+    if is_hex.any():
+        rgb[is_hex] = np.array([[int(v, 16) for v in row] for row in hex_parts[is_hex].to_numpy()])
+    triple = text.str.extract(r'^(\d{1,3})\s*[,; ]\s*(\d{1,3})\s*[,; ]\s*(\d{1,3})$')
+    is_triple = triple[0].notna().to_numpy() & ~is_hex
+    if is_triple.any():
+        rgb[is_triple] = np.clip(triple[is_triple].to_numpy(dtype=np.int32), 0, 255)
+    return rgb
+
+
+# 每個顏色找調色盤中最近的一色（平方距離）
+def quantizeColours(rgb, palette):
+    distance = ((rgb[:, None, :] - palette[None, :, :]) ** 2).sum(axis=2)
+    return distance.argmin(axis=1)
+
+
+# 數值等距分成 len(palette) 段；NaN -> -1
+def quantizeValues(values, palette_size, low=None, high=None):
+    values = np.asarray(values, dtype=float)
+    finite = np.isfinite(values)
+    index = np.full(len(values), -1, dtype=np.int64)
+    if not finite.any():
+        return index
+    low = np.nanmin(values[finite]) if low is None else low
+    high = np.nanmax(values[finite]) if high is None else high
+    if high <= low:
+        index[finite] = palette_size - 1
+        return index
+    scaled = (values[finite] - low) / (high - low) * palette_size
+    index[finite] = np.clip(scaled.astype(np.int64), 0, palette_size - 1)
+    return index
+
+
+class ColourMap:
+    """
+    assignment：長度 rows*columns 的陣列，每孔是 palette 的 index（-1 = 不亮）。
+    """
+    def __init__(self, rows, columns, palette, assignment):
+        self.rows = rows
+        self.columns = columns
+        self.palette = np.asarray(palette, dtype=np.int32)
+        self.assignment = np.asarray(assignment, dtype=np.int64)
+
+    # 由 (孔位 index, 調色盤 index) 建立；同一孔重複時以最後一筆為準
+    @classmethod
+    def from_wells(cls, rows, columns, well_index, palette, palette_index):
+        assignment = np.full(rows * columns, -1, dtype=np.int64)
+        ok = (well_index >= 0) & (palette_index >= 0)
+        assignment[well_index[ok]] = palette_index[ok]
+        return cls(rows, columns, palette, assignment)
+
+    # 每種用到的顏色一個遮罩（一次 packbits 完成全部分組）
+    def groups(self):
+        used = np.unique(self.assignment[self.assignment >= 0])
+        if len(used) == 0:
+            return []
+        onehot = self.assignment[None, :] == used[:, None]
+        packed = np.packbits(onehot, axis=1, bitorder='little')
+        return [(tuple(int(v) for v in self.palette[k]), packed[i].tobytes()) for i, k in enumerate(used)]
+
+    # 有顏色的孔位合成一個 bitset（給選取格子顯示）
+    def lit_bits(self) -> int:
+        return int.from_bytes(np.packbits(self.assignment >= 0, bitorder='little').tobytes(), 'little')
+
+    # 編碼成指令：亮度一次，第一色用 M（清掉其他孔），其餘用 MA 疊加（1536 孔每色分成幾段）
+    def frames(self, bright=255):
+        groups = self.groups()
+        if not groups:
+            return [encodeSerialCommand(command="X")]
+        frames = [encodeSerialCommand(command="L", bright=bright)]
+        for i, (rgb, mask) in enumerate(groups):
+            frames += encodeMaskFrames(mask, rgb, add=i > 0)
+        return frames
+
+
+# 從表格建立色彩圖：需要 Well 欄，加上 Colour/Color（明確顏色）或 Value / Transfer_volume（數值熱圖）
+def colourMapFromTable(table, rows, columns, palette=None):
+    headers = {normalizeHeader(h): h for h in table.columns}
+    well_header = headers.get('well') or headers.get('destinationwell') or headers.get('sourcewell')
+    if well_header is None:
+        raise ValueError("Colour map needs a Well column")
+    well_index = wellIndexArray(table[well_header], rows, columns)
+
+    colour_header = headers.get('colour') or headers.get('color')
+    if colour_header is not None:
+        rgb = parseColours(table[colour_header])
+        valid = (rgb >= 0).all(axis=1)
+        distinct, inverse = np.unique(rgb[valid], axis=0, return_inverse=True)
+        if palette is None and len(distinct) <= MAX_COLOURS:
+            palette_index = np.full(len(rgb), -1, dtype=np.int64)
+            palette_index[valid] = inverse.ravel()
+            return ColourMap.from_wells(rows, columns, well_index, distinct, palette_index)
+        palette = DEFAULT_PALETTE if palette is None else np.asarray(palette, dtype=np.int32)
+        palette_index = np.where(valid, quantizeColours(np.clip(rgb, 0, 255), palette), -1)
+        return ColourMap.from_wells(rows, columns, well_index, palette, palette_index)
+
+    value_header = headers.get('value') or headers.get('transfervolume') or headers.get('volume')
+    if value_header is None:
+        raise ValueError("Colour map needs a Colour or Value column")
+    palette = DEFAULT_PALETTE if palette is None else np.asarray(palette, dtype=np.int32)
+    # 純數字（可為負）直接用，帶單位的體積（"5ml"）換算成 uL
+    values = pd.to_numeric(table[value_header], errors='coerce').to_numpy(dtype=float)
+    if np.isnan(values).any():
+        values = np.where(np.isnan(values), parseVolumes(table[value_header]), values)
+    return ColourMap.from_wells(rows, columns, well_index, palette, quantizeValues(values, len(palette)))
+
+
+def loadColourMap(path, rows, columns, palette=None, sheet=None):
+    return colourMapFromTable(readTable(path, sheet), rows, columns, palette)
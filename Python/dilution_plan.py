@@ -0,0 +1,80 @@
+# Serial dilution plan: compiles every step of a titration up front so that
+# stepping forward/back is an index change plus a send of precomputed frames.
+from plate_layout import plateDimensions, rowName, rowIndex, parseLineSpec, formatLineSpec
+
+
+def encodeDilutionCommand(value, command):
+    return bytes("<" + value + "," + value + "," + command + ",Titration>\r\n", 'us-ascii')
+
+
+class DilutionStep:
+    def __init__(self, startLines, frames, startText):
+        self.startLines = startLines  # 0-based lit lines of every series/replicate
+        self.frames = frames          # tuple of encoded frames, sent in order
+        self.startText = startText    # what the start value entry shows at this step
+
+
+class DilutionPlan:
+    """
+    byColumn: the series walk across columns (C/CR commands), otherwise rows (R/CC).
+    starts: first line of each parallel series ("3,13" or "B,E,H"), any number of them.
+    mask: lines on the other axis to keep lit, e.g. "A-C,F,H-P" or "1-6,9".
+    replicates: adjacent lines lit together for every series.
+    """
+    def __init__(self, density, byColumn, starts, mask, replicates=1):
+        self.density = density
+        self.byColumn = byColumn
+        self.replicates = max(1, int(replicates))
+        rows, columns = plateDimensions(density)
+        self.lineCount = columns if byColumn else rows
+        self.maskLineCount = rows if byColumn else columns
+
+        if byColumn:
+            self.seriesStarts = sorted(int(v) - 1 for v in starts.replace(' ', '').split(',') if v)
+        else:
+            self.seriesStarts = sorted(rowIndex(v) for v in starts.replace(' ', '').split(',') if v)
+        if not self.seriesStarts:
+            raise ValueError("At least one start value is required")
+        if self.seriesStarts[0] < 0 or self.seriesStarts[-1] + self.replicates > self.lineCount:
+            raise ValueError("Start values are outside the plate")
+        self.maskLines = parseLineSpec(mask, byRow=byColumn, lineCount=self.maskLineCount)
+        self.maskText = formatLineSpec(self.maskLines, byRow=byColumn)
+
+        self.steps = []
+        self.startIndex = 0
+        self.compile()
+
+    def _lineValue(self, line):
+        return str(line + 1) if self.byColumn else rowName(line)
+
+    def _maskValue(self, line):
+        return rowName(line) if self.byColumn else str(line + 1)
+
+    # build the frames for every reachable offset of the series
+    def compile(self):
+        lightCommand, clearCommand = ("C", "CR") if self.byColumn else ("R", "CC")
+        lowestOffset = -self.seriesStarts[0]
+        highestOffset = self.lineCount - self.replicates - self.seriesStarts[-1]
+
+        # masked-out lines are identical for every step, encode them once
+        maskSet = set(self.maskLines)
+        clearFrames = tuple(encodeDilutionCommand(self._maskValue(line), clearCommand)
+                            for line in range(self.maskLineCount) if line not in maskSet)
+        clearAll = encodeDilutionCommand("1", "X")
+
+        self.steps = []
+        for offset in range(lowestOffset, highestOffset + 1):
+            starts = [start + offset for start in self.seriesStarts]
+            litLines = [start + r for start in starts for r in range(self.replicates)]
+            lightFrames = tuple(encodeDilutionCommand(self._lineValue(line), lightCommand) for line in litLines)
+            update = encodeDilutionCommand(self._lineValue(litLines[-1]), "U")
+            startText = ",".join(self._lineValue(start) for start in starts)
+            self.steps.append(DilutionStep(litLines, (clearAll,) + lightFrames + clearFrames + (update,), startText))
+        self.startIndex = -lowestOffset
+        return self.steps
+
+    def __len__(self):
+        return len(self.steps)
+
+    def step(self, index):
+        return self.steps[max(0, min(len(self.steps) - 1, index))]
@@ -0,0 +1,216 @@
+# 連線節奏（pacing）：連線時先量每種指令在這塊面板上的處理時間，之後依實際 ACK 延遲持續調整
+# 指令間隔與 ACK 逾時，取代原本各處猜的常數（0.001 / 0.002 / .15 秒間隔、0.3 / 0.5 秒逾時）。
+#
+# 面板模型：韌體一次處理一個指令（Gen2_96 處理完才回 <ACK>；Gen2 每圈 loop 先 delay(100)），
+# 處理中送來的 byte 先放在 MCU 的序列接收緩衝（AVR 為 64 bytes），'<' '>' 之間最多 127 字元
+# （receivedCharArray 128 bytes）。送出前估計面板何時有空，只讓下一個指令最多
+# RX_BUFFER 個 byte 在面板忙的時候抵達，不會把接收緩衝塞爆。
+import time
+from collections import deque
+
+from panel_model import parseFrame, frameText
+from panel_protocol import FRAME_MAX_CHARS
+
+RX_BUFFER = 64            # MCU 序列接收緩衝（bytes）
+MIN_TIMEOUT = 0.05        # ACK 逾時下限（秒）
+MAX_TIMEOUT = 2.0         # ACK 逾時上限（秒）
+BOOT_TIMEOUT = 3.0        # 新開埠等板子開機訊息的上限（秒）
+
+# 校正用指令：面板上看不出來的指令（U 重新顯示目前內容；不帶亮度的 L 不改亮度，
+# 舊韌體不認得 L 只回錯誤訊息）。沒量到的指令先用全部指令的統計，之後依實際 ACK 調整。
+# Gen1 韌體每個指令都會先清掉面板，所以只在剛開的埠（板子剛重開機，面板本來就是暗的）上校正。
+PROBES = (
+    ("U", b"<A,1,U,>"),
+    ("L", b"<A,1,L,>"),
+)
+
+
+# 一個字元在線上的時間：start + 8 data + stop bits
+def wireTime(nbytes, baudrate, stopbits=1):
+    return nbytes * (9 + stopbits) / baudrate
+
+
+def opcodeOf(payload):
+    return parseFrame(frameText(payload))[3] or "?"
+
+
+# 平滑延遲與變異（同 TCP 的 SRTT / RTTVAR 算法）
+class LatencyStats:
+    def __init__(self):
+        self.count = 0
+        self.srtt = 0.0
+        self.rttvar = 0.0
+        self.backoff = 1.0
+
+    def add(self, sample):
+        if self.count == 0:
+            self.srtt = sample
+            self.rttvar = sample / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - sample)
+            self.srtt = 0.875 * self.srtt + 0.125 * sample
+        self.count += 1
+        self.backoff = 1.0
+
+
+class LinkPacer:
+    """
+    每種指令（opcode）各自一份處理時間統計；沒量過的指令用全部指令的統計，
+    連一筆都沒有時才用建構時給的 inter_delay / ack_timeout。
+    處理時間 = ACK（或下一個回覆）時間 - 指令全部抵達面板的時間，不含線上傳輸時間。
+    margin：不等 ACK 時，估計的處理時間再乘上的安全係數。
+    """
+    def __init__(self, baudrate, stopbits=1, inter_delay=0.002, ack_timeout=0.5, margin=1.25):
+        self.baudrate = baudrate
+        self.stopbits = stopbits
+        self.inter_delay = inter_delay
+        self.ack_timeout = ack_timeout
+        self.margin = margin
+        self.stats = {}
+        self.overall = LatencyStats()
+        self.busy_until = 0.0   # 估計面板處理完目前指令的時間（perf_counter）
+        self._arrived = 0.0     # 上一個指令全部抵達面板的時間
+        self._arrivals = deque(maxlen=RX_BUFFER)  # 等 ACK 中的指令抵達時間（一次寫出好幾個時依序）
+        self._done = 0.0        # 上一個 ACK（或逾時）的時間
+        self._warned = set()
+
+    def wire(self, payload):
+        return wireTime(len(payload), self.baudrate, self.stopbits)
+
+    def _stats(self, payload):
+        stats = self.stats.get(opcodeOf(payload))
+        if stats is not None and stats.count:
+            return stats
+        return self.overall if self.overall.count else None
+
+    # 估計的處理時間
+    def service(self, payload):
+        stats = self._stats(payload)
+        return self.inter_delay if stats is None else stats.srtt
+
+    # 這個指令的 ACK 逾時：處理時間 + 4 倍變異 + 傳輸時間，遇過逾時再加倍
+    def timeout_for(self, payload):
+        stats = self.stats.get(opcodeOf(payload))
+        if stats is None or not stats.count:
+            base = self._stats(payload)
+            if base is None:
+                return self.ack_timeout
+            stats = base
+        rto = stats.srtt + max(4 * stats.rttvar, 0.005) + 2 * self.wire(payload)
+        return min(MAX_TIMEOUT, max(MIN_TIMEOUT, rto * stats.backoff))
+
+    # 寫出前要再等多久：讓指令最多 RX_BUFFER 個 byte 在面板還在忙的時候抵達
+    def gap_before(self, payload, now=None):
+        now = time.perf_counter() if now is None else now
+        payload_chars = len(frameText(payload))
+        if payload_chars > FRAME_MAX_CHARS and opcodeOf(payload) not in self._warned:
+            self._warned.add(opcodeOf(payload))
+            print(f"WARN: {payload_chars}-character frame exceeds the panel's receive buffer")
+        early = wireTime(min(len(payload), RX_BUFFER), self.baudrate, self.stopbits)
+        return self.busy_until - now - early
+
+    # 指令已寫出：估計它何時處理完
+    def wrote(self, payload, started, finished=None):
+        finished = time.perf_counter() if finished is None else finished
+        arrived = max(started + self.wire(payload), finished)
+        self._arrived = arrived
+        self._arrivals.append(arrived)
+        self.busy_until = max(self.busy_until, arrived) + self.service(payload) * self.margin
+
+    # 這個指令開始處理的時間：抵達後、且前一個指令做完之後
+    def _started(self):
+        arrived = self._arrivals.popleft() if self._arrivals else self._arrived
+        return max(arrived, self._done)
+
+    # 收到 ACK：面板已經有空，並記錄處理時間
+    # （sample=False：ACK 跟前一個一起讀到，量不出這一個的處理時間）
+    def acked(self, payload, at=None, sample=True):
+        at = time.perf_counter() if at is None else at
+        started = self._started()
+        if sample:
+            self.record(payload, at - started)
+        self._done = at
+        self.busy_until = at
+
+    # 沒收到 ACK：這種指令的逾時加倍（不拿逾時當樣本）
+    def missed(self, payload):
+        self._started()
+        self._done = time.perf_counter()
+        stats = self.stats.setdefault(opcodeOf(payload), LatencyStats())
+        stats.backoff = min(stats.backoff * 2, 16.0)
+
+    def record(self, payload, sample):
+        sample = max(sample, 0.0)
+        self.stats.setdefault(opcodeOf(payload), LatencyStats()).add(sample)
+        self.overall.add(sample)
+
+    def summary(self):
+        parts = [f"{op} {s.srtt * 1000:.1f} ms" for op, s in sorted(self.stats.items()) if s.count]
+        return ", ".join(parts) if parts else "not calibrated"
+
+
+# ---- 連線時校正（在 sender 執行緒上跑，不擋 UI）----
+
+# 讀回覆直到線路安靜 quiet 秒；回傳最後收到資料的時間（沒收到資料為 None）
+def _read_until_quiet(ser_conn, parser, quiet, limit):
+    deadline = time.perf_counter() + limit
+    last = None
+    while True:
+        now = time.perf_counter()
+        if ser_conn.read_replies(parser):
+            last = time.perf_counter()
+            continue
+        if last is not None and now - last >= quiet:
+            return last
+        if now >= deadline:
+            return last
+        time.sleep(0.0005)
+
+
+# 新開埠會讓板子重開機：等開機訊息印完（沒有開機訊息的韌體最多等 BOOT_TIMEOUT）
+def waitForBoot(ser_conn, parser, pacer):
+    quiet = max(0.05, wireTime(32, pacer.baudrate, pacer.stopbits))
+    _read_until_quiet(ser_conn, parser, quiet, BOOT_TIMEOUT)
+    parser.replies.clear()
+
+
+def calibrate(ser_conn, parser, pacer, wait_ack, rounds=3, probes=PROBES):
+    """
+    每個校正指令送 rounds 次，等到前一個做完才送下一個。
+    等 ACK 的韌體：樣本 = ACK 時間 - 指令抵達時間。
+    不回 ACK 的韌體：以回覆（除錯訊息）結束的時間為完成點，前一個指令的樣本取到下一個完成點為止，
+    包含 loop() 裡的 delay，也就是不等 ACK 時連續送指令的最小安全間隔。
+    回傳量到的樣本數；面板完全沒有回覆時為 0，pacer 維持原本的預設值。
+    """
+    limit = max(pacer.ack_timeout, 0.5)
+    samples = 0
+    sequence = [probe for probe in probes for _ in range(rounds)] + [probes[-1]]
+    for i, (_op, frame) in enumerate(sequence):
+        started = time.perf_counter()
+        ser_conn.write_and_drain(frame, inter_delay=0)
+        arrived = max(started + pacer.wire(frame), time.perf_counter())
+        if wait_ack:
+            done = None
+            deadline = time.perf_counter() + limit
+            while done is None and time.perf_counter() < deadline:
+                if parser.replies:
+                    parser.replies.popleft()
+                    done = time.perf_counter()
+                elif not ser_conn.read_replies(parser):
+                    time.sleep(0.0002)
+            if done is None:
+                return samples
+            pacer.record(frame, done - arrived)
+            samples += 1
+        else:
+            quiet = max(0.002, wireTime(8, pacer.baudrate, pacer.stopbits))
+            done = _read_until_quiet(ser_conn, parser, quiet, limit)
+            if done is None:
+                return samples
+            # 這個指令是在前一個回覆結束（再加 quiet）時送出，這段等待都是前一個指令還在忙
+            if i > 0:
+                pacer.record(sequence[i - 1][1], done - started - pacer.wire(frame) + quiet)
+                samples += 1
+        parser.replies.clear()
+    pacer.busy_until = time.perf_counter()
+    return samples
@@ -0,0 +1,14 @@
+# Where the GUIs keep their local files (worklist cache, volume ledger, step timings, stall log):
+# <LOCALAPPDATA>\MAPLE on Windows, ~/.cache/MAPLE elsewhere; each can be moved with its own
+# environment variable.
+import os
+
+
+def dataDirectory():
+    base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "MAPLE")
+
+
+# the path in environment variable `variable`, else `name` in the data directory
+def dataPath(variable, name):
+    return os.environ.get(variable) or os.path.join(dataDirectory(), name)
@@ -0,0 +1,501 @@
+# 串口連線與背景送出（96check box、面板常駐服務等共用）
+import serial
+import serial.tools.list_ports
+from threading import Thread, Lock
+from threading import Event
+import os
+import queue
+import time
+from collections import deque
+
+from panel_client import openPanelPort
+from serial_capture import openCapture, WRITE, READ
+from link_pacing import calibrate, waitForBoot, RX_BUFFER
+
+USB_PACKET = 64  # USB full-speed bulk 封包大小（CDC 序列晶片）
+# 合併寫出的預設值（MAPLE_BATCH_BYTES=0 關閉合併）
+BATCH_BYTES = int(os.environ.get("MAPLE_BATCH_BYTES", RX_BUFFER))
+BATCH_DELAY = float(os.environ.get("MAPLE_BATCH_DELAY", 0.0005))
+
+# 取得可用 COM ports
+def get_available_ports():
+    ports = serial.tools.list_ports.comports()
+    return [port.device for port in ports]
+
+def metricsSummary(m) -> str:
+    if not m:
+        return "no frames written"
+    return (f"{m['frames']} frames in {m['writes']} writes ({m['frames_per_write']:.2f} per write, "
+            f"max {m['max_batch']}), {m['packets']} USB packets ({m['saved_packets']} saved)")
+
+# 串口連接類別
+class SerialConnection:
+    def __init__(self, use_daemon: bool = True):
+        self.connection = None
+        self._lock = Lock()  # 保證同時間只有一個 write
+        self.use_daemon = use_daemon  # 常駐服務本身要設 False，直接開實體埠
+        self.fresh = True  # 這次是否真的打開實體埠（開埠會讓板子重開機）
+        self.recorder = None  # 流量錄製（serial_capture.CaptureWriter），預設不錄
+
+    # 連接指定的 COM port（有常駐服務就經由服務，否則直接開）
+    def connect(self, port, baudrate=500000, stopbits=serial.STOPBITS_TWO, wait_ack=False):
+        try:
+            if self.connection:
+                self.connection.close()
+            if self.recorder is None:
+                self.recorder = openCapture(port)
+            self.connection = openPanelPort(port, baudrate, stopbits, wait_ack) if self.use_daemon else None
+            if self.connection is not None:
+                self.fresh = self.connection.fresh
+                return True
+            self.connection = serial.Serial(
+                port,
+                baudrate,
+                timeout=0,            # 非阻塞讀
+                write_timeout=1.0,    # 寫入逾時避免死等
+                stopbits=stopbits,
+                # 視硬體情況可開：rtscts=True 或 xonxoff=True
+            )
+            self.fresh = True
+            # 確認連接成功
+            try:
+                self.connection.reset_input_buffer()
+                self.connection.reset_output_buffer()
+            except Exception:
+                pass
+            return True
+        # 連接失敗
+        except Exception as e:
+            print(f"Connect fail: {str(e)}")
+            return False
+    
+    # 安全寫入並排空輸出佇列
+    def write_and_drain(self, data: bytes, inter_delay: float = 0.001):
+        """
+        安全寫入：write -> flush -> out_waiting 清空 -> 可選間隔
+        不要在 UI 執行緒大量呼叫；建議搭配 SerialSender 佇列背景送。
+        """
+        if not (self.connection and self.connection.is_open):
+            return False
+        with self._lock:
+            self.connection.write(data)
+            if self.recorder:
+                self.recorder.record(WRITE, data)
+            # 1) 等待 Driver/OS 緩衝送出
+            self.connection.flush()
+            # 2) 確認輸出佇列已空（有些平台 out_waiting 可能一直是 0，也沒關係）
+            while getattr(self.connection, "out_waiting", 0) > 0:
+                time.sleep(0.001)
+            # 3) 留一點處理縫隙給對端 MCU（必要時可調大）
+            if inter_delay > 0:
+                time.sleep(inter_delay)
+        return True
+    #  write不等待的版本：不排隊，但不會插進正在寫的指令中間（例如步驟程式的單一 byte '+' '-'）
+    def write(self, data):
+        if self.connection and self.connection.is_open:
+            with self._lock:
+                self.connection.write(data)
+                if self.recorder:
+                    self.recorder.record(WRITE, data)
+
+    # 讀回覆（交給 ReplyParser），有錄製時一併記下
+    def read_replies(self, parser, wait: bool = False) -> int:
+        if not (self.connection and self.connection.is_open):
+            return 0
+        return parser.read_from(self.connection, wait, self.recorder)
+    
+    # 關閉COM port連接
+    def close(self):
+        if self.connection:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
+
+# 面板回覆的串流解析器
+class ReplyParser:
+    """
+    以固定大小的 bytearray 接收資料（readinto 直接寫入，不做 bytes 串接），
+    逐行切出 <ACK>、<ERR:...>、事件（<STEP:n>、<MISS:n>，放在 events）與其他韌體訊息
+    （例如 "Display cleared."）。
+    已掃描過的位置會記住，每個 byte 只找一次換行；處理完的資料以平移回收空間。
+    """
+    def __init__(self, size: int = 4096, ack_token: bytes = b"<ACK>", log_size: int = 500, on_log=None):
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.start = 0   # 尚未處理的第一個 byte
+        self.scan = 0    # 已找過換行的位置
+        self.end = 0     # 有效資料結尾
+        self.ack_token = ack_token
+        self.replies = deque(maxlen=256)          # ("ACK", None) / ("ERR", 訊息)，依到達順序
+        self.events = deque(maxlen=256)           # ("STEP", "12") / ("MISS", "13")，依到達順序
+        self.device_log = deque(maxlen=log_size)  # (時間, 文字)
+        self.on_log = on_log
+        self.ack_count = 0
+        self.err_count = 0
+
+    # 從串口讀入：有資料就整批讀；wait=True 時沒資料就等 1 byte（受串口 timeout 限制）
+    def read_from(self, conn, wait: bool = False, recorder=None) -> int:
+        self._make_room()
+        n = getattr(conn, "in_waiting", 0)
+        if n <= 0:
+            if not wait:
+                return 0
+            n = 1
+        n = min(n, len(self.buf) - self.end)
+        got = conn.readinto(self.view[self.end:self.end + n]) or 0
+        if got:
+            if recorder:
+                recorder.record(READ, self.view[self.end:self.end + got])
+            self.end += got
+            self._parse()
+        return got
+
+    # 由其他來源（常駐服務、錄製檔）餵入資料
+    def feed(self, data):
+        data = memoryview(data)
+        while len(data):
+            self._make_room()
+            n = min(len(data), len(self.buf) - self.end)
+            self.buf[self.end:self.end + n] = data[:n]
+            self.end += n
+            data = data[n:]
+            self._parse()
+
+    # 緩衝區滿時：把未處理的尾巴搬回開頭；整個緩衝都是同一行就當作 log 強制切出
+    def _make_room(self):
+        if self.end < len(self.buf):
+            return
+        if self.start == 0:
+            self._line(0, self.end)
+            self.start = self.scan = self.end = 0
+            return
+        remaining = self.end - self.start
+        self.buf[0:remaining] = self.view[self.start:self.end]
+        self.scan -= self.start
+        self.start, self.end = 0, remaining
+
+    def _parse(self):
+        buf = self.buf
+        while True:
+            nl = buf.find(b"\n", self.scan, self.end)
+            if nl < 0:
+                self.scan = self.end
+                break
+            self._line(self.start, nl)
+            self.start = self.scan = nl + 1
+        if self.start == self.end:
+            self.start = self.scan = self.end = 0
+
+    # 單行分類：<ACK> / <ERR:...> 標記之外的文字都記到 device_log
+    def _line(self, s: int, e: int):
+        buf = self.buf
+        if e > s and buf[e - 1] == 13:  # '\r'
+            e -= 1
+        text_end = e
+        pos = s
+        while pos < e:
+            lt = buf.find(b"<", pos, e)
+            if lt < 0:
+                break
+            gt = buf.find(b">", lt, e)
+            if gt < 0:
+                break
+            if buf.startswith(self.ack_token, lt, gt + 1):
+                self.ack_count += 1
+                self.replies.append(("ACK", None))
+            elif buf.startswith(b"<ERR:", lt, gt + 1):
+                self.err_count += 1
+                self.replies.append(("ERR", bytes(self.view[lt + 5:gt]).decode("ascii", "replace")))
+            elif buf.startswith(b"<STEP:", lt, gt + 1) or buf.startswith(b"<MISS:", lt, gt + 1):
+                self.events.append((bytes(self.view[lt + 1:lt + 5]).decode("ascii"),
+                                    bytes(self.view[lt + 6:gt]).decode("ascii", "replace")))
+            else:
+                pos = gt + 1
+                continue
+            text_end = min(text_end, lt)
+            pos = gt + 1
+        if text_end > s:
+            text = bytes(self.view[s:text_end]).decode("ascii", "replace").strip()
+            if text:
+                self.device_log.append((time.time(), text))
+                if self.on_log:
+                    self.on_log(text)
+
+
+# 專責安序（序列化）送資料的背景執行緒
+class SerialSender:
+    """
+    專責安序（序列化）送資料的背景執行緒。
+    UI 呼叫 send(payload) -> 背景逐筆 write_and_drain -> (可選) 等 ACK
+    pacer（link_pacing.LinkPacer）：有給時，啟動後先校正這塊面板，之後指令間隔與 ACK 逾時
+    都由 pacer 依量到的處理時間決定，inter_delay / ack_timeout 只在還沒量到之前使用。
+    合併寫出（有 pacer 時）：佇列裡連續的指令合計不超過 batch_bytes（預設為面板接收緩衝）
+    就併成一次 write；手上的指令最多再等 batch_delay 秒（面板還在忙時等到它有空）湊下一筆，
+    類似 Nagle。ACK 仍然一筆一筆依序等、一筆一筆通知。batch_bytes=0 關閉合併。
+    """
+    def __init__(self, ser_conn: SerialConnection,
+                 inter_delay: float = 0.001,
+                 wait_ack: bool = False, ack_token: bytes = b"<ACK>", ack_timeout: float = 0.3,
+                 read_timeout: float = 0.005, pacer=None, idle_read: float = 0.05,
+                 max_queue: int = 1024,
+                 batch_bytes: int = BATCH_BYTES, batch_delay: float = BATCH_DELAY):
+        self.ser_conn = ser_conn
+        # 有上限的佇列：面板卡住或埠斷掉時不會無限累積；send 不等（不卡住 Tk），
+        # 滿了就丟掉該筆並把 dropped 加一：面板顯示的已經不是最新狀態，由 GUI 提示並在佇列清空後重送
+        self.q = queue.Queue(maxsize=max_queue)
+        self.dropped = 0  # 因佇列滿而丟掉的指令數（只增不減，GUI 比對數字變了沒）
+        self.stop_evt = Event()
+        self.inter_delay = inter_delay
+        self.wait_ack = wait_ack
+        self.ack_token = ack_token
+        self.ack_timeout = ack_timeout
+        self.read_timeout = read_timeout
+        self.pacer = pacer
+        self.idle_read = idle_read  # 佇列空著時每隔多久讀一次回覆（單一 byte 指令的回覆、韌體訊息）
+        self.last_reply = None  # 最近一筆指令的回覆："ACK" / "ERR" / None（逾時）
+        self.parser = ReplyParser(ack_token=ack_token)
+        self._missed = deque()  # 逾時未收到 ACK 的截止時間（晚到的 ACK 用來抵銷）
+        # 指令狀態回呼 listener(state, payload, 時間)：pending -> sent -> acked / failed，
+        # 佇列滿被丟掉時 pending -> dropped
+        # （在呼叫 send 的執行緒與 sender 執行緒上執行，不可直接動 Tk 元件）
+        self.listeners = []
+        self.batch_bytes = batch_bytes
+        self.batch_delay = batch_delay
+        self._held = None  # 湊批次時多拿到、放不進這一批的指令（下一批的第一筆）
+        # 統計：指令數、write 次數、bytes、USB 封包數（實際 / 不合併時）、最大一批
+        self.frames = 0
+        self.writes = 0
+        self.bytes_written = 0
+        self.packets = 0
+        self.frame_packets = 0
+        self.max_batch = 0
+        self.thread = Thread(target=self._run, daemon=True)
+    
+    # 啟動背景執行緒
+    def start(self):
+        # 讀逾時只設定一次（不再每筆指令改 conn.timeout）
+        conn = self.ser_conn.connection
+        if conn is not None and not getattr(conn, "handles_ack", False):
+            try:
+                conn.timeout = self.read_timeout
+            except Exception:
+                pass
+        if not self.thread.is_alive():
+            self.thread.start()
+
+    # 停止背景執行緒
+    def stop(self):
+        self.stop_evt.set()
+        try:
+            self.q.put_nowait(None)  # 喚醒（佇列滿時執行緒送完手上這筆就會看到 stop_evt）
+        except queue.Full:
+            pass
+        self.thread.join(timeout=1)
+
+    # 放入佇列等待送出；預設不等，佇列滿回 False。timeout 只給不在 Tk 執行緒上的呼叫端
+    # （例如寫入子行程）做背壓用，送出執行緒已經停了就不等
+    def send(self, payload: bytes, timeout: float = 0) -> bool:
+        self._notify("pending", payload)
+        try:
+            if timeout and self.thread.is_alive():
+                self.q.put(payload, timeout=timeout)
+            else:
+                self.q.put_nowait(payload)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 100 == 0:
+                print(f"WARN: send queue full, {self.dropped} frame(s) dropped")
+            self._notify("dropped", payload)
+            return False
+
+    # 還沒送完（不等 ACK 時為還沒寫出）的指令數
+    def pending(self) -> int:
+        return self.q.unfinished_tasks
+
+    def alive(self) -> bool:
+        return self.thread.is_alive()
+
+    # 合併寫出的統計：每次 write 另有一次 flush，所以省下的系統呼叫約為 2 * saved_writes
+    def metrics(self) -> dict:
+        return {
+            "frames": self.frames,
+            "writes": self.writes,
+            "saved_writes": self.frames - self.writes,
+            "frames_per_write": self.frames / self.writes if self.writes else 0.0,
+            "bytes": self.bytes_written,
+            "packets": self.packets,
+            "saved_packets": self.frame_packets - self.packets,
+            "max_batch": self.max_batch,
+        }
+
+    def metrics_summary(self) -> str:
+        return metricsSummary(self.metrics())
+
+    def _notify(self, state, payload):
+        for listener in list(self.listeners):
+            try:
+                listener(state, payload, time.perf_counter())
+            except Exception:
+                pass
+
+    # 等待 ACK 標記
+    def _wait_for_ack(self, timeout=None) -> bool:
+        """
+        由 ReplyParser 依到達順序取回覆：<ACK> 回 True，<ERR:...> 或超時回 False。
+        之前逾時的指令若 ACK 晚到，會先被抵銷，不會被算到這一筆。
+        """
+        self.last_reply = None
+        conn = self.ser_conn.connection
+        if not (conn and conn.is_open):
+            return False
+        # 經由常駐服務時，ACK 由服務端等
+        if getattr(conn, "handles_ack", False):
+            self.last_reply = "ACK"
+            return True
+        parser = self.parser
+        timeout = float(self.ack_timeout if timeout is None else timeout)
+        deadline = time.perf_counter() + timeout
+        while True:
+            while parser.replies:
+                kind, detail = parser.replies.popleft()
+                now = time.perf_counter()
+                while self._missed and self._missed[0] < now:
+                    self._missed.popleft()
+                if self._missed:
+                    self._missed.popleft()
+                    continue
+                self.last_reply = kind
+                if kind == "ACK":
+                    return True
+                print("WARN: device error:", detail)
+                return False
+            if time.perf_counter() >= deadline:
+                break
+            if not self.ser_conn.read_replies(parser, wait=True) and not conn.timeout:
+                time.sleep(0.001)  # 非阻塞埠，避免空轉
+        now = time.perf_counter()
+        while self._missed and self._missed[0] < now:
+            self._missed.popleft()
+        self._missed.append(now + 2 * timeout)
+        print("WARN: missing ACK")
+        return False
+    
+    # 主要執行緒函式
+    def _run(self):
+        pacer = self.pacer
+        if pacer is not None:
+            self._calibrate()
+        while not self.stop_evt.is_set():
+            item, self._held = self._held, None
+            if item is None:
+                try:
+                    item = self.q.get(timeout=self.idle_read)
+                except queue.Empty:
+                    self._drain_replies()
+                    continue
+                if item is None:
+                    break
+            batch = [item]
+            if pacer is not None and self.batch_bytes > 0:
+                batch = self._collect(item)
+            payload = batch[0] if len(batch) == 1 else b"".join(batch)
+            # 寫出 + 排空；有 pacer 時等到估計面板有空，否則用固定的小延遲
+            if pacer is not None:
+                gap = pacer.gap_before(payload)
+                if gap > 0:
+                    self.stop_evt.wait(gap)
+            started = time.perf_counter()
+            self.ser_conn.write_and_drain(payload, inter_delay=0 if pacer is not None else self.inter_delay)
+            self._count(batch, payload)
+            if pacer is not None:
+                # 同一次寫出的指令依序抵達面板
+                at = started
+                for frame in batch[:-1]:
+                    at += pacer.wire(frame)
+                    pacer.wrote(frame, at - pacer.wire(frame), at)
+                pacer.wrote(batch[-1], at)
+            for frame in batch:
+                self._notify("sent", frame)
+            # 等 ACK（每筆指令一個，依序）；不等 ACK 時也把回覆讀掉，韌體訊息才會進 device_log
+            for i, frame in enumerate(batch):
+                if self.wait_ack:
+                    # 同一批後面的指令，ACK 若已經跟前一個一起讀到就不當處理時間樣本
+                    buffered = i > 0 and bool(self.parser.replies)
+                    ok = self._wait_for_ack(pacer.timeout_for(frame) if pacer is not None else None)
+                    if pacer is not None:
+                        # 有回覆（ACK 或 ERR）代表面板已處理完；逾時則放寬這種指令的逾時
+                        if self.last_reply is not None:
+                            pacer.acked(frame, sample=not buffered)
+                        else:
+                            pacer.missed(frame)
+                    self._notify("acked" if ok else "failed", frame)
+                self.q.task_done()
+            if not self.wait_ack:
+                self._drain_replies()
+
+    # 從佇列再拿指令湊成一批（合計不超過 batch_bytes）；最多等 batch_delay 秒，
+    # 面板還在忙（本來就要等）時等到它快有空為止
+    def _collect(self, first):
+        batch, size = [first], len(first)
+        deadline = time.perf_counter() + max(self.batch_delay, self.pacer.gap_before(first))
+        while size < self.batch_bytes:
+            wait = deadline - time.perf_counter()
+            try:
+                item = self.q.get(timeout=wait) if wait > 0 else self.q.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                break
+            if size + len(item) > self.batch_bytes:
+                self._held = item
+                break
+            batch.append(item)
+            size += len(item)
+        return batch
+
+    def _count(self, batch, payload):
+        self.frames += len(batch)
+        self.writes += 1
+        self.bytes_written += len(payload)
+        self.packets += -(-len(payload) // USB_PACKET)
+        self.frame_packets += sum(-(-len(frame) // USB_PACKET) for frame in batch)
+        self.max_batch = max(self.max_batch, len(batch))
+
+    # 剛開的埠先等板子開機，再量這塊面板的處理時間；經由常駐服務時由服務端負責。
+    # 沒有重開的埠不校正（面板正在顯示東西），用預設節奏，之後依實際 ACK 調整
+    def _calibrate(self):
+        conn = self.ser_conn.connection
+        if not (conn and conn.is_open) or getattr(conn, "handles_ack", False) or not self.ser_conn.fresh:
+            return
+        try:
+            waitForBoot(self.ser_conn, self.parser, self.pacer)
+            if calibrate(self.ser_conn, self.parser, self.pacer, self.wait_ack):
+                print(f"Link pacing ({getattr(conn, 'port', '')}): {self.pacer.summary()}")
+            else:
+                print("WARN: no reply while calibrating; using the default pacing")
+        except Exception as e:
+            print(f"WARN: calibration failed: {e}")
+
+    # 非阻塞讀掉目前已到的回覆
+    def _drain_replies(self):
+        conn = self.ser_conn.connection
+        if conn and conn.is_open and not getattr(conn, "handles_ack", False):
+            try:
+                while self.ser_conn.read_replies(self.parser):
+                    pass
+            except Exception:
+                pass
+            # 不等 ACK 時仍要讓錯誤回覆看得到；逾時指令的回覆晚到就在這裡抵銷
+            while self.parser.replies:
+                kind, detail = self.parser.replies.popleft()
+                if self._missed:
+                    self._missed.popleft()
+                    continue
+                if kind == "ERR":
+                    print("WARN: device error:", detail)
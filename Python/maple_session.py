@@ -0,0 +1,278 @@
+# 工作階段（session）模型：每個視窗一個 Session，保存自己的工作清單、目前位置與面板連線；
+# 同一個行程的 Session 共用一個 IOCore（同一個 COM port 只開一次、一條送出執行緒、
+# 一個定時排程器），一個執行檔就能同時服務好幾個實驗台，不用每台各開一份程式。
+import itertools
+import os
+import time
+from threading import Lock
+
+import pandas as pd
+import serial
+
+from maple_serial import SerialConnection, SerialSender
+from link_pacing import LinkPacer
+from timed_program import ProgramScheduler
+
+LINK_CHECK_MS = 250  # LinkMonitor 檢查間隔
+
+
+# 一個實體埠：連線 + 背景 sender，記錄有幾個 session 在用
+class PanelLink:
+    def __init__(self, port, conn: SerialConnection, sender: SerialSender):
+        self.port = port
+        self.conn = conn
+        self.sender = sender
+        self.users = 0
+
+    # 這次是否真的打開實體埠（開埠會讓板子重開機）
+    @property
+    def fresh(self):
+        return self.conn.fresh
+
+    # 有指令因佇列滿被丟掉時回 False
+    def send(self, frames):
+        ok = True
+        for payload in frames:
+            ok = self.sender.send(payload) and ok
+        return ok
+
+    # 因佇列滿被丟掉的指令數（只增不減）：共用這條連線的每個 session 各自記得看過多少，
+    # 不會有人讀了就清掉、其他 session 看不到
+    @property
+    def dropped(self):
+        return self.sender.dropped
+
+    # 佇列已經送完：丟過指令的話，這時重送目前狀態
+    def caught_up(self):
+        return not self.sender.pending() and self.sender.alive()
+
+    # 等佇列送完；sender 執行緒若已經掛掉就不等
+    def drain(self, timeout=5.0):
+        deadline = time.perf_counter() + timeout
+        while self.sender.pending() and self.sender.alive():
+            if time.perf_counter() >= deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def close(self):
+        self.drain()
+        self.sender.stop()
+        self.conn.close()
+        # 有合併寫出才印統計
+        metrics = self.sender.metrics()
+        if metrics.get("saved_writes"):
+            print(f"Write batching ({self.port}): {self.sender.metrics_summary()}")
+
+
+# 行程內共用的 I/O 核心
+class IOCore:
+    # connection_class：連線類別（預設實體埠；壓力測試用 panel_sim.SimulatedConnection）
+    def __init__(self, connection_class=SerialConnection):
+        self.connection_class = connection_class
+        self.links = {}
+        self._lock = Lock()
+        self._scheduler = None
+        self._names = itertools.count(1)
+
+    # 所有 session 共用一個排程執行緒；run 名稱用 session 名稱區分
+    @property
+    def scheduler(self) -> ProgramScheduler:
+        with self._lock:
+            if self._scheduler is None:
+                self._scheduler = ProgramScheduler()
+            return self._scheduler
+
+    def new_name(self, prefix="session"):
+        return f"{prefix}{next(self._names)}"
+
+    # 取得（或共用）某個埠的連線；第一個使用者的傳輸設定為準
+    # pacing=True 時連線後先校正面板，inter_delay / ack_timeout 只是校正前（或面板沒回覆時）的預設值
+    # writer="process"（或環境變數 MAPLE_WRITER=process）時寫入與讀回覆在獨立子行程（panel_process）
+    def acquire(self, port, baudrate=500000, stopbits=serial.STOPBITS_TWO, wait_ack=True,
+                inter_delay=0.002, ack_timeout=0.5, pacing=True, writer=None):
+        writer = writer or os.environ.get("MAPLE_WRITER", "thread")
+        with self._lock:
+            link = self.links.get(port)
+            if link is None and writer != "process":
+                conn = self.connection_class()
+                if not conn.connect(port, baudrate, stopbits, wait_ack=wait_ack):
+                    return None
+                # 經由常駐服務時由服務端量測與控制節奏
+                pacer = None
+                if pacing and not getattr(conn.connection, "handles_ack", False):
+                    pacer = LinkPacer(baudrate, stopbits, inter_delay, ack_timeout)
+                sender = SerialSender(conn, inter_delay=inter_delay, wait_ack=wait_ack,
+                                      ack_token=b"<ACK>", ack_timeout=ack_timeout, pacer=pacer)
+                sender.start()
+                link = self.links[port] = PanelLink(port, conn, sender)
+            if link is not None:
+                link.users += 1
+                return link
+        return self._acquire_process(port, baudrate, stopbits, wait_ack, inter_delay, ack_timeout, pacing)
+
+    # 寫入子行程啟動（開埠 + 校正）最多要 START_TIMEOUT 秒，不在 _lock 裡等，免得擋住其他 session；
+    # 等的期間別的 session 先開好同一個埠的話，用它的，自己這個收掉
+    def _acquire_process(self, port, baudrate, stopbits, wait_ack, inter_delay, ack_timeout, pacing):
+        from panel_process import ProcessSender, ProcessConnection
+        sender = ProcessSender(port, baudrate, stopbits, wait_ack, inter_delay, ack_timeout, pacing,
+                               connection_class=self.connection_class)
+        ok = sender.start()
+        with self._lock:
+            link = self.links.get(port)
+            if link is None and ok:
+                link = self.links[port] = PanelLink(port, ProcessConnection(sender), sender)
+                sender = None
+            if link is not None:
+                link.users += 1
+        if ok and sender is not None:
+            sender.stop()
+        return link
+
+    # 最後一個使用者離開才真的關埠
+    def release(self, link: PanelLink):
+        with self._lock:
+            link.users -= 1
+            if link.users > 0:
+                return
+            self.links.pop(link.port, None)
+        link.close()
+
+    def shutdown(self):
+        if self._scheduler is not None:
+            self._scheduler.stop()
+        with self._lock:
+            links = list(self.links.values())
+            self.links.clear()
+        for link in links:
+            link.close()
+
+
+# 預設每個行程一個
+defaultCore = IOCore()
+
+
+class Session:
+    """
+    一個工作階段：面板（角色 -> PanelLink，例如 "panel" / "source" / "destination"）
+    與工作清單狀態。GUI 只透過自己的 session 送指令，不再查模組層級的全域變數。
+    """
+    def __init__(self, name=None, core: IOCore = None):
+        self.core = core or defaultCore
+        self.name = name or self.core.new_name()
+        self.panels = {}
+        # 工作清單狀態
+        self.csvData = pd.DataFrame()
+        self.csvHashes = None
+        self.fileName = None
+        self.sheet = None
+        self.currentCsvPosition = 0
+        self.csvRecordCount = 0
+        self.completedRows = set()
+
+    # 換一份工作清單，從第一列開始
+    def load_worklist(self, data, fileName=None, sheet=None, hashes=None):
+        self.csvData = data
+        self.csvHashes = hashes
+        self.fileName = fileName
+        self.sheet = sheet
+        self.csvRecordCount = len(data.index)
+        self.currentCsvPosition = 0
+        self.completedRows = set()
+
+    def connect(self, role, port, baudrate=500000, stopbits=serial.STOPBITS_TWO, wait_ack=True,
+                inter_delay=0.002, ack_timeout=0.5, pacing=True, writer=None) -> bool:
+        self.disconnect(role)
+        link = self.core.acquire(port, baudrate, stopbits, wait_ack, inter_delay, ack_timeout, pacing, writer)
+        if link is None:
+            return False
+        self.panels[role] = link
+        return True
+
+    def disconnect(self, role=None):
+        roles = list(self.panels) if role is None else [role]
+        for r in roles:
+            link = self.panels.pop(r, None)
+            if link is not None:
+                self.core.release(link)
+
+    def connected(self, role="panel") -> bool:
+        return role in self.panels
+
+    def link(self, role="panel"):
+        return self.panels.get(role)
+
+    # 送出已編碼好的指令；沒連線時只印出來。佇列滿（面板跟不上或卡住）時回 False
+    def send(self, frames, role="panel"):
+        link = self.panels.get(role)
+        for payload in frames:
+            print(payload.decode("us-ascii", "replace"))
+        if link is not None:
+            return link.send(frames)
+        return True
+
+    def drain(self):
+        for link in self.panels.values():
+            link.drain()
+
+    # 關閉工作階段：停掉自己的定時程式，送完佇列後釋放面板
+    def close(self):
+        if self.core._scheduler is not None:
+            self.core._scheduler.cancel(self.name)
+        self.disconnect()
+
+
+# GUI 用：定期檢查 session 的面板連線，有指令被丟掉（dropped 比上次看到的多）就用 report(text) 提示，
+# 佇列送完後 report("") 並呼叫 redraw() 重送目前狀態。widget 只用到 after / after_cancel
+# 每個 monitor 自己記每條連線看過的 dropped，同一個埠的其他 session 也會各自提示、各自重送
+class LinkMonitor:
+    def __init__(self, widget, session, report, redraw=None, interval_ms=LINK_CHECK_MS):
+        self.widget = widget
+        self.session = session
+        self.report = report
+        self.redraw = redraw
+        self.interval_ms = interval_ms
+        self.seen = {}          # 角色 -> (PanelLink, 看過的 dropped)；重新連線換了 link 就重新起算
+        self.reported = set()   # 已提示跟不上、還沒重送的角色
+        self._job = None
+
+    def start(self):
+        self._job = self.widget.after(self.interval_ms, self._check)
+        return self
+
+    def stop(self):
+        if self._job is not None:
+            try:
+                self.widget.after_cancel(self._job)
+            except Exception:
+                pass   # 視窗已經關掉
+            self._job = None
+
+    def _check(self):
+        panels = dict(self.session.panels)
+        for role in set(self.seen) - set(panels):
+            del self.seen[role]
+        self.reported.intersection_update(panels)
+        recovered = []
+        for role, link in panels.items():
+            dropped = link.dropped
+            last = self.seen.get(role)
+            self.seen[role] = (link, dropped)
+            if last is None or last[0] is not link:
+                self.reported.discard(role)
+            elif dropped != last[1]:
+                if role not in self.reported:
+                    self.reported.add(role)
+                    text = f"Panel '{role}' ({link.port}) is not keeping up: commands dropped, the panel is out of date"
+                    print("WARN: " + text)
+                    self.report(text)
+            elif role in self.reported and link.caught_up():
+                recovered.append(role)
+        if recovered:
+            self.reported.difference_update(recovered)
+            print("Panel link caught up, resending the current state: " + ", ".join(recovered))
+            if not self.reported:
+                self.report("")
+            if self.redraw is not None:
+                self.redraw()
+        self._job = self.widget.after(self.interval_ms, self._check)
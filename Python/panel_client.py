@@ -0,0 +1,123 @@
+# 面板常駐服務（panel_daemon.py）的用戶端
+# DaemonPort 提供 serial.Serial 相容的最小介面，GUI 不用改寫就能透過本機 socket 送指令；
+# 實體 COM port 由常駐服務一直開著，重開 GUI 不會讓板子重開機、面板也不會閃。
+import os
+import socket
+from threading import Lock
+
+import serial
+
+DAEMON_HOST = "127.0.0.1"
+DAEMON_PORT = int(os.environ.get("MAPLE_DAEMON_PORT", "47800"))
+
+
+class DaemonError(serial.SerialException):
+    pass
+
+
+class DaemonPort:
+    # 回覆（ACK）由常駐服務那端的 SerialSender 處理
+    handles_ack = True
+
+    def __init__(self, port, baudrate=500000, stopbits=serial.STOPBITS_TWO, wait_ack=False, address=None):
+        self.port = port
+        self.timeout = 0
+        self.in_waiting = 0
+        self.out_waiting = 0
+        self._lock = Lock()
+        self.sock = socket.create_connection(address or (DAEMON_HOST, DAEMON_PORT), timeout=0.5)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.settimeout(10)
+        self._reader = self.sock.makefile("rb")
+        reply = self.request(f"OPEN {port} {baudrate} {stopbits} {int(bool(wait_ack))}")
+        if not reply.startswith("OK"):
+            self.sock.close()
+            raise DaemonError(reply)
+        # FRESH：服務這次才打開實體埠（板子會重開機）；ATTACHED：沿用已開著的埠
+        self.fresh = reply == "OK FRESH"
+        self.is_open = True
+
+    # 送一行指令並讀回一行回覆
+    def request(self, line: str, payload: bytes = b"") -> str:
+        with self._lock:
+            self.sock.sendall(line.encode("utf-8") + b"\n" + payload)
+            return self._reader.readline().decode("utf-8").strip()
+
+    # 讀取帶長度的回覆內容（STATE）
+    def _request_blob(self, line: str) -> bytes:
+        with self._lock:
+            self.sock.sendall(line.encode("utf-8") + b"\n")
+            header = self._reader.readline().decode("utf-8").split()
+            if len(header) != 2 or header[0] != "OK":
+                raise DaemonError(" ".join(header))
+            return self._reader.read(int(header[1]))
+
+    # SEND 沒有回覆；服務不見了就當埠已關閉（不讓例外跑進 Tk 的 callback）
+    def write(self, data) -> int:
+        data = bytes(data)
+        try:
+            with self._lock:
+                self.sock.sendall(f"SEND {self.port} {len(data)}\n".encode("utf-8") + data)
+        except OSError as e:
+            if self.is_open:
+                print(f"WARN: panel daemon connection lost ({self.port}): {e}")
+            self.is_open = False
+            return 0
+        return len(data)
+
+    # 面板回覆不轉送給用戶端
+    def read(self, size=1) -> bytes:
+        return b""
+
+    def read_until(self, expected=b"\n", size=None) -> bytes:
+        return b""
+
+    def readinto(self, buffer) -> int:
+        return 0
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        pass
+
+    def reset_output_buffer(self):
+        pass
+
+    # 等服務端佇列送完
+    def sync(self):
+        return self.request(f"SYNC {self.port}") == "OK"
+
+    # 目前面板狀態：上次 X 之後送過的指令
+    def state(self) -> bytes:
+        return self._request_blob(f"STATE {self.port}")
+
+    # 用戶端離開；實體埠留給服務繼續開著
+    def close(self):
+        if not getattr(self, "is_open", False):
+            return
+        self.is_open = False
+        try:
+            self.request(f"RELEASE {self.port}")
+        except OSError:
+            pass
+        self.sock.close()
+
+
+# 常駐服務有在跑就回傳 DaemonPort，否則 None（MAPLE_DAEMON=off 可停用）
+def openPanelPort(port, baudrate=500000, stopbits=serial.STOPBITS_TWO, wait_ack=False, address=None):
+    if os.environ.get("MAPLE_DAEMON", "").lower() in ("off", "0", "no"):
+        return None
+    try:
+        return DaemonPort(port, baudrate, stopbits, wait_ack, address)
+    except OSError:
+        return None
+
+
+# 優先透過常駐服務，沒有就直接開實體埠（給直接用 serial.Serial 的舊 GUI）
+def openSerialPort(port, baudrate, stopbits=serial.STOPBITS_TWO, wait_ack=False):
+    connection = openPanelPort(port, baudrate, stopbits, wait_ack)
+    if connection is None:
+        connection = serial.Serial(port, baudrate, timeout=0, stopbits=stopbits)
+        connection.fresh = True
+    return connection
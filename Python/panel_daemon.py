@@ -0,0 +1,251 @@
+# 面板常駐服務：一直開著 COM port 與面板狀態，GUI / CLI 透過本機 socket 連進來。
+# 開 COM port 會讓 Arduino 類的板子重開機（所以 Maple-SerialDilution 要先 sleep 2 秒），
+# 由服務持有埠之後，切換工具或重開 GUI 只要幾毫秒，面板也不會被清空。
+#
+# 啟動：python panel_daemon.py serve
+# 其他：python panel_daemon.py ports | send COM3 "<A,1,X,empty>" | state COM3 | stop
+#
+# 協定（每行一個指令，UTF-8）：
+#   OPEN <port> <baud> <stopbits> <ack 0/1>  -> OK FRESH | OK ATTACHED | ERR ...
+#       埠已開著時沿用第一個開的人的設定，設定不同回 ERR；baud 為 0 表示沿用（沒開著就用預設值開）
+#   SEND <port> <n>\n<n bytes>                -> （成功失敗都不回覆，可連續送；失敗記在服務端）
+#   SYNC <port>                               -> OK（佇列送完後）
+#   STATE <port>                              -> OK <n>\n<n bytes>（上次 X 之後的指令）
+#   RELEASE <port>                            -> OK（用戶端離開，埠繼續開著）
+#   CLOSE <port>                              -> OK（真的關閉實體埠）
+#   PORTS                                     -> OK <port,port,...>
+#   SHUTDOWN                                  -> OK
+import argparse
+import socketserver
+import sys
+from threading import Lock, Thread
+
+import serial
+
+from maple_serial import get_available_ports, SerialConnection, SerialSender
+from panel_client import DAEMON_HOST, DAEMON_PORT, DaemonPort
+from link_pacing import LinkPacer
+
+# 面板狀態最多保留幾筆指令
+STATE_LIMIT = 4096
+
+
+# 單一實體埠：連線、背景 sender、目前面板狀態
+class PanelPort:
+    def __init__(self, name):
+        self.name = name
+        self.conn = SerialConnection(use_daemon=False)
+        self.sender = None
+        self.frames = []  # 上次 X 之後送過的指令
+        self.settings = None  # 第一個開的人的 (baudrate, stopbits, wait_ack)
+        self.clients = 0
+        self.lock = Lock()
+
+    # 記錄面板狀態：X 會清空面板，之前的指令就不用留
+    def record(self, data: bytes):
+        for frame in data.split(b">"):
+            start = frame.rfind(b"<")
+            if start < 0:
+                continue
+            frame = frame[start:] + b">"
+            fields = frame[1:-1].split(b",")
+            if len(fields) > 2 and fields[2].strip() == b"X":
+                self.frames.clear()
+            else:
+                self.frames.append(frame)
+        if len(self.frames) > STATE_LIMIT:
+            del self.frames[:-STATE_LIMIT]
+
+
+class PanelDaemon:
+    def __init__(self, address=(DAEMON_HOST, DAEMON_PORT)):
+        self.address = address
+        self.ports = {}
+        self._lock = Lock()
+        self.server = None
+
+    # 開啟（或沿用）實體埠；回傳是否為這次新開
+    # 已開著的埠不改設定（別的用戶端正在用），設定不同就拒絕；baudrate=0 表示沿用
+    def open(self, name, baudrate, stopbits, wait_ack) -> bool:
+        with self._lock:
+            port = self.ports.get(name)
+            if port is None:
+                port = self.ports[name] = PanelPort(name)
+        with port.lock:
+            if port.conn.connection is not None and port.conn.connection.is_open:
+                if baudrate and port.settings != (baudrate, stopbits, wait_ack):
+                    raise serial.SerialException(
+                        f"{name} is open at {port.settings[0]} baud, stopbits {port.settings[1]}, "
+                        f"ack {int(port.settings[2])}")
+                port.clients += 1
+                return False
+            if not baudrate:
+                baudrate, stopbits, wait_ack = 500000, serial.STOPBITS_TWO, False
+            if not port.conn.connect(name, baudrate, stopbits):
+                raise serial.SerialException(f"cannot open {name}")
+            port.clients += 1
+            port.settings = (baudrate, stopbits, wait_ack)
+            port.sender = SerialSender(port.conn, inter_delay=0.002, wait_ack=wait_ack,
+                                       ack_token=b"<ACK>", ack_timeout=0.5,
+                                       pacer=LinkPacer(baudrate, stopbits))
+            port.sender.start()
+            port.frames.clear()
+            print(f"Opened {name} at {baudrate} baud")
+            return True
+
+    def _port(self, name) -> PanelPort:
+        port = self.ports.get(name)
+        if port is None or port.sender is None:
+            raise serial.SerialException(f"{name} is not open")
+        return port
+
+    def send(self, name, data: bytes):
+        port = self._port(name)
+        with port.lock:
+            port.record(data)
+        # 用戶端執行緒可以等一下（背壓）；仍然滿就丟掉，sender 會印警告
+        port.sender.send(data, timeout=1.0)
+
+    def sync(self, name):
+        self._port(name).sender.q.join()
+
+    def state(self, name) -> bytes:
+        port = self._port(name)
+        with port.lock:
+            return b"".join(port.frames)
+
+    def release(self, name):
+        port = self.ports.get(name)
+        if port is not None:
+            with port.lock:
+                port.clients = max(0, port.clients - 1)
+
+    def close(self, name):
+        with self._lock:
+            port = self.ports.pop(name, None)
+        if port is None or port.sender is None:
+            return
+        port.sender.q.join()
+        port.sender.stop()
+        port.conn.close()
+        print(f"Closed {name}")
+
+    def serve_forever(self):
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                daemon.handle_client(self.rfile, self.wfile)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = False
+        socketserver.ThreadingTCPServer.daemon_threads = True
+        self.server = socketserver.ThreadingTCPServer(self.address, Handler)
+        print(f"Panel daemon listening on {self.address[0]}:{self.address[1]}")
+        try:
+            self.server.serve_forever()
+        finally:
+            for name in list(self.ports):
+                self.close(name)
+            self.server.server_close()
+
+    def shutdown(self):
+        if self.server is not None:
+            Thread(target=self.server.shutdown, daemon=True).start()
+
+    # 單一用戶端連線的指令迴圈
+    def handle_client(self, rfile, wfile):
+        opened = []
+        try:
+            for raw in rfile:
+                parts = raw.decode("utf-8").split()
+                if not parts:
+                    continue
+                command, args = parts[0].upper(), parts[1:]
+                try:
+                    if command == "SEND":
+                        # 用戶端不讀 SEND 的回覆：失敗也不回，免得變成下一個請求的回覆
+                        try:
+                            self.send(args[0], rfile.read(int(args[1])))
+                        except (IndexError, ValueError, serial.SerialException) as e:
+                            print(f"WARN: SEND {' '.join(args)} failed: {e}")
+                        continue
+                    if command == "OPEN":
+                        stopbits = float(args[2])
+                        fresh = self.open(args[0], int(args[1]), int(stopbits) if stopbits.is_integer() else stopbits,
+                                          args[3] == "1")
+                        opened.append(args[0])
+                        reply = b"OK FRESH\n" if fresh else b"OK ATTACHED\n"
+                    elif command == "SYNC":
+                        self.sync(args[0])
+                        reply = b"OK\n"
+                    elif command == "STATE":
+                        blob = self.state(args[0])
+                        reply = f"OK {len(blob)}\n".encode("utf-8") + blob
+                    elif command == "RELEASE":
+                        self.release(args[0])
+                        if args[0] in opened:
+                            opened.remove(args[0])
+                        reply = b"OK\n"
+                    elif command == "CLOSE":
+                        self.close(args[0])
+                        reply = b"OK\n"
+                    elif command == "PORTS":
+                        reply = ("OK " + ",".join(get_available_ports()) + "\n").encode("utf-8")
+                    elif command == "SHUTDOWN":
+                        wfile.write(b"OK\n")
+                        self.shutdown()
+                        return
+                    else:
+                        reply = b"ERR unknown command\n"
+                except (IndexError, ValueError, serial.SerialException) as e:
+                    reply = f"ERR {e}\n".encode("utf-8")
+                wfile.write(reply)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            # 用戶端斷線（例如 GUI 當掉）也要把計數扣回來
+            for name in opened:
+                self.release(name)
+
+
+# 不經 DaemonPort OPEN 的簡單請求（ports / stop）
+def _simple_request(line):
+    import socket
+    with socket.create_connection((DAEMON_HOST, DAEMON_PORT), timeout=2) as sock:
+        sock.sendall(line.encode("utf-8") + b"\n")
+        return sock.makefile("rb").readline().decode("utf-8").strip()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="M.A.P.L.E. panel daemon")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("serve", help="run the daemon (default)")
+    sub.add_parser("ports", help="list serial ports seen by the daemon")
+    sub.add_parser("stop", help="stop the running daemon")
+    send = sub.add_parser("send", help="send one frame, e.g. \"<A,1,X,empty>\"")
+    send.add_argument("port")
+    send.add_argument("frame")
+    send.add_argument("--baud", type=int, default=0, help="default: the open port's settings, else 500000")
+    state = sub.add_parser("state", help="print the frames currently lit on a panel")
+    state.add_argument("port")
+    state.add_argument("--baud", type=int, default=0, help="default: the open port's settings, else 500000")
+    args = parser.parse_args(argv)
+
+    if args.command in (None, "serve"):
+        PanelDaemon().serve_forever()
+    elif args.command in ("ports", "stop"):
+        print(_simple_request("PORTS" if args.command == "ports" else "SHUTDOWN"))
+    else:
+        client = DaemonPort(args.port, args.baud)
+        try:
+            if args.command == "send":
+                client.write(args.frame.encode("us-ascii"))
+                client.sync()
+            else:
+                sys.stdout.write(client.state().decode("us-ascii", "replace") + "\n")
+        finally:
+            client.close()
+
+
+if __name__ == '__main__':
+    main()
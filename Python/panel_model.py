@@ -0,0 +1,221 @@
+# 面板 LED 狀態模型：照 LightGuide_Gen2_96 韌體的解析規則套用指令，
+# 模擬面板（panel_sim）與畫面上的面板鏡像（plate_mirror）共用同一份邏輯。
+from plate_layout import PLATE_DENSITIES
+
+BLACK = (0, 0, 0)
+# 韌體的步驟程式槽數（step n 放在 n % PROGRAM_SLOTS）
+PROGRAM_SLOTS = 16
+
+
+def _clamp8(v):
+    return max(0, min(255, v))
+
+
+# C 的 strtol / atoi：讀開頭的數字，讀不到回 default
+def _leading_int(text, default):
+    text = text.strip()
+    end = 1 if text[:1] in ("-", "+") else 0
+    while end < len(text) and text[end].isdigit():
+        end += 1
+    try:
+        return int(text[:end])
+    except ValueError:
+        return default
+
+
+# 拆解 '<' '>' 之間的內容（對應 parseData；strtok 會略過空欄位）
+def parseFrame(text):
+    fields = [f for f in text.split(",") if f != ""]
+    row_letter = fields[0] if len(fields) > 0 else ""
+    column = _leading_int(fields[1], 0) if len(fields) > 1 else 0
+    cmd = fields[2] if len(fields) > 2 else ""
+    note = fields[3] if len(fields) > 3 else ""
+    rgb = [_leading_int(f, -1) for f in fields[4:7]] + [-1] * (3 - len(fields[4:7]))
+    bri = _leading_int(fields[7], -1) if len(fields) > 7 else -1
+    row = ord(row_letter[0]) - 65 if row_letter and "A" <= row_letter[0] <= "Z" else -1
+    return row_letter, row, column, cmd, note, rgb, bri
+
+
+# 指令內容（bytes 或 str，可含 '<' '>'）-> '<' '>' 之間的文字
+def frameText(frame):
+    if isinstance(frame, (bytes, bytearray, memoryview)):
+        frame = bytes(frame).decode("ascii", "replace")
+    start = frame.rfind("<", 0, frame.rfind(">") if ">" in frame else len(frame))
+    end = frame.find(">", start + 1)
+    return frame[start + 1:end if end >= 0 else len(frame)]
+
+
+class PanelModel:
+    """
+    leds：row-major 的 (R, G, B) 清單，(0, 0, 0) 為不亮；bright 為全域亮度（L 指令）。
+    dirty：上次 take_dirty() 之後有變化的孔位 index。
+    program / step：步驟程式（PS / PG / PX 指令與單一 byte 的 '+' '-'）。
+    """
+    def __init__(self, density=96, rows=None, columns=None):
+        if rows is None:
+            rows, columns = PLATE_DENSITIES[density]
+        self.rows = rows
+        self.columns = columns
+        self.leds = [BLACK] * (rows * columns)
+        self.colour = (0, 0, 255)
+        self.bright = 255
+        self.dirty = set()
+        self.program = {}   # 槽 -> (step 編號, bits, (R, G, B))
+        self.step = -1
+        self._frame_colour = None
+
+    def _set(self, index, rgb):
+        if self.leds[index] != rgb:
+            self.leds[index] = rgb
+            self.dirty.add(index)
+
+    def _clear(self):
+        for i, rgb in enumerate(self.leds):
+            if rgb != BLACK:
+                self.leds[i] = BLACK
+                self.dirty.add(i)
+
+    def take_dirty(self):
+        dirty, self.dirty = self.dirty, set()
+        return dirty
+
+    # 顯示用顏色（已乘上亮度）
+    def shown(self, index):
+        scale = self.bright / 255
+        return tuple(round(v * scale) for v in self.leds[index])
+
+    # 套用一個指令；回傳 (是否成功, 韌體會印出的訊息)
+    def apply(self, frame):
+        row_letter, row, column, cmd, note, rgb, bri = parseFrame(frameText(frame))
+        out = []
+        self._frame_colour = tuple(_clamp8(v) for v in rgb) if min(rgb) >= 0 else None
+        # PS 的顏色跟著步驟存起來，不改目前顏色
+        if self._frame_colour is not None and cmd != "PS":
+            self.colour = self._frame_colour
+            out.append("Color set to R=%u G=%u B=%u\r\n" % self.colour)
+        if cmd == "L" and bri >= 0:
+            if self.bright != _clamp8(bri):
+                # 亮度改變：所有亮著的孔位都要重畫
+                self.dirty.update(i for i, v in enumerate(self.leds) if v != BLACK)
+            self.bright = _clamp8(bri)
+        out.append(f"Command:{cmd}, Address:{row_letter}{column}, ")
+        ok = self._execute(cmd, row, column, note, out)
+        return ok, out
+
+    def _execute(self, cmd, row, column, note, out) -> bool:
+        rows, columns = self.rows, self.columns
+        valid_row = 0 <= row < rows
+        valid_column = 1 <= column <= columns
+        if cmd == "X":
+            self._clear()
+            out.append("Display cleared.\r\n")
+        elif cmd in ("C", "CC"):
+            if not valid_column:
+                out.append(f"Column: {column} over range!\r\n")
+            else:
+                out.append(("Column:" if cmd == "C" else "Clearing column:") + f"{column}\r\n")
+                for r in range(rows):
+                    self._set(r * columns + column - 1, self.colour if cmd == "C" else BLACK)
+        elif cmd in ("R", "CR"):
+            if not valid_row:
+                out.append(f"Row: {chr(row + 66)} over range!\r\n")
+            else:
+                out.append(("Row:" if cmd == "R" else "Clearing row:") + f"{row}\r\n")
+                for c in range(columns):
+                    self._set(row * columns + c, self.colour if cmd == "R" else BLACK)
+        elif cmd == "S":
+            if not (valid_row and valid_column):
+                out.append(f"Pixel #: {chr(row + 65)},{column} over range!\r\n")
+            else:
+                pixel = row * columns + column - 1
+                out.append(f"Pixel #:{pixel}\r\n")
+                self._set(pixel, self.colour)
+        elif cmd == "U":
+            out.append("LED Updated\r\n")
+        elif cmd == "T":
+            out.append("ALL LED test start!!\r\nALL LED off!!\r\n")
+        elif cmd == "L":
+            out.append(f"Brightness set to {self.bright}\r\n")
+        elif cmd == "RST":
+            self._clear()
+            out.append("<ACK>\r\nRestarting...\r\n")
+        elif cmd == "PS":
+            bits = self._mask_bits(note)
+            if column < 0 or bits is None:
+                return False
+            self.program[column % PROGRAM_SLOTS] = (column, bits, self._frame_colour or self.colour)
+        elif cmd == "PG":
+            return self._show_step(column, out)
+        elif cmd == "PX":
+            self.program.clear()
+            self.step = -1
+            out.append("Program cleared.\r\n")
+        elif cmd in ("M", "MA"):
+            bits = self._mask_bits(note, column)
+            if bits is None:
+                return False
+            if cmd == "M":
+                for i in range(rows * columns):
+                    self._set(i, self.colour if bits >> i & 1 else BLACK)
+            else:
+                for i in range(rows * columns):
+                    if bits >> i & 1:
+                        self._set(i, self.colour)
+        else:
+            out.append("ERROR Appropriate value not received.\r\n")
+            return False
+        return True
+
+    def _show_step(self, number, out) -> bool:
+        stored = self.program.get(number % PROGRAM_SLOTS) if number >= 0 else None
+        if stored is None or stored[0] != number:
+            out.append(f"<MISS:{number}>\r\n")
+            return False
+        _number, bits, rgb = stored
+        for i in range(self.rows * self.columns):
+            self._set(i, rgb if bits >> i & 1 else BLACK)
+        self.step = number
+        out.append(f"<STEP:{number}>\r\n")
+        return True
+
+    # 單一 byte 的 '+' / '-'：回傳韌體會印出的訊息
+    def advance(self, delta):
+        out = []
+        if self.step < 0:
+            out.append("<MISS:-1>\r\n")
+        else:
+            self._show_step(self.step + delta, out)
+        return out
+
+    # first：M / MA 的分段遮罩從第幾個 byte 開始（1 起算，一段可以比整片短）；None 時要整片（PS）
+    def _mask_bits(self, note, first=None):
+        nbytes = (self.rows * self.columns + 7) // 8
+        try:
+            mask = bytes.fromhex(note)
+        except ValueError:
+            return None
+        if first is None:
+            if len(mask) != nbytes:
+                return None
+            first = 1
+        elif first < 1 or not mask or first - 1 + len(mask) > nbytes:
+            return None
+        return int.from_bytes(mask, "little") << 8 * (first - 1)
+
+    # 指令會點亮或清除哪些孔位（不改變狀態；給鏡像標示送出中的指令）
+    def touched(self, frame):
+        _letter, row, column, cmd, note, _rgb, _bri = parseFrame(frameText(frame))
+        rows, columns = self.rows, self.columns
+        if cmd in ("X", "RST"):
+            return range(rows * columns)
+        if cmd in ("C", "CC") and 1 <= column <= columns:
+            return [r * columns + column - 1 for r in range(rows)]
+        if cmd in ("R", "CR") and 0 <= row < rows:
+            return range(row * columns, (row + 1) * columns)
+        if cmd == "S" and 0 <= row < rows and 1 <= column <= columns:
+            return [row * columns + column - 1]
+        if cmd in ("M", "MA"):
+            bits = self._mask_bits(note, column)
+            if bits is not None:
+                return [i for i in range(rows * columns) if bits >> i & 1]
+        return []
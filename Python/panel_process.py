@@ -0,0 +1,364 @@
+# 獨立行程的面板寫入：SerialSender（pacing、等 ACK、回覆解析）整個搬到子行程執行，
+# GUI 行程的 GC、pt.redraw()、pd.read_csv 佔住 GIL 時，指令送出與 ACK 處理都不受影響。
+# 兩個行程之間用 multiprocessing.shared_memory 上的單一生產者 / 單一消費者環形緩衝傳遞：
+#   指令環（GUI -> 子行程）：F 排隊送出的指令、W 直接寫出的 byte（步驟程式的 '+' '-'）、Q 送完後結束
+#   事件環（子行程 -> GUI）：H 開埠結果、S 指令狀態（sent / acked / failed / dropped）、
+#                           E <STEP:n> / <MISS:n>、L 韌體訊息、M 合併寫出統計（閒下來時）、X 子行程已結束
+# 生產者只寫 head、消費者只寫 tail；兩邊讀寫 head / tail 時拿同一個跨行程的鎖，當作記憶體屏障
+# （同一行程內多個執行緒寫入時另由呼叫端加鎖）。
+# 啟用方式：MAPLE_WRITER=process（或 Session.connect(..., writer="process")）。
+import json
+import multiprocessing
+import struct
+import time
+from multiprocessing import shared_memory
+from threading import Thread, Event, Lock
+
+from maple_serial import SerialConnection, SerialSender, ReplyParser, metricsSummary
+from link_pacing import LinkPacer
+
+RING_BYTES = 1 << 16          # 指令環（約 1500 個 40 字元的指令）
+EVENT_RING_BYTES = 1 << 18    # 事件環（含韌體訊息）
+START_TIMEOUT = 15.0          # 子行程啟動 + 開埠 + 校正的上限（秒）
+STOP_TIMEOUT = 10.0           # 結束時等子行程送完佇列的上限（秒）
+IDLE_SLEEP = 0.0005           # 環是空的時候輪詢間隔（秒）
+
+STATES = ("pending", "sent", "acked", "failed", "dropped")
+
+# 共享記憶體開頭：head、tail 各占一條 cache line，容量放在 head 那條
+_HEAD = 0
+_SIZE = 8
+_TAIL = 64
+_DATA = 128
+_U64 = struct.Struct("<Q")
+_U32 = struct.Struct("<I")
+_STATE = struct.Struct("<Bd")
+_HELLO = struct.Struct("<??")
+
+
+class FrameRing:
+    """
+    SPSC 環形緩衝：每筆 = 4 bytes 長度 + 內容，head / tail 是不回捲的 byte 計數。
+    生產者先寫內容再更新 head，消費者先讀內容再更新 tail。head / tail 只在 lock 裡讀寫：
+    鎖的取得與釋放在任何 CPU 上都是完整的記憶體屏障，ARM64 這種會把儲存重排的機器上，
+    消費者也不會先看到新的 head、後看到內容。內容的複製不在鎖裡，兩邊只各等一次短短的計數更新。
+    name=None 時建立（擁有者負責 unlink），否則接上已存在的；lock 要是建立端的那一個
+    （multiprocessing 的 Lock，隨 Process 的參數傳給子行程）。
+    """
+    def __init__(self, name=None, size=RING_BYTES, lock=None):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=_DATA + size)
+            self.owner = True
+            self.shm.buf[:_DATA] = bytes(_DATA)
+            _U64.pack_into(self.shm.buf, _SIZE, size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.name = self.shm.name
+        self.buf = self.shm.buf
+        self.lock = lock if lock is not None else multiprocessing.get_context("spawn").Lock()
+        self.size = _U64.unpack_from(self.buf, _SIZE)[0]
+
+    def _copy_in(self, pos, data):
+        start = pos % self.size
+        first = min(len(data), self.size - start)
+        self.buf[_DATA + start:_DATA + start + first] = data[:first]
+        if first < len(data):
+            self.buf[_DATA:_DATA + len(data) - first] = data[first:]
+
+    def _copy_out(self, pos, length) -> bytes:
+        start = pos % self.size
+        first = min(length, self.size - start)
+        data = bytes(self.buf[_DATA + start:_DATA + start + first])
+        if first < length:
+            data += bytes(self.buf[_DATA:_DATA + length - first])
+        return data
+
+    # 放不下回 False（不等待）
+    def push(self, data) -> bool:
+        with self.lock:
+            head = _U64.unpack_from(self.buf, _HEAD)[0]
+            tail = _U64.unpack_from(self.buf, _TAIL)[0]
+        need = 4 + len(data)
+        if need > self.size - (head - tail):
+            return False
+        self._copy_in(head, _U32.pack(len(data)))
+        self._copy_in(head + 4, data)
+        with self.lock:
+            _U64.pack_into(self.buf, _HEAD, head + need)
+        return True
+
+    # 空的回 None
+    def pop(self):
+        with self.lock:
+            tail = _U64.unpack_from(self.buf, _TAIL)[0]
+            head = _U64.unpack_from(self.buf, _HEAD)[0]
+        if head == tail:
+            return None
+        length = _U32.unpack(self._copy_out(tail, 4))[0]
+        data = self._copy_out(tail + 4, length)
+        with self.lock:
+            _U64.pack_into(self.buf, _TAIL, tail + 4 + length)
+        return data
+
+    def used(self) -> int:
+        with self.lock:
+            return _U64.unpack_from(self.buf, _HEAD)[0] - _U64.unpack_from(self.buf, _TAIL)[0]
+
+    def close(self):
+        self.buf = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+# 等到放得進去或逾時
+def _push_wait(ring, data, timeout, stop_evt=None) -> bool:
+    deadline = time.perf_counter() + timeout
+    while not ring.push(data):
+        if time.perf_counter() >= deadline or (stop_evt is not None and stop_evt.is_set()):
+            return False
+        time.sleep(IDLE_SLEEP)
+    return True
+
+
+# ---- 子行程 ----
+
+def _writerMain(command_name, command_lock, event_name, event_lock, port, baudrate, stopbits, wait_ack,
+                inter_delay, ack_timeout, pacing, connection_class):
+    commands = FrameRing(command_name, lock=command_lock)
+    events = FrameRing(event_name, lock=event_lock)
+    lock = Lock()  # 子行程裡主執行緒與 sender 執行緒都會寫事件環
+
+    def emit(message, timeout=1.0):
+        with lock:
+            return _push_wait(events, message, timeout)
+
+    conn = connection_class()
+    if not conn.connect(port, baudrate, stopbits, wait_ack=wait_ack):
+        emit(b"H" + _HELLO.pack(False, True))
+        emit(b"X")
+        commands.close()
+        events.close()
+        return
+    pacer = None
+    if pacing and not getattr(conn.connection, "handles_ack", False):
+        pacer = LinkPacer(baudrate, stopbits, inter_delay, ack_timeout)
+    sender = SerialSender(conn, inter_delay=inter_delay, wait_ack=wait_ack, ack_token=b"<ACK>",
+                          ack_timeout=ack_timeout, pacer=pacer)
+    # 韌體訊息事件環滿了就丟掉，不拖住送出
+    sender.parser.on_log = lambda text: emit(b"L" + text.encode("utf-8", "replace"), timeout=0)
+
+    def on_frame(state, payload, stamp):
+        if state != "pending":
+            emit(b"S" + _STATE.pack(STATES.index(state), stamp) + payload)
+    sender.listeners.append(on_frame)
+    sender.start()
+    emit(b"H" + _HELLO.pack(True, bool(conn.fresh)))
+
+    parent = multiprocessing.parent_process()
+    idle_since = time.perf_counter()
+    reported = 0
+    try:
+        while True:
+            while sender.parser.events:
+                kind, detail = sender.parser.events.popleft()
+                emit(b"E" + f"{kind}:{detail}".encode("ascii", "replace"))
+            message = commands.pop()
+            if message is None:
+                # GUI 行程不見了（當掉或被砍）就自己收掉
+                if parent is not None and not parent.is_alive():
+                    break
+                if sender.frames != reported and not sender.pending():
+                    reported = sender.frames
+                    emit(b"M" + json.dumps(sender.metrics()).encode("ascii"), timeout=0)
+                now = time.perf_counter()
+                time.sleep(IDLE_SLEEP if now - idle_since < 1.0 else 0.002)
+                continue
+            idle_since = time.perf_counter()
+            kind = message[:1]
+            if kind == b"F":
+                # 子行程不是 Tk 執行緒，可以等（背壓傳回指令環，GUI 那邊環滿就會知道）
+                sender.send(message[1:], timeout=1.0)
+            elif kind == b"W":
+                conn.write(message[1:])
+            elif kind == b"Q":
+                break
+        # 同 onClosing：佇列裡的指令送完才關埠
+        deadline = time.perf_counter() + STOP_TIMEOUT
+        while sender.pending() and sender.alive() and time.perf_counter() < deadline:
+            time.sleep(0.005)
+    finally:
+        sender.stop()
+        conn.close()
+        emit(b"M" + json.dumps(sender.metrics()).encode("ascii"))
+        emit(b"X")
+        commands.close()
+        events.close()
+
+
+# ---- GUI 行程 ----
+
+class ProcessSender:
+    """
+    介面同 SerialSender（send / listeners / parser / wait_ack / pending / alive / stop），
+    PanelLink 與鏡像、步驟程式不用分辨寫入在哪個行程。
+    listeners 在事件讀取執行緒上呼叫，時間戳為子行程的 perf_counter（兩個行程共用同一個單調時鐘）。
+    parser 只用來收子行程轉回來的 events（STEP / MISS）與 device_log。
+    """
+    def __init__(self, port, baudrate=500000, stopbits=2, wait_ack=False, inter_delay=0.002,
+                 ack_timeout=0.5, pacing=True, connection_class=SerialConnection,
+                 ring_bytes=RING_BYTES):
+        self.port = port
+        self.wait_ack = wait_ack
+        self.listeners = []
+        self.parser = ReplyParser()
+        self.dropped = 0             # 同 SerialSender：因環（或子行程佇列）滿被丟掉的指令數
+        self.fresh = True
+        self.commands = FrameRing(size=ring_bytes)
+        self.events = FrameRing(size=EVENT_RING_BYTES)
+        self._done_states = ("acked", "failed", "dropped") if wait_ack else ("sent", "dropped")
+        self._pending = 0
+        self._lock = Lock()          # 好幾個執行緒（Tk、排程器）都會寫指令環
+        self._hello = Event()
+        self._exited = Event()
+        self._ok = False
+        self._metrics = {}           # 子行程最近一次回報的合併寫出統計
+        context = multiprocessing.get_context("spawn")
+        self.process = context.Process(
+            target=_writerMain, name=f"panel-writer-{port}", daemon=True,
+            args=(self.commands.name, self.commands.lock, self.events.name, self.events.lock, port, baudrate,
+                  stopbits, wait_ack, inter_delay, ack_timeout, pacing, connection_class))
+        self.thread = Thread(target=self._read_events, daemon=True)
+
+    # 啟動子行程並等它開好埠；失敗回 False（資源已釋放）
+    def start(self) -> bool:
+        self.process.start()
+        self.thread.start()
+        if not self._hello.wait(START_TIMEOUT) or not self._ok:
+            print(f"Connect fail: {self.port} (writer process)")
+            self.stop()
+            return False
+        return True
+
+    # 不等：環滿就回 False（不卡住 Tk）
+    def _push(self, message) -> bool:
+        with self._lock:
+            return self.commands.push(message)
+
+    # 放入指令環等待送出；環滿時丟掉該筆，dropped 加一
+    def send(self, payload: bytes) -> bool:
+        self._notify("pending", payload)
+        with self._lock:
+            self._pending += 1
+        if self._push(b"F" + payload):
+            return True
+        with self._lock:
+            self._pending -= 1
+        self.dropped += 1
+        if self.dropped == 1 or self.dropped % 100 == 0:
+            print(f"WARN: send queue full, {self.dropped} frame(s) dropped")
+        self._notify("dropped", payload)
+        return False
+
+    # 不排隊：子行程收到就直接寫出，不等子行程 sender 佇列裡還沒送的指令（同執行緒模式的 conn.write）；
+    # 要排在某個指令之後的話，呼叫端先等它的 sent 狀態（步驟程式就是這樣做）
+    def write(self, data: bytes):
+        if not self._push(b"W" + bytes(data)):
+            self.dropped += 1
+
+    def pending(self) -> int:
+        return self._pending
+
+    def alive(self) -> bool:
+        return self.process.is_alive() and not self._exited.is_set()
+
+    # 子行程最近一次回報（閒下來或結束時）的合併寫出統計，格式同 SerialSender.metrics()
+    def metrics(self) -> dict:
+        return dict(self._metrics)
+
+    def metrics_summary(self) -> str:
+        return metricsSummary(self._metrics)
+
+    def _notify(self, state, payload, stamp=None):
+        stamp = time.perf_counter() if stamp is None else stamp
+        for listener in list(self.listeners):
+            try:
+                listener(state, payload, stamp)
+            except Exception:
+                pass
+
+    def _read_events(self):
+        idle_since = time.perf_counter()
+        while True:
+            message = self.events.pop()
+            if message is None:
+                if self._exited.is_set() or not self.process.is_alive() and self.events.used() == 0:
+                    break
+                now = time.perf_counter()
+                time.sleep(IDLE_SLEEP if now - idle_since < 1.0 else 0.002)
+                continue
+            idle_since = time.perf_counter()
+            kind = message[:1]
+            if kind == b"S":
+                code, stamp = _STATE.unpack_from(message, 1)
+                state = STATES[code]
+                if state in self._done_states:
+                    with self._lock:
+                        self._pending = max(0, self._pending - 1)
+                if state == "dropped":
+                    self.dropped += 1
+                self._notify(state, message[1 + _STATE.size:], stamp)
+            elif kind == b"E":
+                event, _sep, detail = message[1:].decode("ascii", "replace").partition(":")
+                self.parser.events.append((event, detail))
+            elif kind == b"L":
+                self.parser.device_log.append((time.time(), message[1:].decode("utf-8", "replace")))
+            elif kind == b"M":
+                self._metrics = json.loads(message[1:])
+            elif kind == b"H":
+                self._ok, self.fresh = _HELLO.unpack_from(message, 1)
+                self._hello.set()
+            elif kind == b"X":
+                break
+        self._exited.set()
+        self._hello.set()
+
+    # 送完指令環與子行程佇列裡的指令後結束子行程，最後釋放共享記憶體
+    def stop(self):
+        if self.process.is_alive():
+            with self._lock:
+                _push_wait(self.commands, b"Q", STOP_TIMEOUT, self._exited)
+            self.process.join(STOP_TIMEOUT + 1)
+            if self.process.is_alive():
+                print(f"WARN: writer process for {self.port} did not stop; terminating it")
+                self.process.terminate()
+                self.process.join(1)
+        self._exited.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout=1)
+        self.commands.close()
+        self.events.close()
+
+
+# PanelLink.conn 的替身：實體埠在子行程裡
+class ProcessConnection:
+    def __init__(self, sender: ProcessSender):
+        self.sender = sender
+
+    @property
+    def fresh(self):
+        return self.sender.fresh
+
+    def write(self, data):
+        self.sender.write(data)
+
+    # 埠由子行程在 sender.stop() 時關閉
+    def close(self):
+        pass
@@ -0,0 +1,80 @@
+# LED 面板序列指令編碼（與 LightGuide_Gen2_96 韌體的 <ROW,COL,CMD,NOTE,R,G,B,BRIGHT> 格式對應）
+
+from plate_layout import PLATE_DENSITIES
+
+# LED板基本參數設定
+boxRow = 8 # 8 rows
+boxColumn = 12 # 12 columns
+# 各密度的遮罩長度：96 -> 24、384 -> 96、1536 -> 384 hex chars
+MASK_HEX_LENGTHS = {(r * c + 7) // 8 * 2 for r, c in PLATE_DENSITIES.values()}
+# 韌體 receivedCharArray 為 128 bytes（含結尾 '\0'），'<' '>' 之間最多 127 字元
+FRAME_MAX_CHARS = 127
+# 放不進一個指令的遮罩（1536 孔 384 hex chars）分段送，每段 48 bytes（96 hex chars，同 384 孔整片遮罩長度）
+MASK_PART_BYTES = 48
+
+
+# 夾住 0~255
+def _clamp8(v):
+    return int(max(0, min(255, v)))
+
+
+# 產生單一指令的 bytes（不送出）
+def encodeSerialCommand(command="S", s_row='A', s_col=1, textNote="empty", rgb=(0, 0, 255), bright=None) -> bytes:
+    """
+    L: <A,1,L,empty,0,0,0,BRIGHT>   只送一次（全域亮度）
+    M: <A,1,M,MASK_HEX,R,G,B>       遮罩內孔位一次設定顏色（遮罩外清成黑）
+    MA: <A,1,MA,MASK_HEX,R,G,B>     同 M，但保留遮罩外已亮的孔位（多色疊加）
+        M / MA 的 s_col 為 MASK_HEX 從遮罩第幾個 byte 開始（1 起算；分段遮罩，見 encodeMaskFrames）
+    S: <ROW,COL,S,NOTE,R,G,B>       逐孔位顏色（不帶亮度）
+    X: <A,1,X,empty>
+    """
+    # L:設定亮度指令處理
+    if command == "L":
+        if bright is None:
+            raise ValueError("sendSerialCommand(L): bright is required")
+        serialString = f"<A,1,L,empty,0,0,0,{_clamp8(bright)}>"
+    # M:LED陣列資料傳送指令處理
+    elif command in ("M", "MA"):
+        # textNote 這裡放 mask_hex（96 孔為 24 hex chars；從第 s_col 個 byte 開始的一段可以較短）
+        r, g, b = [_clamp8(v) for v in rgb]
+        mask_hex = textNote
+        first = int(s_col)
+        if first == 1:
+            if not isinstance(mask_hex, str) or len(mask_hex) not in MASK_HEX_LENGTHS:
+                raise ValueError("sendSerialCommand(M): mask_hex must be 24/96/384 hex chars")
+        elif first < 1 or not isinstance(mask_hex, str) or not mask_hex or len(mask_hex) % 2:
+            raise ValueError("sendSerialCommand(M): a mask part needs s_col >= 1 and whole bytes")
+        serialString = f"<A,{first},{command},{mask_hex.upper()},{r},{g},{b}>"
+        if len(serialString) - 2 > FRAME_MAX_CHARS:
+            raise ValueError("sendSerialCommand(M): frame exceeds the panel's 128-byte receive buffer")
+    # S:單孔位資料傳送指令處理
+    elif command == "S":
+        r, g, b = [_clamp8(v) for v in rgb]
+        serialString = f"<{s_row},{s_col},S,{textNote},{r},{g},{b}>"
+    # X:關閉面板指令處理
+    elif command == "X":
+        serialString = "<A,1,X,empty>"
+    # 其他指令不支援
+    else:
+        raise ValueError("Invalid parameters for sendSerialCommand()")
+    return serialString.encode("us-ascii")
+
+
+# 遮罩（bytes，LSB = A1）編成指令：放得進一個指令就一個 M（add=True 時 MA），
+# 否則每 MASK_PART_BYTES 一段，第一段 M（清掉整片）、其餘有亮孔的段用 MA 疊上
+def encodeMaskFrames(mask: bytes, rgb, add=False):
+    command = "MA" if add else "M"
+    try:
+        return [encodeSerialCommand(command, textNote=mask.hex().upper(), rgb=rgb)]
+    except ValueError:
+        if len(mask) <= MASK_PART_BYTES:
+            raise
+    frames = []
+    for start in range(0, len(mask), MASK_PART_BYTES):
+        part = mask[start:start + MASK_PART_BYTES]
+        if (frames or add) and not any(part):
+            continue
+        frames.append(encodeSerialCommand(command if not frames else "MA", s_col=start + 1,
+                                          textNote=part.hex().upper(), rgb=rgb))
+    return frames
+
@@ -0,0 +1,164 @@
+# 模擬面板：照 LightGuide_Gen2_96 韌體的解析規則回覆 <ACK> / <ERR:...> 與除錯訊息，
+# 提供 serial.Serial 相容的最小介面（write / read / readinto / in_waiting ...），
+# 沒有實體板子時可以拿來重播錄製檔、測試 sender 與編碼器。
+import time
+from collections import deque
+from threading import Lock
+
+from maple_serial import SerialConnection
+from panel_model import PanelModel, BLACK, parseFrame
+
+# 韌體 receivedCharArray 為 128 bytes，'<' '>' 之間超過 127 字元會被截斷
+RECEIVE_CHARS = 127
+
+
+class SimulatedPanel:
+    """
+    process_delay：每個指令處理完到回覆可讀的延遲（秒），模擬 MCU loop 與傳輸時間。
+    costs：各指令額外的處理時間 {opcode: 秒}（例如 M 要解 hex 再 show）。
+    指令依序處理，前一個還沒處理完，下一個的回覆就跟著往後延。
+    LED 狀態與指令解析在 self.model（panel_model.PanelModel）。
+    """
+    def __init__(self, density=96, port="SIM", baudrate=500000, process_delay=0.0, banner=False, costs=None):
+        self.model = PanelModel(density)
+        self.rows, self.columns = self.model.rows, self.model.columns
+        self.port = port
+        self.baudrate = baudrate
+        self.stopbits = 2
+        self.timeout = 0
+        self.out_waiting = 0
+        self.is_open = True
+        self.fresh = True
+        self.process_delay = process_delay
+        self.costs = costs or {}
+        self._busy_until = 0.0
+        self.frames_received = 0
+        self._receiving = False
+        self._chars = bytearray()
+        self._out = bytearray()
+        self._pending = deque()  # (可讀時間, bytes)
+        self._lock = Lock()
+        if banner:
+            self._reply(f"This device has {self.columns}X{self.rows}={self.rows * self.columns} RGBLED\r\n")
+
+    # ---- serial.Serial 相容介面 ----
+    def write(self, data) -> int:
+        data = bytes(data)
+        with self._lock:
+            for ch in data:
+                if self._receiving:
+                    if ch == 0x3E:  # '>'
+                        self._receiving = False
+                        self._command(self._chars.decode("ascii", "replace"))
+                        self._chars.clear()
+                    elif len(self._chars) < RECEIVE_CHARS:
+                        self._chars.append(ch)
+                    else:
+                        # 韌體會一直覆寫最後一格
+                        self._chars[-1] = ch
+                elif ch == 0x3C:  # '<'
+                    self._receiving = True
+                elif ch in (0x2B, 0x2D):  # '+' / '-'：步驟程式前進 / 後退
+                    out = self.model.advance(1 if ch == 0x2B else -1)
+                    self.model.dirty.clear()
+                    self._reply("".join(out))
+        return len(data)
+
+    @property
+    def in_waiting(self) -> int:
+        with self._lock:
+            self._release()
+            return len(self._out)
+
+    def read(self, size=1) -> bytes:
+        deadline = time.perf_counter() + (self.timeout or 0)
+        while True:
+            with self._lock:
+                self._release()
+                if self._out or time.perf_counter() >= deadline:
+                    data = bytes(self._out[:size])
+                    del self._out[:size]
+                    return data
+            time.sleep(0.0005)
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def read_until(self, expected=b"\n", size=None) -> bytes:
+        line = bytearray()
+        while size is None or len(line) < size:
+            ch = self.read(1)
+            if not ch:
+                break
+            line += ch
+            if line.endswith(expected):
+                break
+        return bytes(line)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        with self._lock:
+            self._out.clear()
+            self._pending.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+    # ---- 面板狀態 ----
+    # 亮著的孔位 {index: (R, G, B)}（已乘上亮度）
+    def lit(self):
+        model = self.model
+        return {i: model.shown(i) for i, rgb in enumerate(model.leds) if rgb != BLACK}
+
+    # 目前亮著孔位的 bitset（LSB = A1，與遮罩相同）
+    def lit_bits(self) -> int:
+        bits = 0
+        for i, rgb in enumerate(self.model.leds):
+            if rgb != BLACK:
+                bits |= 1 << i
+        return bits
+
+    # ---- 韌體行為 ----
+    def _reply(self, text: str, cost=0.0):
+        ready = max(time.perf_counter(), self._busy_until) + self.process_delay + cost
+        self._busy_until = ready
+        self._pending.append((ready, text.encode("ascii")))
+
+    def _release(self):
+        now = time.perf_counter()
+        while self._pending and self._pending[0][0] <= now:
+            self._out += self._pending.popleft()[1]
+
+    # 對應 parseData + displayParsedCommand + parseIlluminationCommand
+    def _command(self, text: str):
+        self.frames_received += 1
+        ok, out = self.model.apply(text)
+        self.model.dirty.clear()
+        out.append("<ACK>\r\n" if ok else "<ERR:BAD_CMD_OR_MASK>\r\n")
+        self._reply("".join(out), self.costs.get(parseFrame(text)[3], 0.0))
+
+
+# 開模擬面板而不是實體埠的 SerialConnection（給 IOCore(connection_class=...)，沒有板子時的壓力測試）
+class SimulatedConnection(SerialConnection):
+    density = 96
+    process_delay = 0.0
+
+    def __init__(self):
+        super().__init__(use_daemon=False)
+
+    def connect(self, port, baudrate=500000, stopbits=2, wait_ack=False):
+        if self.connection:
+            self.connection.close()
+        # 跟剛開的實體埠一樣：面板是暗的、先印開機訊息（sender 等它印完再校正）
+        self.connection = SimulatedPanel(self.density, port=port, baudrate=baudrate, process_delay=self.process_delay,
+                                         banner=True)
+        self.connection.stopbits = stopbits
+        self.fresh = True
+        return True
@@ -0,0 +1,90 @@
+# Microplate geometry shared by the GUIs: densities, row letters and line specs
+import string
+
+# plate density -> (rows, columns)
+PLATE_DENSITIES = {96: (8, 12), 384: (16, 24), 1536: (32, 48)}
+
+alphabet = list(string.ascii_uppercase)
+
+
+def plateDimensions(density):
+    try:
+        return PLATE_DENSITIES[int(density)]
+    except (KeyError, ValueError):
+        raise ValueError(f"Unsupported plate density: {density}")
+
+
+# accepts 96, "96" or the GUI label "96 well"
+def parseDensity(label):
+    return int(str(label).split()[0])
+
+
+# 0 -> A, 25 -> Z, 26 -> AA (1536 well plates run past Z)
+def rowName(rowIndex):
+    if rowIndex < 26:
+        return alphabet[rowIndex]
+    return alphabet[rowIndex // 26 - 1] + alphabet[rowIndex % 26]
+
+
+# A -> 0, AA -> 26; anything but one or two letters A-Z (a half-typed "A-", "AAA", "A1") is a ValueError
+def rowIndex(name):
+    letters = name.strip().upper()
+    if not 1 <= len(letters) <= 2 or any(letter not in alphabet for letter in letters):
+        raise ValueError(f"Bad row name: {name!r}")
+    if len(letters) == 1:
+        return alphabet.index(letters)
+    return (alphabet.index(letters[0]) + 1) * 26 + alphabet.index(letters[1])
+
+
+# every well name of a plate, row by row ("A1", "A2", ...) or column by column ("A1", "B1", ...)
+def wellNames(density, byColumn=False):
+    rows, columns = plateDimensions(density)
+    if byColumn:
+        return [rowName(r) + str(c + 1) for c in range(columns) for r in range(rows)]
+    return [rowName(r) + str(c + 1) for r in range(rows) for c in range(columns)]
+
+
+# "B12" -> (1, 12); column stays 1-based like the firmware
+def splitWellName(well):
+    well = well.strip().upper()
+    split = 2 if len(well) > 1 and well[1].isalpha() else 1
+    return rowIndex(well[:split]), int(well[split:])
+
+
+# parse "A-C,E,G-H" (rows) or "1-4,7" (columns) into sorted 0-based indices
+def parseLineSpec(spec, byRow, lineCount):
+    indices = set()
+    for part in spec.replace(' ', '').split(','):
+        if not part:
+            continue
+        bounds = part.split('-')
+        if len(bounds) > 2:
+            raise ValueError(f"Bad range: {part}")
+        if byRow:
+            low, high = rowIndex(bounds[0]), rowIndex(bounds[-1])
+        else:
+            low, high = int(bounds[0]) - 1, int(bounds[-1]) - 1
+        if low > high:
+            low, high = high, low
+        if low < 0 or high >= lineCount:
+            raise ValueError(f"Range {part} is outside the plate")
+        indices.update(range(low, high + 1))
+    return sorted(indices)
+
+
+# inverse of parseLineSpec, collapsing runs back into ranges
+def formatLineSpec(indices, byRow):
+    name = rowName if byRow else (lambda i: str(i + 1))
+    parts = []
+    runStart = previous = None
+    for index in sorted(indices):
+        if runStart is None:
+            runStart = previous = index
+        elif index == previous + 1:
+            previous = index
+        else:
+            parts.append(name(runStart) if runStart == previous else f"{name(runStart)}-{name(previous)}")
+            runStart = previous = index
+    if runStart is not None:
+        parts.append(name(runStart) if runStart == previous else f"{name(runStart)}-{name(previous)}")
+    return ",".join(parts)
@@ -0,0 +1,168 @@
+# 面板鏡像：用主機端的 LED 狀態模型（panel_model）在單一 Canvas 上畫出面板目前的樣子。
+# 孔位填色只反映已確認（收到 ACK；不等 ACK 的連線為已送出）的指令，
+# 還在佇列中 / 已送出等 ACK 的指令以外框顏色標示，延遲卡在哪一段一眼就看得到。
+# sender 的回呼只把事件放進佇列，after() 定期整批處理，只重畫有變化的孔位。
+import tkinter as tk
+from collections import deque
+
+from panel_model import PanelModel, BLACK
+from plate_layout import rowName
+from well_grid import CELL_SIZES
+
+OFF_COLOR = "#2B2B2B"
+GRID_COLOR = "#555555"
+PENDING_COLOR = "#FF8800"   # 還在佇列裡
+SENT_COLOR = "#FFE000"      # 已寫出，等 ACK
+POLL_MS = 50
+
+
+def _hex(rgb):
+    return "#%02X%02X%02X" % rgb
+
+
+class PlateMirror(tk.Canvas):
+    def __init__(self, master, rows: int, columns: int, **kwargs):
+        self.cell = CELL_SIZES.get(rows * columns, 16)
+        self.header = max(self.cell, 18)
+        width = self.header + columns * self.cell + 2
+        height = self.header + rows * self.cell + 20
+        super().__init__(master, width=width, height=height, highlightthickness=0, bg="#1E1E1E", **kwargs)
+        self.model = PanelModel(rows=rows, columns=columns)
+        self.sender = None
+        self.confirm_state = "acked"
+        self._events = deque()    # sender 執行緒 -> Tk 執行緒
+        self._inflight = deque()  # [payload, 狀態, 排入時間, 送出時間, 孔位 set]
+        self._items = []
+        self._drawn = [None] * (rows * columns)
+        self._wait_ms = 0.0       # 佇列等待（pending -> sent），指數平均
+        self._ack_ms = 0.0        # ACK 延遲（sent -> acked），指數平均
+        self._failed = 0
+        self._draw_grid()
+        self._job = self.after(POLL_MS, self._poll)
+
+    def _draw_grid(self):
+        model = self.model
+        font = ("TkDefaultFont", 7 if self.cell < 16 else 9)
+        label_every = 1 if self.cell >= 16 else 4
+        for c in range(model.columns):
+            if c % label_every == 0 or c == model.columns - 1:
+                x = self.header + c * self.cell + self.cell / 2
+                self.create_text(x, self.header / 2, text=str(c + 1), font=font, fill="#CCCCCC")
+        for r in range(model.rows):
+            y = self.header + r * self.cell + self.cell / 2
+            self.create_text(self.header / 2, y, text=rowName(r), font=font, fill="#CCCCCC")
+        for r in range(model.rows):
+            y0 = self.header + r * self.cell
+            for c in range(model.columns):
+                x0 = self.header + c * self.cell
+                self._items.append(self.create_oval(x0 + 1, y0 + 1, x0 + self.cell - 2, y0 + self.cell - 2,
+                                                    fill=OFF_COLOR, outline=GRID_COLOR))
+        self._status = self.create_text(2, self.header + model.rows * self.cell + 10, anchor="w",
+                                        font=("TkDefaultFont", 8), fill="#CCCCCC", text="not connected")
+
+    # 接上某條連線的 sender（不等 ACK 的連線以「已送出」為確認）
+    def attach(self, sender):
+        self.detach()
+        self.sender = sender
+        self.confirm_state = "acked" if sender.wait_ack else "sent"
+        sender.listeners.append(self.on_frame)
+
+    def detach(self):
+        if self.sender is not None and self.on_frame in self.sender.listeners:
+            self.sender.listeners.remove(self.on_frame)
+        self.sender = None
+        self._inflight.clear()
+
+    # sender 回呼：任何執行緒都可能呼叫，只排進佇列
+    def on_frame(self, state, payload, stamp):
+        self._events.append((state, payload, stamp))
+
+    def destroy(self):
+        self.detach()
+        if self._job is not None:
+            self.after_cancel(self._job)
+            self._job = None
+        super().destroy()
+
+    def _poll(self):
+        dirty = set()
+        events = self._events
+        while events:
+            state, payload, stamp = events.popleft()
+            dirty |= self._handle(state, payload, stamp)
+        dirty |= self.model.take_dirty()
+        if dirty:
+            self._redraw(dirty)
+        self._update_status()
+        self._job = self.after(POLL_MS, self._poll)
+
+    def _handle(self, state, payload, stamp):
+        inflight = self._inflight
+        if state == "pending":
+            wells = set(self.model.touched(payload))
+            inflight.append([payload, "pending", stamp, None, wells])
+            return wells
+        if state == "dropped":
+            # 佇列滿沒排進去：拿掉最後排入的那一筆
+            entry = next((e for e in reversed(inflight) if e[1] == "pending" and e[0] == payload), None)
+            if entry is None:
+                return set()
+            inflight.remove(entry)
+            self._failed += 1
+            return entry[4]
+        # sender 依序送出，事件對應到最舊的那一筆
+        entry = next((e for e in inflight if e[1] == "pending"), None) if state == "sent" else \
+            next((e for e in inflight if e[1] == "sent"), None)
+        if entry is None:
+            # 鏡像接上之前就排入的指令：直接套用
+            if state in ("sent", "acked") and state == self.confirm_state:
+                self.model.apply(payload)
+            return set()
+        if state == "sent":
+            entry[1], entry[3] = "sent", stamp
+            self._wait_ms = self._average(self._wait_ms, (stamp - entry[2]) * 1000)
+        else:
+            self._ack_ms = self._average(self._ack_ms, (stamp - entry[3]) * 1000)
+        if state == self.confirm_state or state == "failed":
+            inflight.remove(entry)
+            if state == "failed":
+                self._failed += 1
+            else:
+                self.model.apply(payload)
+        return entry[4]
+
+    @staticmethod
+    def _average(current, sample):
+        return sample if current == 0 else current * 0.8 + sample * 0.2
+
+    # 只改有變化的孔位
+    def _redraw(self, dirty):
+        marks = {}
+        for _payload, state, _queued, _sent, wells in self._inflight:
+            for i in wells & dirty:
+                # 同一孔位同時有排隊中與已送出的指令時，以較落後的排隊中為準
+                if marks.get(i) != "pending":
+                    marks[i] = state
+        model = self.model
+        for i in dirty:
+            rgb = model.leds[i]
+            fill = OFF_COLOR if rgb == BLACK else _hex(model.shown(i))
+            mark = marks.get(i)
+            outline = PENDING_COLOR if mark == "pending" else SENT_COLOR if mark == "sent" else GRID_COLOR
+            if self._drawn[i] != (fill, outline):
+                self._drawn[i] = (fill, outline)
+                self.itemconfigure(self._items[i], fill=fill, outline=outline, width=1 if mark is None else 2)
+
+    def _update_status(self):
+        if self.sender is None:
+            text = "not connected"
+        else:
+            pending = sum(1 for e in self._inflight if e[1] == "pending")
+            sent = len(self._inflight) - pending
+            text = f"queued {pending}  sent {sent}  wait {self._wait_ms:.0f} ms"
+            if self.confirm_state == "acked":
+                text += f"  ACK {self._ack_ms:.0f} ms"
+            if self._failed:
+                text += f"  failed {self._failed}"
+        if self.itemcget(self._status, "text") != text:
+            self.itemconfigure(self._status, text=text)
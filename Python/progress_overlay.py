@@ -0,0 +1,86 @@
+# Run progress on the destination panel: wells with a completed transfer stay dimly lit in
+# DONE_COLOUR and the current well is bright. Needs the LightGuide_Gen2_96 firmware, where S
+# lights one well in a given colour without clearing the others and M sets the plate from a mask.
+#
+# Completed wells are kept as one bitset (a Python int, LSB = A1, row-major like the mask
+# frames) per destination plate and updated one bit per step. Only the change is sent: the
+# well that was current goes back to done or off and the new one lights up (one or two S
+# frames); after a plate swap one M frame draws the plate's done wells, then the current well.
+# A 1536-well mask does not fit in one frame and goes as an M part plus up to three MA parts.
+#
+# The plate density is a setting (the destination panel's plate), not read from the worklist:
+# a 384-well plate whose worklist only uses A1-H12 still has to be indexed as 384 wells.
+from panel_protocol import encodeSerialCommand, encodeMaskFrames
+from plate_layout import plateDimensions, rowName, splitWellName
+
+DONE_COLOUR = (0, 24, 0)
+CURRENT_COLOUR = (0, 0, 255)
+OFF = (0, 0, 0)
+
+
+class ProgressOverlay:
+    """
+    load(barcodes, wells, completedRows) when a worklist is shown or reloaded (barcodes and wells
+    are the Destination_barcode and Destination_well columns); complete(row) when a row is done;
+    show(row) returns the frames that move the panel to that row. redraw() forgets what the
+    panel shows, so the next show() draws the whole plate again. density is the destination
+    plate's (96, 384 or 1536); wells outside it are not shown.
+    """
+    def __init__(self, density=96, doneColour=DONE_COLOUR, currentColour=CURRENT_COLOUR):
+        self.doneColour = doneColour
+        self.currentColour = currentColour
+        self.density = density
+        self.rows, self.columns = plateDimensions(density)
+        self.load([], [], ())
+
+    def load(self, barcodes, wells, completedRows):
+        self.barcodes = [str(b) for b in barcodes]
+        self.wells = [str(w) for w in wells]
+        # well index of every row, -1 when the well cannot be read
+        self.index = [-1] * len(self.wells)
+        for row, well in enumerate(self.wells):
+            try:
+                r, c = splitWellName(well)
+            except (ValueError, IndexError):
+                continue
+            if 0 <= r < self.rows and 1 <= c <= self.columns:
+                self.index[row] = r * self.columns + c - 1
+        self.done = {}
+        for row in completedRows:
+            self.complete(row)
+        self.redraw()
+
+    def redraw(self):
+        self.plate = None      # barcode of the plate the panel shows
+        self.current = -1      # well index shown bright
+
+    def complete(self, row):
+        if 0 <= row < len(self.index) and self.index[row] >= 0:
+            barcode = self.barcodes[row]
+            self.done[barcode] = self.done.get(barcode, 0) | 1 << self.index[row]
+
+    def isDone(self, barcode, index):
+        return self.done.get(barcode, 0) >> index & 1
+
+    def _well(self, index, barcode, rgb):
+        row, column = divmod(index, self.columns)
+        return encodeSerialCommand("S", rowName(row), column + 1, barcode or "empty", rgb)
+
+    # the done wells of a plate: one mask frame, or a few mask parts when it does not fit in one
+    def _plate(self, barcode):
+        bits = self.done.get(barcode, 0)
+        return encodeMaskFrames(bits.to_bytes((self.rows * self.columns + 7) // 8, "little"), self.doneColour)
+
+    def show(self, row):
+        if not 0 <= row < len(self.index) or self.index[row] < 0:
+            return []
+        barcode, index = self.barcodes[row], self.index[row]
+        frames = []
+        if barcode != self.plate:
+            frames.extend(self._plate(barcode))
+        elif self.current >= 0 and self.current != index:
+            frames.append(self._well(self.current, barcode,
+                                     self.doneColour if self.isDone(barcode, self.current) else OFF))
+        frames.append(self._well(index, barcode, self.currentColour))
+        self.plate, self.current = barcode, index
+        return frames
@@ -0,0 +1,181 @@
+# 串口流量錄製與重播
+# 錄製檔格式（little-endian）：
+#   檔頭  b"MAPLECAP" + <B 版本> + <d 開始時的 wall-clock 秒>
+#   每筆  <Q 相對開始的微秒（monotonic）> <B 方向 0=寫出 1=讀入> <H 長度> + 資料
+# 用法：
+#   MAPLE_CAPTURE_DIR=captures python "96check box.py"      （開埠時自動錄）
+#   python serial_capture.py dump captures/COM3-20250101-120000.mcap
+#   python serial_capture.py replay captures/COM3-....mcap [--speed 4] [--port COM3]
+import argparse
+import os
+import struct
+import sys
+import time
+from threading import Lock
+
+MAGIC = b"MAPLECAP"
+VERSION = 1
+HEADER = struct.Struct("<Bd")
+RECORD = struct.Struct("<QBH")
+WRITE = 0
+READ = 1
+MAX_CHUNK = 0xFFFF
+
+
+class CaptureWriter:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "wb", buffering=64 * 1024)
+        self._lock = Lock()
+        self._t0 = time.perf_counter_ns()
+        self._file.write(MAGIC + HEADER.pack(VERSION, time.time()))
+
+    # 記一筆（多個執行緒都可以呼叫）
+    def record(self, direction, data):
+        data = memoryview(data).cast("B")
+        if not len(data) or self._file is None:
+            return
+        stamp = (time.perf_counter_ns() - self._t0) // 1000
+        with self._lock:
+            if self._file is None:
+                return
+            for start in range(0, len(data), MAX_CHUNK):
+                chunk = data[start:start + MAX_CHUNK]
+                self._file.write(RECORD.pack(stamp, direction, len(chunk)))
+                self._file.write(chunk)
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+# 有設定 MAPLE_CAPTURE_DIR 才錄（檔名：埠名-時間.mcap）
+def openCapture(port):
+    directory = os.environ.get("MAPLE_CAPTURE_DIR")
+    if not directory:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    name = os.path.basename(str(port)) or "port"
+    path = os.path.join(directory, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.mcap")
+    print(f"Recording serial traffic to {path}")
+    return CaptureWriter(path)
+
+
+# 讀回錄製檔：回傳開始時間，以及 (秒, 方向, bytes) 清單
+def readCapture(path):
+    with open(path, "rb") as f:
+        blob = f.read()
+    if not blob.startswith(MAGIC):
+        raise ValueError(f"{path} is not a serial capture")
+    version, started = HEADER.unpack_from(blob, len(MAGIC))
+    if version != VERSION:
+        raise ValueError(f"Unsupported capture version {version}")
+    records = []
+    pos = len(MAGIC) + HEADER.size
+    view = memoryview(blob)
+    # 最後一筆可能因程式當掉而不完整，直接略過
+    while pos + RECORD.size <= len(blob):
+        stamp, direction, length = RECORD.unpack_from(blob, pos)
+        pos += RECORD.size
+        if pos + length > len(blob):
+            break
+        records.append((stamp / 1e6, direction, bytes(view[pos:pos + length])))
+        pos += length
+    return started, records
+
+
+# 依原本的時間間隔把寫出的資料送到 target（speed=0 為不等待），回覆交給 ReplyParser
+def replay(records, target, speed=1.0, parser=None):
+    from maple_serial import ReplyParser
+    parser = parser or ReplyParser()
+    writes = [(t, data) for t, direction, data in records if direction == WRITE]
+    t0 = time.perf_counter()
+    first = writes[0][0] if writes else 0.0
+    for t, data in writes:
+        if speed > 0:
+            due = t0 + (t - first) / speed
+            while True:
+                remaining = due - time.perf_counter()
+                if remaining <= 0:
+                    break
+                parser.read_from(target)
+                time.sleep(min(remaining, 0.002))
+        target.write(data)
+        parser.read_from(target)
+    # 收最後幾筆回覆
+    deadline = time.perf_counter() + 0.5
+    while time.perf_counter() < deadline:
+        if not parser.read_from(target):
+            time.sleep(0.002)
+    return parser, time.perf_counter() - t0
+
+
+# 錄到的回覆裡有幾個 ACK / ERR（跟重播結果比對用）
+def recordedReplies(records):
+    from maple_serial import ReplyParser
+    parser = ReplyParser()
+    for _t, direction, data in records:
+        if direction == READ:
+            parser.feed(data)
+    return parser
+
+
+def _dump(path):
+    started, records = readCapture(path)
+    print(f"# {path}: started {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started))}, {len(records)} records")
+    for t, direction, data in records:
+        arrow = ">>" if direction == WRITE else "<<"
+        print(f"{t:12.6f} {arrow} {data!r}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="M.A.P.L.E. serial capture tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    dump = sub.add_parser("dump", help="print every record of a capture")
+    dump.add_argument("capture")
+    play = sub.add_parser("replay", help="send a capture's frames to a simulated panel or a real port")
+    play.add_argument("capture")
+    play.add_argument("--speed", type=float, default=1.0, help="1 = original timing, 4 = four times faster, 0 = no waiting")
+    play.add_argument("--port", help="real serial port; default is a simulated panel")
+    play.add_argument("--baud", type=int, default=500000)
+    play.add_argument("--density", type=int, default=96, help="simulated panel density")
+    args = parser.parse_args(argv)
+
+    if args.command == "dump":
+        _dump(args.capture)
+        return
+
+    _started, records = readCapture(args.capture)
+    if args.port:
+        from panel_client import openSerialPort
+        target = openSerialPort(args.port, args.baud)
+        if target.fresh:
+            time.sleep(2)  # 開埠會讓板子重開機
+    else:
+        from panel_sim import SimulatedPanel
+        target = SimulatedPanel(args.density)
+    try:
+        result, elapsed = replay(records, target, args.speed)
+    finally:
+        target.close()
+    recorded = recordedReplies(records)
+    frames = sum(data.count(b">") for _t, direction, data in records if direction == WRITE)
+    print(f"Replayed {frames} frames in {elapsed:.3f} s")
+    print(f"Recorded: {recorded.ack_count} ACK, {recorded.err_count} ERR")
+    print(f"Replayed: {result.ack_count} ACK, {result.err_count} ERR")
+    if not args.port:
+        lit = target.lit()
+        print(f"Panel: {len(lit)} wells lit")
+    if (result.ack_count, result.err_count) != (recorded.ack_count, recorded.err_count) and recorded.ack_count:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
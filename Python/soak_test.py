@@ -0,0 +1,358 @@
+# Soak test: a whole shift of stepping, worklist reloads and panel reconnects against simulated
+# panels, sampling the Python heap (tracemalloc), RSS, thread count and open file descriptors
+# (handles on Windows) as it goes. After a warm-up (caches filled, first reconnect done) the
+# samples are compared with the baseline; the run fails when any of them grows past its budget.
+#
+#   python soak_test.py --steps 50000 --reload-every 2000 --reconnect-every 1000
+#   python soak_test.py --gui --steps 20000     # drives the real LightGuide window (display + pandastable)
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from maple_session import IOCore, Session
+from panel_sim import SimulatedConnection
+from volume_ledger import VolumeLedger
+from worklist_cache import readWorklistCached
+from worklist_io import CHERRYPICK_COLUMNS, parseVolume
+from worklist_synth import generateWorklist, writeWorklist
+from worklist_watch import rowHashes, reloadWorklist
+
+# growth allowed between the baseline and the end of the run
+HEAP_BUDGET_MB = 4.0
+RSS_BUDGET_MB = 40.0
+THREAD_BUDGET = 0
+HANDLE_BUDGET = 4
+PLATE_VOLUME_UL = 1e9   # source plates never run dry during a soak
+
+
+# ---- process resources ----
+
+def _windowsUsage():
+    import ctypes
+    from ctypes import wintypes
+
+    class MemoryCounters(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                    ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    counters = MemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    rss = None
+    if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+        rss = counters.WorkingSetSize
+    handles = wintypes.DWORD()
+    count = handles.value if ctypes.windll.kernel32.GetProcessHandleCount(process, ctypes.byref(handles)) else None
+    return rss, count
+
+
+def resourceUsage():
+    """
+    Resident memory in bytes and open file descriptors (handles on Windows) of this process;
+    None for what the platform cannot tell.
+    """
+    if sys.platform == 'win32':
+        return _windowsUsage()
+    rss = handles = None
+    try:
+        with open('/proc/self/statm') as f:
+            rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        handles = len(os.listdir('/proc/self/fd'))
+    except OSError:
+        pass
+    return rss, handles
+
+
+class SoakMonitor:
+    """
+    sample(step) records one row of measurements; baseline() marks the sample every later one
+    is compared with and keeps a tracemalloc snapshot, so the lines that grew can be listed.
+    """
+    def __init__(self, heap_mb=HEAP_BUDGET_MB, rss_mb=RSS_BUDGET_MB, threads=THREAD_BUDGET, handles=HANDLE_BUDGET):
+        self.budget = {'heap_bytes': heap_mb * 1e6, 'rss_bytes': rss_mb * 1e6, 'threads': threads, 'handles': handles}
+        self.samples = []
+        self.base = None
+        self._snapshot = None
+        self._started = time.perf_counter()
+        tracemalloc.start()
+
+    def sample(self, step, queued=0):
+        heap, _peak = tracemalloc.get_traced_memory()
+        rss, handles = resourceUsage()
+        row = {'step': step, 'seconds': round(time.perf_counter() - self._started, 3), 'heap_bytes': heap,
+               'rss_bytes': rss, 'threads': threading.active_count(), 'handles': handles, 'queued': queued}
+        self.samples.append(row)
+        return row
+
+    def baseline(self, step, queued=0):
+        self.base = self.sample(step, queued)
+        self._snapshot = self._takeSnapshot()
+
+    @staticmethod
+    def _takeSnapshot():
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*")])
+
+    def growth(self, row=None):
+        row = row or self.samples[-1]
+        return {key: None if self.base is None or row[key] is None or self.base[key] is None
+                else row[key] - self.base[key] for key in self.budget}
+
+    # budget lines that were exceeded at the last sample
+    def failures(self):
+        failed = []
+        for key, grown in self.growth().items():
+            if grown is not None and grown > self.budget[key]:
+                failed.append(f"{key} grew by {grown:,.0f} (budget {self.budget[key]:,.0f})")
+        return failed
+
+    # source lines whose allocations grew the most since the baseline
+    def topGrowth(self, limit=10):
+        if self._snapshot is None:
+            return []
+        grown = [stat for stat in self._takeSnapshot().compare_to(self._snapshot, 'lineno') if stat.size_diff > 0]
+        return grown[:limit]
+
+    def stop(self):
+        tracemalloc.stop()
+
+    def writeCsv(self, path):
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(self.samples[0]))
+            writer.writeheader()
+            writer.writerows(self.samples)
+
+
+# ---- drivers: what a station does during a shift ----
+
+class HeadlessDriver:
+    """
+    Does per step what LightGuide.nextWell does without the window: mark the row done,
+    deduct its volume, move on and send the source and destination frames.
+    """
+    def __init__(self, core, baudrate, ledgerPath):
+        self.session = Session(core=core)
+        self.baudrate = baudrate
+        self.ledger = VolumeLedger(ledgerPath)
+
+    def connect(self):
+        self.session.connect("source", "SIM-SOURCE", self.baudrate, wait_ack=False, inter_delay=0.001)
+        self.session.connect("destination", "SIM-DESTINATION", self.baudrate, wait_ack=False, inter_delay=0.001)
+
+    def reconnect(self):
+        self.session.disconnect()
+        self.connect()
+
+    def load(self, path):
+        data = readWorklistCached(path, CHERRYPICK_COLUMNS)
+        self.session.load_worklist(data, path, None, rowHashes(data))
+        self.ledger.startRun(path, self.session.csvHashes)
+        for barcode in data['Source_barcode'].unique():
+            self.ledger.setPlateVolume(barcode, PLATE_VOLUME_UL)
+        self.show()
+
+    # the saved file changed under a running worklist (LightGuide.checkWorklist)
+    def reload(self, path):
+        session = self.session
+        reload = reloadWorklist(readWorklistCached(path, CHERRYPICK_COLUMNS), session.csvHashes,
+                                session.currentCsvPosition, session.completedRows)
+        session.csvData = reload.frame
+        session.csvHashes = reload.hashes
+        session.csvRecordCount = len(reload.frame.index)
+        session.completedRows = reload.completed
+        session.currentCsvPosition = reload.position
+        self.ledger.setRows(reload.hashes)
+        self.show()
+
+    def show(self):
+        session = self.session
+        row = session.currentCsvPosition
+        data = session.csvData
+        for role, wellColumn, barcodeColumn in (("source", 'Source_well', 'Source_barcode'),
+                                                ("destination", 'Destination_well', 'Destination_barcode')):
+            well = data.at[row, wellColumn]
+            frame = role + " <" + well[0:1] + "," + well[1:3] + ",S," + data.at[row, barcodeColumn] + ">"
+            link = session.link(role)
+            if link is not None:
+                link.send([frame.encode('us-ascii')])
+
+    def step(self, backwards=False):
+        session = self.session
+        row = session.currentCsvPosition
+        if backwards:
+            session.currentCsvPosition = max(0, row - 1)
+        else:
+            session.completedRows.add(row)
+            try:
+                volume = parseVolume(session.csvData.at[row, 'Transfer_volume'])
+            except ValueError:
+                volume = None
+            if volume is not None:
+                self.ledger.deduct(row, session.csvData.at[row, 'Source_barcode'],
+                                   session.csvData.at[row, 'Source_well'], volume)
+            # start over at the end, like loading the worklist again
+            session.currentCsvPosition = row + 1 if row < session.csvRecordCount - 1 else 0
+            if session.currentCsvPosition == 0:
+                session.completedRows = set()
+        self.show()
+
+    def idle(self):
+        self.ledger.flush()
+
+    def queued(self):
+        return sum(link.sender.pending() for link in self.session.panels.values())
+
+    def close(self):
+        self.session.close()
+        self.ledger.close()
+
+
+class LightGuideDriver(HeadlessDriver):
+    """The real lightPanelGUI in a withdrawn window, stepped through its own button handlers."""
+    def __init__(self, core, baudrate, ledgerPath):
+        import tkinter
+        import LightGuide
+        self.root = tkinter.Tk()
+        self.root.withdraw()
+        self.gui = LightGuide.lightPanelGUI(self.root, Session(core=core))
+        self.gui.ledger.close()
+        self.gui.ledger = VolumeLedger(ledgerPath)
+        self.session = self.gui.session
+        self.ledger = self.gui.ledger
+        self.baudrate = baudrate
+
+    def load(self, path):
+        # same path as openFile: a new table for every file
+        self.gui.showWorklist(readWorklistCached(path, CHERRYPICK_COLUMNS), path)
+        for barcode in self.session.csvData['Source_barcode'].unique():
+            self.ledger.setPlateVolume(barcode, PLATE_VOLUME_UL)
+        self.root.update()
+
+    def reload(self, path):
+        self.load(path)
+
+    def step(self, backwards=False):
+        if backwards:
+            self.gui.previousWell()
+        else:
+            if self.session.currentCsvPosition >= self.session.csvRecordCount - 1:
+                self.gui.showWorklist(self.session.csvData, self.session.fileName)
+            self.gui.nextWell()
+        self.root.update()
+
+    def idle(self):
+        self.ledger.flush()
+        self.root.update()
+
+    def close(self):
+        super().close()
+        self.root.destroy()
+
+
+def runSoak(steps=20000, rows=384, reloadEvery=2000, reconnectEvery=1000, sampleEvery=500, warmup=None,
+            baudrate=500000, gui=False, monitor=None, report=print):
+    """
+    Step through `steps` worklist rows (every tenth move goes back one row), rewriting and
+    reloading the worklist every reloadEvery steps and reconnecting both panels every
+    reconnectEvery steps. Returns the SoakMonitor; its failures() are empty when the run
+    stayed within budget.
+    """
+    warmup = max(reloadEvery, reconnectEvery) * 2 if warmup is None else warmup
+    monitor = monitor or SoakMonitor()
+    with tempfile.TemporaryDirectory() as scratch:
+        previousCache = os.environ.get('MAPLE_CACHE_DIR')
+        os.environ['MAPLE_CACHE_DIR'] = os.path.join(scratch, 'cache')
+        core = IOCore(connection_class=SimulatedConnection)
+        driver = (LightGuideDriver if gui else HeadlessDriver)(core, baudrate, os.path.join(scratch, 'ledger.sqlite'))
+        try:
+            path = os.path.join(scratch, 'soak.csv')
+            writeWorklist(generateWorklist(rows, 'cherrypick', 96, 4)[0], path)
+            driver.connect()
+            driver.load(path)
+            reloads = 0
+            for step in range(1, steps + 1):
+                driver.step(backwards=step % 10 == 0)
+                if step % reloadEvery == 0:
+                    reloads += 1
+                    writeWorklist(generateWorklist(rows, 'cherrypick', 96, 4, seed=reloads % 3)[0], path)
+                    (driver.load if reloads % 2 else driver.reload)(path)
+                if step % reconnectEvery == 0:
+                    driver.reconnect()
+                if step % sampleEvery == 0 and step < steps:
+                    driver.idle()
+                    if step == warmup or (monitor.base is None and step > warmup):
+                        monitor.baseline(step, driver.queued())
+                        report(f"{step:>8} baseline")
+                    else:
+                        monitor.sample(step, driver.queued())
+                        report(_formatSample(monitor))
+            driver.session.drain()
+            monitor.sample(steps, driver.queued())
+            report(_formatSample(monitor))
+        finally:
+            driver.close()
+            core.shutdown()
+            if previousCache is None:
+                os.environ.pop('MAPLE_CACHE_DIR', None)
+            else:
+                os.environ['MAPLE_CACHE_DIR'] = previousCache
+    return monitor
+
+
+def _formatSample(monitor):
+    row = monitor.samples[-1]
+    grown = monitor.growth(row)
+
+    def delta(key, scale=1.0, unit=''):
+        return '-' if grown[key] is None else f"{grown[key] / scale:+.1f}{unit}"
+    rss = '-' if row['rss_bytes'] is None else f"{row['rss_bytes'] / 1e6:.1f}"
+    return (f"{row['step']:>8} {row['seconds']:>8.1f}s heap {row['heap_bytes'] / 1e6:6.1f} MB ({delta('heap_bytes', 1e6)}) "
+            f"rss {rss} MB ({delta('rss_bytes', 1e6)}) threads {row['threads']} ({delta('threads')}) "
+            f"handles {row['handles']} ({delta('handles')}) queued {row['queued']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="M.A.P.L.E. soak test against simulated panels")
+    parser.add_argument("--steps", type=int, default=20000)
+    parser.add_argument("--rows", type=int, default=384, help="worklist rows (stepping wraps around)")
+    parser.add_argument("--reload-every", type=int, default=2000)
+    parser.add_argument("--reconnect-every", type=int, default=1000)
+    parser.add_argument("--sample-every", type=int, default=500)
+    parser.add_argument("--warmup", type=int, help="steps before the baseline sample (default: two reload/reconnect cycles)")
+    parser.add_argument("--baud", type=int, default=500000, help="pacing baud rate of the simulated panels")
+    parser.add_argument("--gui", action="store_true", help="drive the LightGuide window instead of a bare session")
+    parser.add_argument("--heap-mb", type=float, default=HEAP_BUDGET_MB)
+    parser.add_argument("--rss-mb", type=float, default=RSS_BUDGET_MB)
+    parser.add_argument("--threads", type=int, default=THREAD_BUDGET)
+    parser.add_argument("--handles", type=int, default=HANDLE_BUDGET)
+    parser.add_argument("--csv", help="write every sample to this file")
+    args = parser.parse_args(argv)
+
+    monitor = SoakMonitor(args.heap_mb, args.rss_mb, args.threads, args.handles)
+    try:
+        runSoak(args.steps, args.rows, args.reload_every, args.reconnect_every, args.sample_every, args.warmup,
+                args.baud, args.gui, monitor)
+        if args.csv:
+            monitor.writeCsv(args.csv)
+        failed = monitor.failures()
+        if failed:
+            print("FAIL: " + "; ".join(failed))
+            for stat in monitor.topGrowth():
+                print(f"  {stat}")
+            return 1
+        print("OK: within budget")
+        return 0
+    finally:
+        monitor.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
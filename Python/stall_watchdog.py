@@ -0,0 +1,167 @@
+# Tk event-loop stall watchdog, opt-in: MAPLE_WATCHDOG=1 (50 ms threshold) or MAPLE_WATCHDOG=<ms>.
+# A heartbeat after() callback runs on the Tk thread every half threshold and notes how late it
+# came; a monitor thread looks at the time the next heartbeat is due and, while the loop is
+# overdue by more than the threshold, samples the main thread's stack with sys._current_frames().
+# When the loop comes back, the stall is written to a rotating log with its duration and the
+# stacks seen while it lasted (most frequent first), so a slow click handler shows up by name.
+# A loop that stays blocked is reported once while it is still hanging.
+#
+# Idle cost: one after() callback per heartbeat and a monitor thread that compares two floats
+# per wake-up; stacks are only formatted during a stall.
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from maple_paths import dataPath
+
+THRESHOLD_MS = 50          # a handler blocking longer than this is a stall
+SAMPLE_MS = 10             # how often the monitor looks (and samples the stack during a stall)
+HANG_SECONDS = 5.0         # report a stall that is still going on after this long
+STACKS_LOGGED = 3          # distinct stacks written per stall
+LOG_BYTES = 1 << 20        # rotate the log at 1 MB ...
+LOG_BACKUPS = 3            # ... and keep three old ones
+
+
+def watchdogLogPath():
+    return dataPath("MAPLE_WATCHDOG_LOG", "stalls.log")
+
+
+# threshold from MAPLE_WATCHDOG: None when the watchdog is off
+def watchdogThreshold():
+    value = os.environ.get("MAPLE_WATCHDOG", "").strip().lower()
+    if value in ("", "0", "off", "no", "false"):
+        return None
+    if value in ("1", "on", "yes", "true"):
+        return THRESHOLD_MS
+    try:
+        return max(1, int(value))
+    except ValueError:
+        print("WARN: MAPLE_WATCHDOG should be on/off or a threshold in ms: " + value)
+        return None
+
+
+class StallWatchdog:
+    """
+    start() on the Tk thread after the window is built, stop() when the window closes (before exit()).
+    Durations are measured from when the heartbeat was due, so they can be up to half a
+    threshold short of how long the handler actually ran; a stall needs to outlast the
+    threshold by about one sample interval before a stack is caught.
+    """
+    def __init__(self, root, thresholdMs=THRESHOLD_MS, sampleMs=SAMPLE_MS, path=None, clock=time.perf_counter):
+        self.root = root
+        self.threshold = thresholdMs / 1000.0
+        self.intervalMs = max(1, thresholdMs // 2)
+        self.interval = self.intervalMs / 1000.0
+        self.sample = sampleMs / 1000.0
+        self.path = path or watchdogLogPath()
+        self.clock = clock
+        self.stalls = 0
+        self.worst = 0.0
+        self._due = clock() + self.interval
+        self._ended = deque()           # (started, seconds) of stalls the heartbeat saw end
+        self._stacks = Counter()        # main-thread stacks sampled during the current stall
+        self._samples = 0
+        self._hangReported = False
+        self._afterId = None
+        self._stop = threading.Event()
+        self._mainIdent = threading.main_thread().ident
+        self._thread = threading.Thread(target=self._monitor, name="stall-watchdog", daemon=True)
+        self.log = None
+
+    def start(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.log = logging.getLogger("maple.stalls." + str(id(self)))
+        self.log.propagate = False
+        self.log.setLevel(logging.INFO)
+        handler = logging.handlers.RotatingFileHandler(self.path, maxBytes=LOG_BYTES, backupCount=LOG_BACKUPS,
+                                                       encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        self.log.addHandler(handler)
+        self.log.info(f"watchdog started: {os.path.basename(sys.argv[0])}, threshold {self.threshold * 1000:.0f} ms")
+        self._due = self.clock() + self.interval
+        self._afterId = self.root.after(self.intervalMs, self._heartbeat)
+        self._thread.start()
+        print(f"Stall watchdog on ({self.threshold * 1000:.0f} ms), logging to {self.path}")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._afterId is not None:
+            try:
+                self.root.after_cancel(self._afterId)
+            except Exception:
+                pass   # the window is already gone
+            self._afterId = None
+        if self._thread.is_alive():
+            self._thread.join(timeout=1)
+        if self.log is not None:
+            self.log.info(f"watchdog stopped: {self.stalls} stalls, worst {self.worst * 1000:.0f} ms")
+            for handler in list(self.log.handlers):
+                handler.close()
+                self.log.removeHandler(handler)
+            self.log = None
+
+    # Tk thread
+    def _heartbeat(self):
+        now = self.clock()
+        late = now - self._due
+        if late > self.threshold:
+            self._ended.append((self._due, late))
+        self._due = now + self.interval
+        if not self._stop.is_set():
+            self._afterId = self.root.after(self.intervalMs, self._heartbeat)
+
+    # monitor thread
+    def _monitor(self):
+        while not self._stop.wait(self.sample):
+            while self._ended:
+                self._report(*self._ended.popleft())
+            overdue = self.clock() - self._due
+            if overdue <= self.threshold:
+                continue
+            stack = self._mainStack()
+            if stack:
+                self._stacks[stack] += 1
+                self._samples += 1
+            if overdue > HANG_SECONDS and not self._hangReported:
+                self._hangReported = True
+                self._write(f"loop still blocked after {overdue:.1f} s", keep=True)
+
+    def _mainStack(self):
+        frame = sys._current_frames().get(self._mainIdent)
+        if frame is None:
+            return None
+        return "".join(traceback.format_stack(frame))
+
+    def _report(self, started, seconds):
+        self.stalls += 1
+        self.worst = max(self.worst, seconds)
+        self._write(f"stall {seconds * 1000:.0f} ms (threshold {self.threshold * 1000:.0f} ms)")
+
+    def _write(self, headline, keep=False):
+        stacks, samples = self._stacks, self._samples
+        if not keep:
+            self._stacks, self._samples, self._hangReported = Counter(), 0, False
+        if self.log is None:
+            return
+        lines = [headline + (f", {samples} stack samples" if samples else ", no stack sample (shorter than the sampling interval)")]
+        for stack, count in stacks.most_common(STACKS_LOGGED):
+            lines.append(f"  main thread in {count}/{samples} samples:")
+            lines.extend("    " + line for line in stack.rstrip().splitlines())
+        self.log.info("\n".join(lines))
+
+
+# start a watchdog on this Tk root when MAPLE_WATCHDOG is set; returns it (None when off)
+def startWatchdog(root, thresholdMs=None, path=None):
+    thresholdMs = thresholdMs or watchdogThreshold()
+    if thresholdMs is None:
+        return None
+    try:
+        return StallWatchdog(root, thresholdMs, path=path).start()
+    except OSError as e:
+        print("Could not start the stall watchdog: " + str(e))
+        return None
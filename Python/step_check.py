@@ -0,0 +1,152 @@
+# Step program check: streams a worklist into a simulated Gen2_96 panel with step_program.StepStreamer
+# and compares what the panel shows with the streamer's position after every scenario: stepping
+# through the list, clicking past the uploaded window, jumping, and a panel that lost its program
+# (<MISS:n>) and has to be resynced. Exits non-zero when any scenario ends on the wrong step.
+#
+#   python step_check.py
+#   python step_check.py --steps 2000 --delay 0.001
+import argparse
+import os
+import sys
+import time
+
+from maple_session import IOCore, Session
+from panel_sim import SimulatedConnection
+from step_program import StepStreamer
+
+SETTLE_SECONDS = 5.0
+
+
+def stepColour(number):
+    return (255, number % 256, 0)
+
+
+class StepCheck:
+    """
+    One session on a simulated panel with a StepStreamer over `count` steps, one well per step
+    (the colour encodes the step number, so a stale slot shows up as the wrong colour).
+    """
+    def __init__(self, core, count, wait_ack, columns=12, rows=8):
+        self.session = Session(core=core)
+        # the check reads the simulated panel directly, so it has to live in this process
+        if not self.session.connect("panel", "SIM", wait_ack=wait_ack, writer="thread"):
+            raise RuntimeError("could not open the simulated panel")
+        self.link = self.session.link()
+        self.wells = rows * columns
+        self.streamer = StepStreamer(self.link, [(1 << (n % self.wells), stepColour(n)) for n in range(count)],
+                                     rows=rows, columns=columns)
+        self.failures = []
+
+    @property
+    def panel(self):
+        return self.link.conn.connection
+
+    # poll until every sent move has been answered and the queue is empty; then wait out two idle
+    # reads of the sender, so replies nobody expected (a stray byte) are in too
+    def settle(self):
+        deadline = time.perf_counter() + SETTLE_SECONDS
+        while time.perf_counter() < deadline:
+            time.sleep(0.005)
+            self.streamer.poll()
+            if not self.streamer.expected and not self.streamer.goto_pending and not self.link.sender.pending():
+                time.sleep(2 * getattr(self.link.sender, "idle_read", 0.05))
+                if self.streamer.poll() and not self.streamer.expected:
+                    return True
+        return False
+
+    def expect(self, scenario, resyncs=None):
+        settled = self.settle()
+        position = self.streamer.position
+        lit = self.panel.lit()
+        problems = []
+        if not settled:
+            problems.append("did not settle")
+        if self.panel.model.step != position:
+            problems.append(f"panel on step {self.panel.model.step}, expected {position}")
+        if lit != {position % self.wells: stepColour(position)}:
+            problems.append(f"panel shows {lit}")
+        if resyncs is not None and self.streamer.resyncs != resyncs:
+            problems.append(f"{self.streamer.resyncs} resyncs, expected {resyncs}")
+        print(f"{scenario:<28} step {position:>5} resyncs {self.streamer.resyncs:>3} "
+              f"frames {self.panel.frames_received:>6} {'ok' if not problems else 'FAIL: ' + '; '.join(problems)}")
+        self.failures.extend(f"{scenario}: {problem}" for problem in problems)
+
+    def run(self, steps, interval):
+        streamer = self.streamer
+        streamer.start(0)
+        self.expect("start", resyncs=0)
+
+        # one click at a time: every move should go out as a single byte
+        frames = self.panel.frames_received
+        for _ in range(steps):
+            streamer.next()
+            time.sleep(interval)
+            streamer.poll()
+        self.expect("stream forward", resyncs=0)
+        for _ in range(steps // 10):
+            streamer.previous()
+            time.sleep(interval)
+            streamer.poll()
+        self.expect("stream back", resyncs=0)
+        uploads = self.panel.frames_received - frames
+        if uploads > steps + steps // 10 + streamer.slots:
+            self.failures.append(f"stream: {uploads} frames for {steps + steps // 10} moves")
+
+        # clicking faster than the uploads: targets outside the written window go out as PG
+        for _ in range(streamer.ahead + 5):
+            streamer.next()
+        self.expect("past the window", resyncs=0)
+        streamer.jump(streamer.count // 2)
+        self.expect("jump", resyncs=0)
+
+        # the panel restarted and lost its program: <MISS:n> must resync to the current step
+        with self.panel._lock:
+            self.panel.model.program.clear()
+            self.panel.model.step = -1
+        streamer.next()
+        self.expect("resync after MISS")
+        if not streamer.resyncs:
+            self.failures.append("resync after MISS: the streamer never resynced")
+        # a stray byte moves the panel ahead of the streamer
+        before = streamer.resyncs
+        self.link.conn.write(b"+")
+        streamer.next()
+        self.expect("resync after stray byte")
+        if streamer.resyncs == before:
+            self.failures.append("resync after stray byte: the streamer never resynced")
+        return self.failures
+
+    def close(self):
+        self.streamer.close()
+        self.session.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="M.A.P.L.E. step program check against a simulated panel")
+    parser.add_argument("--steps", type=int, default=200, help="single clicks in the streaming scenario")
+    parser.add_argument("--count", type=int, default=1000, help="steps in the program")
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds between clicks while streaming")
+    parser.add_argument("--delay", type=float, default=0.0005, help="simulated panel processing time per frame")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("MAPLE_DAEMON", "off")
+    SimulatedConnection.process_delay = args.delay
+    failures = []
+    for wait_ack in (False, True):
+        print(f"-- wait_ack={wait_ack}")
+        core = IOCore(connection_class=SimulatedConnection)
+        check = StepCheck(core, args.count, wait_ack)
+        try:
+            failures += [f"wait_ack={wait_ack} {failure}" for failure in check.run(args.steps, args.interval)]
+        finally:
+            check.close()
+            core.shutdown()
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        return 1
+    print("OK: the panel followed every step")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
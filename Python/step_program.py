@@ -0,0 +1,235 @@
+# 步驟程式（對應 LightGuide_Gen2_96 韌體的 PS / PG / PX 指令與單一 byte 的 '+' '-'）：
+# 整份工作清單先編成每一步的遮罩 + 顏色，背景把目前位置前後的一段（視窗）上傳到面板，
+# 按下一步 / 上一步時只送一個 byte，不再每步編碼、傳送、解析整個 ASCII 指令。
+#
+# 面板共有 PROGRAM_SLOTS 個槽，step n 放在 n % PROGRAM_SLOTS；視窗為目前位置往回 behind 步、
+# 往前 slots - behind - 1 步，每前進一步就補上視窗最前面那一步（剛好蓋掉最舊的那一步）。
+# 上傳走一般的 sender 佇列（等 ACK 時一次一個指令，不會超過韌體的接收緩衝）；
+# '+' '-' 不排隊直接寫出，但只在目標步驟已經寫出之後才送（序列埠保證順序）。
+# 面板對每次切換回 <STEP:n>（或沒載入時 <MISS:n>），跟預期不同就重新同步：補傳視窗後用 PG 指定位置。
+# 預期的回覆在指令真正寫出時才記下，並標上同步代數；重新同步之前送出的指令，回覆到了也不比對，
+# 免得佇列裡還沒送完的舊 PG 的回覆又觸發下一次同步。
+import os
+from collections import deque
+from threading import Lock
+
+from panel_model import PROGRAM_SLOTS
+from plate_layout import splitWellName
+
+NEXT = b"+"
+PREVIOUS = b"-"
+CLEAR_PROGRAM = b"<A,1,PX,>"
+POLL_MS = 50    # GUI 多久比對一次面板回報的位置
+
+
+# 環境變數 MAPLE_STEP_PROGRAM=1 時 GUI 才改用步驟程式（預設照舊逐步送 S 指令）
+def stepProgramEnabled():
+    return os.environ.get("MAPLE_STEP_PROGRAM", "").strip().lower() in ("1", "on", "yes", "true")
+
+
+def _clamp8(v):
+    return int(max(0, min(255, v)))
+
+
+# <K,n,PS,MASK_HEX,R,G,B>：step n 的遮罩（LSB = A1）與顏色
+def encodeStep(number, bits, nbytes, rgb) -> bytes:
+    r, g, b = [_clamp8(v) for v in rgb]
+    mask_hex = bits.to_bytes(nbytes, "little").hex().upper()
+    return f"<K,{number},PS,{mask_hex},{r},{g},{b}>".encode("us-ascii")
+
+
+# <A,n,PG,>：直接顯示 step n
+def encodeGoto(number) -> bytes:
+    return f"<A,{number},PG,>".encode("us-ascii")
+
+
+# 工作清單的孔位欄（例如 Destination_well）編成每一步一個孔位的 [(bits, rgb), ...]
+def compileWells(wells, rows=8, columns=12, rgb=(0, 0, 255)):
+    steps = []
+    for well in wells:
+        row, column = splitWellName(str(well))
+        if not (0 <= row < rows and 1 <= column <= columns):
+            raise ValueError(f"Well outside the plate: {well}")
+        steps.append((1 << (row * columns + column - 1), rgb))
+    return steps
+
+
+class StepStreamer:
+    """
+    steps：每一步 (bits, (R, G, B)) 的清單，或 step(i) -> (bits, rgb) 的函式加上 count
+    （顏色要在上傳時才決定，例如體積警示色）。
+    link：maple_session.PanelLink（用它的 sender 排隊上傳、conn 直接寫單一 byte）。
+    start(position) 後用 next() / previous() / jump(n) 移動；poll() 由 GUI 定期呼叫，
+    處理面板回來的 <STEP:n> / <MISS:n>，不一致時重新同步。
+    """
+    def __init__(self, link, steps, rows=8, columns=12, count=None, slots=PROGRAM_SLOTS, behind=4):
+        self.link = link
+        self.steps = steps
+        self.count = len(steps) if count is None else count
+        self.nbytes = (rows * columns + 7) // 8
+        self.slots = slots
+        self.behind = behind
+        self.ahead = slots - behind - 1
+        self.position = 0
+        self.uploaded = {}      # 槽 -> 已排入上傳的 step 編號
+        self.written = {}       # 槽 -> 已寫到面板的 step 編號（sender 回呼更新）
+        self.expected = deque(maxlen=256)  # 已寫出的切換 -> (同步代數, 預期面板回的 step 編號)
+        self.goto_pending = 0   # 還沒寫出的 PG 數；這段期間不送單一 byte
+        self.generation = 0     # start / resync 時加一
+        self.resyncs = 0
+        self._gotos = deque()   # 排隊中的 PG 各自的同步代數（sender 依序寫出）
+        self._frames = {}       # 排入的上傳指令 -> (槽, step)
+        self._lock = Lock()
+        link.sender.listeners.append(self._on_frame)
+
+    def close(self):
+        if self._on_frame in self.link.sender.listeners:
+            self.link.sender.listeners.remove(self._on_frame)
+
+    def _step(self, number):
+        return self.steps(number) if callable(self.steps) else self.steps[number]
+
+    # sender 執行緒：指令寫出後，後面送的 byte 一定排在它後面
+    def _on_frame(self, state, payload, _stamp):
+        if state not in ("sent", "dropped"):
+            return
+        with self._lock:
+            if payload.startswith(b"<A,") and payload.endswith(b",PG,>"):
+                self.goto_pending = max(0, self.goto_pending - 1)
+                generation = self._gotos.popleft() if self._gotos else self.generation
+                if state == "sent":
+                    self.expected.append((generation, int(payload[3:-5])))
+            elif state == "sent":
+                slot_step = self._frames.pop(payload, None)
+                if slot_step is not None:
+                    self.written[slot_step[0]] = slot_step[1]
+
+    def _upload(self, number):
+        slot = number % self.slots
+        if self.uploaded.get(slot) == number:
+            return
+        bits, rgb = self._step(number)
+        frame = encodeStep(number, bits, self.nbytes, rgb)
+        with self._lock:
+            self.uploaded[slot] = number
+            self.written.pop(slot, None)
+            self._frames[frame] = (slot, number)
+        self.link.send([frame])
+
+    # 補齊目前位置前後的視窗（先補前面，下一步最先可用）
+    def _fill_window(self):
+        last = min(self.count - 1, self.position + self.ahead)
+        for number in range(self.position, last + 1):
+            self._upload(number)
+        for number in range(self.position - 1, max(-1, self.position - self.behind - 1), -1):
+            self._upload(number)
+
+    def _goto(self, number):
+        with self._lock:
+            self.goto_pending += 1
+            self._gotos.append(self.generation)
+        self.link.send([encodeGoto(number)])
+
+    def start(self, position=0):
+        self.position = max(0, min(position, self.count - 1))
+        self.uploaded.clear()
+        with self._lock:
+            self.written.clear()
+            self._frames.clear()
+            self.generation += 1
+        self.link.send([CLEAR_PROGRAM])
+        self._upload(self.position)
+        self._goto(self.position)
+        self._fill_window()
+
+    def _move(self, target, byte):
+        if not 0 <= target < self.count or target == self.position:
+            return False
+        slot = target % self.slots
+        with self._lock:
+            ready = self.goto_pending == 0 and self.written.get(slot) == target
+            if ready:
+                self.expected.append((self.generation, target))
+        if ready:
+            self.link.conn.write(byte)
+        else:
+            # 還沒寫到面板（點太快或正在重新同步）：排在上傳後面用 PG 指定
+            self._upload(target)
+            self._goto(target)
+        self.position = target
+        self._fill_window()
+        return True
+
+    def next(self):
+        return self._move(self.position + 1, NEXT)
+
+    def previous(self):
+        return self._move(self.position - 1, PREVIOUS)
+
+    def jump(self, number):
+        number = max(0, min(number, self.count - 1))
+        if number == self.position:
+            return False
+        self.position = number
+        self._upload(number)
+        self._goto(number)
+        self._fill_window()
+        return True
+
+    # 移到第 number 步：前後一步送單一 byte，其他用 PG 跳過去
+    def show(self, number):
+        if number == self.position + 1:
+            return self.next()
+        if number == self.position - 1:
+            return self.previous()
+        return self.jump(number)
+
+    # 某一步的內容變了（例如顏色）：重新上傳，正在顯示的話重新指定
+    def refresh(self, number):
+        if not 0 <= number < self.count:
+            return
+        self.uploaded.pop(number % self.slots, None)
+        if abs(number - self.position) <= max(self.ahead, self.behind):
+            self._upload(number)
+            if number == self.position:
+                self._goto(number)
+
+    # 比對面板回報的位置；不一致（漏了 byte、面板重開機）就重新同步
+    def poll(self):
+        events = self.link.sender.parser.events
+        while events:
+            kind, detail = events.popleft()
+            try:
+                shown = int(detail)
+            except ValueError:
+                shown = None
+            with self._lock:
+                if self._stale(kind, shown):
+                    continue
+                expected = self.expected.popleft()[1] if self.expected else None
+            if kind != "STEP" or shown != expected:
+                self.resync()
+                return False
+        return True
+
+    # 回覆屬於上一代的指令就丟掉不比對；已經等到這一代第一個預期的回覆，前面沒回的舊指令就是掉了
+    def _stale(self, kind, shown):
+        current = next((number for generation, number in self.expected if generation == self.generation), None)
+        while self.expected and self.expected[0][0] != self.generation:
+            if kind == "STEP" and shown == current:
+                self.expected.popleft()
+                continue
+            self.expected.popleft()
+            return True
+        return False
+
+    def resync(self):
+        self.resyncs += 1
+        self.uploaded.clear()
+        with self._lock:
+            self.written.clear()
+            self._frames.clear()
+            self.generation += 1
+        self._upload(self.position)
+        self._goto(self.position)
+        self._fill_window()
@@ -0,0 +1,171 @@
+# Operator throughput: how long each step stays on the panels (dwell), rolling transfers per
+# minute, a live ETA and the slowest steps of the run. The GUIs call step() right after they
+# move; everything it does is O(1) (a tuple appended, a running sum, a fixed-size heap), so it
+# adds nothing noticeable to the step path. The per-step table is only built at the end of a
+# run, when it is exported as CSV (or Parquet when pyarrow/fastparquet is installed).
+import heapq
+import os
+import time
+from collections import deque
+
+import pandas as pd
+from maple_paths import dataPath
+
+WINDOW = 20            # forward steps the rolling rate is taken over
+SLOWEST = 10           # slowest steps kept for the report
+IDLE_SECONDS = 300.0   # a dwell longer than this counts as a break, not as work time
+STEP_COLUMNS = ['step', 'position', 'label', 'action', 'started', 'dwell_s', 'plate_swap', 'idle']
+
+
+def timingDirectory():
+    return dataPath("MAPLE_TIMING_DIR", "timings")
+
+
+# <worklist name>-<start time>.<csv|parquet> in the timing directory
+def timingPath(key, started, extension=None):
+    extension = extension or os.environ.get("MAPLE_TIMING_FORMAT", "csv")
+    name = os.path.splitext(os.path.basename(str(key)))[0] or "run"
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(started))
+    return os.path.join(timingDirectory(), f"{name}-{stamp}.{extension.lstrip('.')}")
+
+
+def formatDuration(seconds):
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}"
+    return f"{seconds}s"
+
+
+class StepTimer:
+    """
+    startRun(key, position, label) when a worklist (or dilution plan) is shown, then
+    step(position, label, forward) after every move. label is what identifies the plates of
+    a step (e.g. source and destination barcodes); the first step shown after the label
+    changed is marked as a plate swap.
+    The dwell of a step is the time from arriving on it until the next move.
+    """
+    def __init__(self, window=WINDOW, slowest=SLOWEST, idleSeconds=IDLE_SECONDS, clock=time.perf_counter):
+        self.window = window
+        self.slowestCount = slowest
+        self.idleSeconds = idleSeconds
+        self.clock = clock
+        self.startRun('')
+        self.running = False   # nothing is timed until the first startRun
+
+    def startRun(self, key, position=0, label=''):
+        self.key = key
+        self.started = time.time()
+        self.records = []          # one tuple per move, in STEP_COLUMNS order
+        self.transfers = 0         # forward steps
+        self.active = 0.0          # work time: dwells capped at idleSeconds
+        self._marks = deque(maxlen=self.window + 1)   # work time at the last forward steps
+        self._slowest = []         # min-heap of (dwell, step index)
+        self._position = position
+        self._label = label
+        self._swapped = False
+        self._since = self.clock()
+        self._wall = self.started
+        self._marks.append(0.0)
+        self.running = True
+
+    def step(self, position, label='', forward=True):
+        if not self.running:
+            return
+        now = self.clock()
+        dwell = now - self._since
+        idle = dwell > self.idleSeconds
+        self.active += self.idleSeconds if idle else dwell
+        index = len(self.records)
+        self.records.append((index, self._position, self._label, 'next' if forward else 'previous',
+                             self._wall, dwell, self._swapped, idle))
+        if forward:
+            self.transfers += 1
+            self._marks.append(self.active)
+        if len(self._slowest) < self.slowestCount:
+            heapq.heappush(self._slowest, (dwell, index))
+        elif dwell > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, (dwell, index))
+        # the plates are swapped while the first step on them is shown
+        self._swapped = label != self._label
+        self._position = position
+        self._label = label
+        self._since = now
+        self._wall = self._wall + dwell
+
+    # transfers per minute over the last `window` forward steps (breaks not counted)
+    def rate(self):
+        span = self._marks[-1] - self._marks[0]
+        return (len(self._marks) - 1) * 60.0 / span if span > 0 else 0.0
+
+    # seconds until `remaining` more transfers are done at the current rate; None before the first
+    def eta(self, remaining):
+        rate = self.rate()
+        return remaining * 60.0 / rate if rate > 0 else None
+
+    def statusText(self, remaining):
+        rate = self.rate()
+        if rate <= 0:
+            return f"{remaining} left"
+        eta = self.eta(remaining)
+        finish = time.strftime("%H:%M", time.localtime(time.time() + eta))
+        return f"{rate:.1f} transfers/min, {remaining} left, done ~{finish} ({formatDuration(eta)})"
+
+    # slowest steps of the run, slowest first: [(dwell seconds, record), ...]
+    def slowest(self):
+        return [(dwell, self.records[index]) for dwell, index in sorted(self._slowest, reverse=True)]
+
+    def frame(self):
+        frame = pd.DataFrame.from_records(self.records, columns=STEP_COLUMNS)
+        frame['started'] = pd.to_datetime(frame['started'], unit='s')
+        return frame
+
+    def report(self):
+        if not self.records:
+            return "No steps recorded."
+        swaps = [r[5] for r in self.records if r[6] and not r[7]]
+        lines = [f"{self.transfers} transfers in {formatDuration(self.active)} of work time "
+                 f"({self.transfers * 60.0 / self.active if self.active > 0 else 0.0:.1f} transfers/min)"]
+        if swaps:
+            lines.append(f"{len(swaps)} plate swaps, {sum(swaps) / len(swaps):.1f} s on average")
+        lines.append("Slowest steps:")
+        for dwell, record in self.slowest():
+            swap = ", plate swap" if record[6] else ""
+            lines.append(f"  row {record[1]} {record[2]}: {dwell:.1f} s{swap}{', break' if record[7] else ''}")
+        return "\n".join(lines)
+
+    def export(self, path=None):
+        """
+        Write the per-step table; .parquet needs pyarrow or fastparquet and falls back to CSV.
+        Returns the path written, None when nothing was recorded.
+        """
+        if not self.records:
+            return None
+        path = path or timingPath(self.key, self.started)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        frame = self.frame()
+        if path.lower().endswith('.parquet'):
+            try:
+                frame.to_parquet(path, index=False)
+                return path
+            except ImportError as e:
+                print("Parquet export not available, writing CSV: " + str(e).splitlines()[0])
+                path = os.path.splitext(path)[0] + '.csv'
+        frame.to_csv(path, index=False)
+        return path
+
+    # end of the run: export the step table and print the report, once
+    def finish(self):
+        if not self.running:
+            return None
+        self.running = False
+        try:
+            path = self.export()
+        except OSError as e:
+            print("Could not write step timings: " + str(e))
+            return None
+        if path:
+            print(self.report())
+            print("Step timings written to " + path)
+        return path
@@ -0,0 +1,218 @@
+# 多段式定時照明排程器
+# 以 time.perf_counter()（單調、高解析度；Windows 上 time.monotonic 只有 ~15 ms 解析度）
+# 計算每一段的絕對期限，不累加 after(1000) 的誤差；指令在建立程式時就先編碼好，
+# 時間到只需把 bytes 交給 sender。
+import heapq
+import time
+from collections import deque
+from threading import Condition, Thread
+
+from panel_protocol import encodeSerialCommand, encodeMaskFrames
+
+
+# 單一段落：亮哪些孔位、什麼顏色、多亮、持續多久
+class Stage:
+    def __init__(self, duration: float, mask_hex=None, rgb=(0, 0, 255), bright=255, label=""):
+        if duration <= 0:
+            raise ValueError("Stage duration must be > 0")
+        self.duration = float(duration)
+        self.mask_hex = mask_hex
+        self.rgb = tuple(rgb)
+        self.bright = bright
+        self.label = label
+
+    # 遮罩是否全空（全空就是「關燈等待」段）
+    def is_off(self) -> bool:
+        return not self.mask_hex or int(self.mask_hex, 16) == 0
+
+    # 預先編碼此段要送出的指令；1536 孔的遮罩超過接收緩衝，分成 M + 幾個 MA
+    def frames(self):
+        if self.is_off():
+            return [encodeSerialCommand(command="X")]
+        return [encodeSerialCommand(command="L", bright=self.bright)] + encodeMaskFrames(bytes.fromhex(self.mask_hex), self.rgb)
+
+
+# 一個完整的定時程式（多段 + 重複次數）
+class TimedProgram:
+    def __init__(self, stages, repeats: int = 1, off_at_end: bool = True):
+        if not stages:
+            raise ValueError("TimedProgram needs at least one stage")
+        self.stages = list(stages)
+        self.repeats = max(1, int(repeats))
+        self.off_at_end = off_at_end
+
+    # 總長度（秒）
+    def duration(self) -> float:
+        return sum(s.duration for s in self.stages) * self.repeats
+
+    # 展開成 (相對起點秒數, frames, 標籤) 的時間軸；最後一筆是結束關燈
+    def timeline(self):
+        events = []
+        t = 0.0
+        for rep in range(self.repeats):
+            for i, stage in enumerate(self.stages):
+                label = stage.label or f"stage {i + 1}"
+                if self.repeats > 1:
+                    label = f"{label} (#{rep + 1})"
+                events.append((t, stage.frames(), label))
+                t += stage.duration
+        events.append((t, [encodeSerialCommand(command="X")] if self.off_at_end else [], "end"))
+        return events
+
+
+# 一次執行中的程式（排程器內部使用）
+class ProgramRun:
+    def __init__(self, name, program: TimedProgram, send, on_event=None):
+        self.name = name
+        self.program = program
+        self.send = send
+        self.on_event = on_event
+        self.events = program.timeline()
+        self.start_time = None
+        self.next_index = 0
+        self.cancelled = False
+        self.finished = False
+        self.jitter_ms = []     # 每個事件的抖動，跑完時印一次摘要
+
+    # 剩餘秒數（直接由時鐘計算，不會漂移）
+    def remaining(self) -> float:
+        if self.start_time is None:
+            return self.program.duration()
+        end = self.start_time + self.events[-1][0]
+        return max(0.0, end - time.perf_counter())
+
+    # 抖動摘要：(事件數, 平均 ms, 最大絕對值 ms)
+    def jitter_summary(self):
+        if not self.jitter_ms:
+            return 0, 0.0, 0.0
+        return len(self.jitter_ms), sum(self.jitter_ms) / len(self.jitter_ms), max(abs(v) for v in self.jitter_ms)
+
+    # 目前所在段落的標籤
+    def current_label(self) -> str:
+        if self.next_index == 0:
+            return ""
+        return self.events[self.next_index - 1][2]
+
+
+# 排程器：單一背景執行緒，同時管理多個（例如每片 plate 一個）定時程式
+class ProgramScheduler:
+    """
+    lead_time：提前多久把指令交給 sender（補償傳輸 + 韌體處理時間）。
+    spin_time：期限前最後這段改用忙等，避開 OS sleep 的粗解析度。
+    """
+    def __init__(self, lead_time: float = 0.005, spin_time: float = 0.02, log_size: int = 1000):
+        self.lead_time = lead_time
+        self.spin_time = spin_time
+        self.runs = {}
+        self.jitter_log = deque(maxlen=log_size)  # (name, label, planned, actual, jitter_ms)
+        self._heap = []
+        self._seq = 0
+        self._cv = Condition()
+        self._stopped = False
+        self._thread = None
+
+    # 啟動（或取代）一個具名程式
+    def start(self, name, program: TimedProgram, send, on_event=None) -> ProgramRun:
+        run = ProgramRun(name, program, send, on_event)
+        with self._cv:
+            old = self.runs.get(name)
+            if old is not None:
+                old.cancelled = True
+            self.runs[name] = run
+            # 起點往後挪 lead_time，第一段就能立刻送出而不被算成延遲
+            run.start_time = time.perf_counter() + self.lead_time
+            self._push(run)
+            self._ensure_thread()
+            self._cv.notify()
+        return run
+
+    # 取消程式（不送關燈指令，由呼叫端決定）；返回後不會再有這個程式的指令送出
+    def cancel(self, name):
+        with self._cv:
+            run = self.runs.pop(name, None)
+            if run is not None:
+                run.cancelled = True
+            self._cv.notify()
+
+    # 取得執行中的程式
+    def get(self, name):
+        return self.runs.get(name)
+
+    # 停止背景執行緒
+    def stop(self):
+        with self._cv:
+            self._stopped = True
+            for run in self.runs.values():
+                run.cancelled = True
+            self.runs.clear()
+            self._cv.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    # 抖動統計（ms）：(筆數, 平均, 最大絕對值)
+    def jitter_stats(self):
+        values = [entry[4] for entry in self.jitter_log]
+        if not values:
+            return 0, 0.0, 0.0
+        return len(values), sum(values) / len(values), max(abs(v) for v in values)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped = False
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _push(self, run: ProgramRun):
+        deadline = run.start_time + run.events[run.next_index][0]
+        self._seq += 1
+        heapq.heappush(self._heap, (deadline, self._seq, run))
+
+    # 主迴圈：粗睡到期限前 spin_time，最後一段忙等，準時交出指令
+    def _run(self):
+        while True:
+            with self._cv:
+                while not self._stopped:
+                    while self._heap and self._heap[0][2].cancelled:
+                        heapq.heappop(self._heap)
+                    if not self._heap:
+                        self._cv.wait()
+                        continue
+                    fire_at = self._heap[0][0] - self.lead_time
+                    wait = fire_at - time.perf_counter() - self.spin_time
+                    if wait <= 0:
+                        break
+                    self._cv.wait(timeout=wait)
+                if self._stopped:
+                    return
+                deadline, _, run = heapq.heappop(self._heap)
+
+            fire_at = deadline - self.lead_time
+            while time.perf_counter() < fire_at:
+                time.sleep(0)  # 讓出 GIL，但不交給 OS 計時器
+            # 檢查取消與交給 sender 要在同一把鎖內：cancel() 返回後呼叫端送的關燈指令
+            # 一定排在這一段的指令之後，不會先清掉再被點亮
+            with self._cv:
+                if run.cancelled:
+                    continue
+                actual = time.perf_counter()
+                _offset, frames, label = run.events[run.next_index]
+                if frames:
+                    run.send(frames)
+            jitter_ms = (actual - fire_at) * 1000.0
+            self.jitter_log.append((run.name, label, fire_at, actual, jitter_ms))
+            run.jitter_ms.append(jitter_ms)
+
+            run.next_index += 1
+            with self._cv:
+                if run.next_index < len(run.events) and not run.cancelled:
+                    self._push(run)
+                else:
+                    run.finished = True
+                    if self.runs.get(run.name) is run:
+                        del self.runs[run.name]
+            # 不在每個事件都寫主控台（會拖慢計時執行緒）：整個程式跑完才印一行
+            if run.finished:
+                count, mean_ms, worst_ms = run.jitter_summary()
+                print(f"[timer] {run.name}: {count} events, jitter avg {mean_ms:+.2f} ms, max {worst_ms:.2f} ms")
+            if run.on_event:
+                run.on_event(run, label)
@@ -0,0 +1,237 @@
+# Source-well volume ledger: starting volumes per plate (default for every well) or per well,
+# kept in a local SQLite file keyed by (barcode, well). Every completed transfer is deducted;
+# the GUI asks for the projected volume before lighting a source well and shows it in a
+# warning colour when the transfer would leave less than the threshold.
+#
+# Per step only in-memory dicts are touched: a well's volumes are read once with a primary
+# key lookup, deductions are queued and written in one transaction per batch (and on close).
+# A transfer is stored with its worklist and a key made from the row's content (its hash and
+# which copy of identical rows it is), so stepping over a row again never deducts it twice,
+# also across restarts and when a live reload inserts or removes rows above it. Refilling a
+# plate (or a well) forgets its transfers, so the same worklist can be run again afterwards.
+import os
+import sqlite3
+import time
+
+from plate_layout import rowName, splitWellName
+from worklist_io import readTable, mapColumns, parseVolume
+from maple_paths import dataPath
+
+WARNING_UL = 10.0
+WARNING_COLOUR = (255, 100, 0)
+NORMAL_COLOUR = (0, 0, 255)
+BATCH_SIZE = 64
+FLUSH_MS = 2000
+VOLUME_COLUMNS = ['Barcode', 'Well', 'Transfer_volume']
+
+SCHEMA_VERSION = 2
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plates (
+    barcode TEXT PRIMARY KEY,
+    start_ul REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS wells (
+    barcode TEXT NOT NULL,
+    well TEXT NOT NULL,
+    start_ul REAL NOT NULL,
+    used_ul REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (barcode, well)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS transfers (
+    run TEXT NOT NULL,
+    row_key TEXT NOT NULL,
+    barcode TEXT NOT NULL,
+    well TEXT NOT NULL,
+    volume_ul REAL NOT NULL,
+    at REAL NOT NULL,
+    PRIMARY KEY (run, row_key)
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS transfer_deducts AFTER INSERT ON transfers
+BEGIN
+    UPDATE wells SET used_ul = used_ul + NEW.volume_ul WHERE barcode = NEW.barcode AND well = NEW.well;
+END;
+"""
+
+
+def ledgerPath():
+    return dataPath("MAPLE_LEDGER", "volumes.sqlite")
+
+
+class VolumeLedger:
+    """
+    startRun(key, hashes) before stepping through a worklist (key: the worklist path, or any
+    name; hashes: its row hashes) and setRows(hashes) after a live reload.
+    deduct(row, barcode, well, volume_ul) when a row is completed; projected(...) and
+    isLow(...) before lighting it. Wells without a starting volume (and no plate default)
+    are not tracked: remaining() returns None and nothing is deducted.
+    """
+    def __init__(self, path=None, warning_ul=WARNING_UL, batch=BATCH_SIZE):
+        self.path = path or ledgerPath()
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        if self.db.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            # version 1 keyed transfers by row position, which a reload can shift
+            self.db.execute("DROP TABLE IF EXISTS transfers")
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.db.executescript(SCHEMA)
+        self.warning_ul = warning_ul
+        self.batch = batch
+        self.run = ''
+        self._rowKeys = None     # row key of every worklist row; None keys rows by position
+        self._done = {}          # row key -> (barcode, well) of the current run's deducted rows
+        self._pending = []       # transfers not written yet
+        self._remaining = {}     # (barcode, well) -> remaining uL, None when untracked
+        self._plates = {}        # barcode -> plate default start volume or None
+        self._wellNames = {}
+
+    # "a01 " -> "A1", so the ledger matches however the worklist spells its wells
+    def wellName(self, well):
+        name = self._wellNames.get(well)
+        if name is None:
+            row, column = splitWellName(str(well))
+            name = self._wellNames[well] = rowName(row) + str(column)
+        return name
+
+    # ---- starting volumes ----
+    # a refill: every well of the plate starts again from the plate default and the
+    # plate's transfers are forgotten, so its rows are deducted again when they are redone
+    def setPlateVolume(self, barcode, start_ul):
+        self.flush()
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO plates (barcode, start_ul) VALUES (?, ?)", (barcode, start_ul))
+            self.db.execute("DELETE FROM wells WHERE barcode = ?", (barcode,))
+            self.db.execute("DELETE FROM transfers WHERE barcode = ?", (barcode,))
+        self._forget(barcode)
+
+    def setWellVolume(self, barcode, well, start_ul):
+        self.flush()
+        well = self.wellName(well)
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO wells (barcode, well, start_ul, used_ul) VALUES (?, ?, ?, 0)",
+                            (barcode, well, start_ul))
+            self.db.execute("DELETE FROM transfers WHERE barcode = ? AND well = ?", (barcode, well))
+        self._forget(barcode, well)
+
+    def importVolumes(self, path, sheet=None):
+        """
+        Read starting volumes from a table with Barcode, Well and Volume columns
+        (a blank Well sets the plate default). Returns the number of entries set.
+        """
+        frame = mapColumns(readTable(path, sheet), VOLUME_COLUMNS)
+        plates, wells = [], []
+        for barcode, well, volume in frame.itertuples(index=False):
+            if not str(barcode).strip() or not str(volume).strip():
+                continue
+            if str(well).strip():
+                wells.append((str(barcode).strip(), well, parseVolume(volume)))
+            else:
+                plates.append((str(barcode).strip(), parseVolume(volume)))
+        # plate defaults first: they reset the plate's wells, which must not undo the per-well
+        # volumes of the same table
+        for barcode, volume in plates:
+            self.setPlateVolume(barcode, volume)
+        for barcode, well, volume in wells:
+            self.setWellVolume(barcode, well, volume)
+        return len(plates) + len(wells)
+
+    def _forget(self, barcode, well=None):
+        self._plates.pop(barcode, None)
+        for key in [k for k in self._remaining if k[0] == barcode and well in (None, k[1])]:
+            del self._remaining[key]
+        for key in [k for k, v in self._done.items() if v[0] == barcode and well in (None, v[1])]:
+            del self._done[key]
+
+    # ---- per step ----
+    # key names the worklist; hashes are its worklist_watch.rowHashes (None: rows by position)
+    def startRun(self, key, hashes=None):
+        self.flush()
+        self.run = str(key)
+        self.setRows(hashes)
+        self._done = {rowKey: (barcode, well) for rowKey, barcode, well in self.db.execute(
+            "SELECT row_key, barcode, well FROM transfers WHERE run = ?", (self.run,))}
+
+    # the worklist was reloaded: rows are looked up by content, wherever they moved
+    def setRows(self, hashes):
+        if hashes is None:
+            self._rowKeys = None
+            return
+        seen = {}
+        keys = []
+        for h in hashes:
+            h = int(h)
+            copy = seen.get(h, 0)
+            seen[h] = copy + 1
+            keys.append(f"{h:016x}.{copy}")
+        self._rowKeys = keys
+
+    def rowKey(self, row):
+        return str(row) if self._rowKeys is None else self._rowKeys[row]
+
+    def remaining(self, barcode, well):
+        try:
+            key = (barcode, self.wellName(well))
+        except (ValueError, IndexError):
+            return None
+        if key not in self._remaining:
+            self._remaining[key] = self._load(*key)
+        return self._remaining[key]
+
+    def _load(self, barcode, well):
+        found = self.db.execute("SELECT start_ul, used_ul FROM wells WHERE barcode = ? AND well = ?",
+                                (barcode, well)).fetchone()
+        pending = sum(t[4] for t in self._pending if t[2] == barcode and t[3] == well)
+        if found is not None:
+            return found[0] - found[1] - pending
+        if barcode not in self._plates:
+            plate = self.db.execute("SELECT start_ul FROM plates WHERE barcode = ?", (barcode,)).fetchone()
+            self._plates[barcode] = plate[0] if plate else None
+        start = self._plates[barcode]
+        return None if start is None else start - pending
+
+    # volume left after this transfer (None when the well is not tracked)
+    def projected(self, barcode, well, volume_ul, row=None):
+        remaining = self.remaining(barcode, well)
+        if remaining is None:
+            return None
+        return remaining if row is not None and self.rowKey(row) in self._done else remaining - volume_ul
+
+    def isLow(self, barcode, well, volume_ul, row=None):
+        projected = self.projected(barcode, well, volume_ul, row)
+        return projected is not None and projected < self.warning_ul
+
+    def deduct(self, row, barcode, well, volume_ul) -> bool:
+        rowKey = self.rowKey(row)
+        if rowKey in self._done:
+            return False
+        remaining = self.remaining(barcode, well)
+        if remaining is None:
+            return False
+        well = self.wellName(well)
+        self._done[rowKey] = (barcode, well)
+        self._remaining[(barcode, well)] = remaining - volume_ul
+        self._pending.append((self.run, rowKey, barcode, well, volume_ul, time.time()))
+        if len(self._pending) >= self.batch:
+            self.flush()
+        return True
+
+    # write the queued deductions in one transaction
+    def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        with self.db:
+            # wells that only have a plate default get their own row on the first transfer
+            self.db.executemany(
+                "INSERT OR IGNORE INTO wells (barcode, well, start_ul) "
+                "SELECT barcode, ?, start_ul FROM plates WHERE barcode = ?",
+                {(t[3], t[2]) for t in pending})
+            self.db.executemany(
+                "INSERT OR IGNORE INTO transfers (run, row_key, barcode, well, volume_ul, at) VALUES (?, ?, ?, ?, ?, ?)",
+                pending)
+
+    def close(self):
+        self.flush()
+        self.db.close()
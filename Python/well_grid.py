@@ -0,0 +1,146 @@
+# 單一 Canvas 繪製的孔位格子：點選、拖曳框選、列/欄表頭切換
+# 只重畫狀態有變化的孔位（舊 bitset XOR 新 bitset），1536 孔也能即時更新。
+import tkinter as tk
+
+from plate_layout import rowName
+from well_selection import WellSelection
+
+# 依密度選格子大小（像素）
+CELL_SIZES = {96: 28, 384: 16, 1536: 9}
+ON_COLOR = "#3A7BFF"
+OFF_COLOR = "#FFFFFF"
+DRAG_COLOR = "#FF8800"
+
+
+class WellGrid(tk.Canvas):
+    def __init__(self, master, rows: int, columns: int, on_change=None, **kwargs):
+        self.cell = CELL_SIZES.get(rows * columns, 16)
+        self.header = max(self.cell, 18)
+        width = self.header + columns * self.cell + 2
+        height = self.header + rows * self.cell + 2
+        super().__init__(master, width=width, height=height, highlightthickness=0, **kwargs)
+        self.selection = WellSelection(rows, columns)
+        self.on_change = on_change
+        self.on_color = ON_COLOR
+        self._drawn_bits = 0
+        self._drag_anchor = None
+        self._drag_rect = None
+        self._items = []
+        self._draw_grid()
+
+        self.bind("<ButtonPress-1>", self._on_press)
+        self.bind("<B1-Motion>", self._on_drag)
+        self.bind("<ButtonRelease-1>", self._on_release)
+
+    # 建立所有孔位矩形與表頭文字（只做一次）
+    def _draw_grid(self):
+        sel = self.selection
+        font = ("TkDefaultFont", 7 if self.cell < 16 else 9)
+        # 密度高時表頭只標部分欄號，避免擠在一起
+        label_every = 1 if self.cell >= 16 else 4
+        for c in range(sel.columns):
+            if c % label_every == 0 or c == sel.columns - 1:
+                x = self.header + c * self.cell + self.cell / 2
+                self.create_text(x, self.header / 2, text=str(c + 1), font=font, tags=("colhdr", f"col{c}"))
+        for r in range(sel.rows):
+            y = self.header + r * self.cell + self.cell / 2
+            self.create_text(self.header / 2, y, text=rowName(r), font=font, tags=("rowhdr", f"row{r}"))
+        for r in range(sel.rows):
+            y0 = self.header + r * self.cell
+            for c in range(sel.columns):
+                x0 = self.header + c * self.cell
+                item = self.create_rectangle(x0, y0, x0 + self.cell - 1, y0 + self.cell - 1,
+                                             fill=OFF_COLOR, outline="#999999")
+                self._items.append(item)
+
+    # 座標 -> (row, col)；表頭回傳 -1
+    def _cell_at(self, x, y):
+        sel = self.selection
+        col = int((x - self.header) // self.cell) if x >= self.header else -1
+        row = int((y - self.header) // self.cell) if y >= self.header else -1
+        if col >= sel.columns or row >= sel.rows:
+            return None
+        return row, col
+
+    # 只更新有變化的孔位
+    def redraw(self):
+        changed = self._drawn_bits ^ self.selection.bits
+        bits = self.selection.bits
+        for idx in self.selection.indices(changed):
+            self.itemconfigure(self._items[idx], fill=self.on_color if bits >> idx & 1 else OFF_COLOR)
+        self._drawn_bits = bits
+        if self.on_change:
+            self.on_change(self.selection)
+
+    # 更換選取顏色時整片重畫
+    def set_on_color(self, color: str):
+        self.on_color = color
+        self._drawn_bits = 0
+        for idx in self.selection.indices():
+            self.itemconfigure(self._items[idx], fill=color)
+        self._drawn_bits = self.selection.bits
+
+    def fill(self):
+        self.selection.fill()
+        self.redraw()
+
+    def clear(self):
+        self.selection.clear()
+        self.redraw()
+
+    def invert(self):
+        self.selection.invert()
+        self.redraw()
+
+    # 滑鼠按下：表頭切換整列/整欄，孔位開始拖曳
+    def _on_press(self, event):
+        cell = self._cell_at(event.x, event.y)
+        if cell is None:
+            return
+        row, col = cell
+        sel = self.selection
+        if row < 0 and col < 0:
+            self.invert()
+        elif row < 0:
+            sel.set_column(col, not sel.column_full(col))
+            self.redraw()
+        elif col < 0:
+            sel.set_row(row, not sel.row_full(row))
+            self.redraw()
+        else:
+            # 起點已選 -> 這次拖曳是取消選取；反之為選取
+            self._drag_anchor = (row, col, not sel.is_selected(sel.index(row, col)))
+            self._update_drag_rect(row, col)
+
+    def _on_drag(self, event):
+        if self._drag_anchor is None:
+            return
+        cell = self._cell_at(max(event.x, self.header), max(event.y, self.header))
+        if cell is not None:
+            self._update_drag_rect(*cell)
+
+    def _on_release(self, event):
+        if self._drag_anchor is None:
+            return
+        r0, c0, state = self._drag_anchor
+        cell = self._cell_at(max(event.x, self.header), max(event.y, self.header))
+        r1, c1 = cell if cell is not None else self._drag_end
+        self.selection.apply(self.selection.rect_mask(r0, c0, r1, c1), state)
+        self._drag_anchor = None
+        if self._drag_rect is not None:
+            self.delete(self._drag_rect)
+            self._drag_rect = None
+        self.redraw()
+
+    # 拖曳中的框線
+    def _update_drag_rect(self, row, col):
+        r0, c0, _ = self._drag_anchor
+        self._drag_end = (row, col)
+        x0 = self.header + min(c0, col) * self.cell
+        y0 = self.header + min(r0, row) * self.cell
+        x1 = self.header + (max(c0, col) + 1) * self.cell - 1
+        y1 = self.header + (max(r0, row) + 1) * self.cell - 1
+        if self._drag_rect is None:
+            self._drag_rect = self.create_rectangle(x0, y0, x1, y1, outline=DRAG_COLOR, width=2)
+        else:
+            self.coords(self._drag_rect, x0, y0, x1, y1)
@@ -0,0 +1,94 @@
+# 孔位選取模型：用一個 Python int 當 bitset（row-major，bit0=A01，LSB-first）
+# 整列/整欄/矩形/全選/反選都是整數位元運算，遮罩直接 int.to_bytes 轉成韌體要的 bytes。
+
+
+class WellSelection:
+    def __init__(self, rows: int, columns: int):
+        self.rows = rows
+        self.columns = columns
+        self.size = rows * columns
+        self.nbytes = (self.size + 7) // 8
+        self.full = (1 << self.size) - 1
+        # 預先算好每一列、每一欄的遮罩
+        self.row_masks = [((1 << columns) - 1) << (r * columns) for r in range(rows)]
+        column0 = 0
+        for r in range(rows):
+            column0 |= 1 << (r * columns)
+        self.column_masks = [column0 << c for c in range(columns)]
+        self.bits = 0
+
+    # 孔位 index（0-based row, col）
+    def index(self, row: int, col: int) -> int:
+        return row * self.columns + col
+
+    def is_selected(self, idx: int) -> bool:
+        return bool(self.bits >> idx & 1)
+
+    def set(self, idx: int, state: bool = True):
+        if state:
+            self.bits |= 1 << idx
+        else:
+            self.bits &= ~(1 << idx)
+
+    def toggle(self, idx: int):
+        self.bits ^= 1 << idx
+
+    # 對某個遮罩整批設定
+    def apply(self, mask: int, state: bool = True):
+        if state:
+            self.bits |= mask
+        else:
+            self.bits &= ~mask
+
+    # 矩形範圍的遮罩（含兩端點，順序不拘）
+    def rect_mask(self, r0: int, c0: int, r1: int, c1: int) -> int:
+        r0, r1 = sorted((r0, r1))
+        c0, c1 = sorted((c0, c1))
+        segment = ((1 << (c1 - c0 + 1)) - 1) << c0
+        mask = 0
+        for r in range(r0, r1 + 1):
+            mask |= segment << (r * self.columns)
+        return mask
+
+    def set_row(self, row: int, state: bool = True):
+        self.apply(self.row_masks[row], state)
+
+    def set_column(self, col: int, state: bool = True):
+        self.apply(self.column_masks[col], state)
+
+    # 整列/整欄是否全選（列、欄表頭的狀態）
+    def row_full(self, row: int) -> bool:
+        return self.bits & self.row_masks[row] == self.row_masks[row]
+
+    def column_full(self, col: int) -> bool:
+        return self.bits & self.column_masks[col] == self.column_masks[col]
+
+    def fill(self):
+        self.bits = self.full
+
+    def clear(self):
+        self.bits = 0
+
+    def invert(self):
+        self.bits ^= self.full
+
+    def count(self) -> int:
+        return bin(self.bits).count("1")
+
+    # 逐一列出被選的 index（只走被設定的位元）
+    def indices(self, bits=None):
+        bits = self.bits if bits is None else bits
+        while bits:
+            low = bits & -bits
+            yield low.bit_length() - 1
+            bits ^= low
+
+    # 遮罩 bytes / 十六進位字串（LSB-first：bit0=A01 在第 0 byte 的 bit0）
+    def to_bytes(self) -> bytes:
+        return self.bits.to_bytes(self.nbytes, "little")
+
+    def mask_hex(self) -> str:
+        return self.to_bytes().hex().upper()
+
+    def load_hex(self, mask_hex: str):
+        self.bits = int.from_bytes(bytes.fromhex(mask_hex), "little") & self.full
@@ -0,0 +1,221 @@
+# Compiled worklist cache: a worklist is parsed once into a fixed-width record array (string
+# table ids per cell, well positions, volumes in uL) and written next to a string table.
+# Reopening the same file maps the records with numpy.memmap instead of parsing text again.
+# The table still needs a DataFrame (pandastable keeps one), so frame() builds categorical
+# columns: small integer codes per cell over one shared, sorted index of the string table,
+# instead of a Python object reference per cell. Volumes and well positions are read from the
+# mapped records (volumes(), wellIndex()) without going through the strings at all.
+#
+# File layout (little-endian):
+#   b"MAPLEWLC" <I header length> <header JSON> padding to 64 bytes
+#   records   structured array, one row per worklist row
+#   strings   <I count> <I offsets[count + 1]> utf-8 blob
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from plate_layout import splitWellName
+from worklist_io import readWorklist, parseVolumes
+from maple_paths import dataPath
+
+MAGIC = b"MAPLEWLC"
+VERSION = 1
+ALIGN = 64
+# well position code: row << 8 | column (1-based column), NO_WELL when unreadable
+NO_WELL = 0xFFFF
+WELL_COLUMNS = ('Source_well', 'Destination_well', 'Well')
+VOLUME_COLUMN = 'Transfer_volume'
+
+
+def cacheDirectory():
+    return dataPath("MAPLE_CACHE_DIR", "worklists")
+
+
+# one cache file per (source file, sheet, column layout)
+def cachePath(path, columns, sheet=None):
+    key = "|".join([os.path.abspath(path), str(sheet), ",".join(columns)])
+    return os.path.join(cacheDirectory(), hashlib.sha1(key.encode("utf-8")).hexdigest() + ".mwc")
+
+
+def fileDigest(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def recordDtype(columns):
+    fields = [(name, '<u4') for name in columns]
+    fields += [(name + '_pos', '<u2') for name in columns if name in WELL_COLUMNS]
+    if VOLUME_COLUMN in columns:
+        fields.append((VOLUME_COLUMN + '_ul', '<f8'))
+    return np.dtype(fields)
+
+
+def _wellCodes(strings):
+    codes = np.full(len(strings), NO_WELL, dtype=np.uint16)
+    for i, text in enumerate(strings):
+        try:
+            row, column = splitWellName(text)
+        except (ValueError, IndexError):
+            continue
+        if 0 <= row < 256 and 0 < column < 256:
+            codes[i] = row << 8 | column
+    return codes
+
+
+class CompiledWorklist:
+    """
+    records: structured array (memory-mapped when opened from the cache)
+    strings: the string table the u4 columns point into
+    """
+    def __init__(self, columns, records, strings):
+        self.columns = list(columns)
+        self.records = records
+        self.strings = strings
+        self._categories = None
+
+    @classmethod
+    def compile(cls, frame, columns):
+        # one shared table of distinct cell texts; every cell becomes an index into it
+        codes, strings = pd.factorize(pd.concat([frame[c].astype(str) for c in columns], ignore_index=True))
+        strings = [str(s) for s in strings]
+        count = len(frame.index)
+        records = np.zeros(count, dtype=recordDtype(columns))
+        for k, name in enumerate(columns):
+            records[name] = codes[k * count:(k + 1) * count]
+        wells = None
+        for name in columns:
+            if name in WELL_COLUMNS:
+                if wells is None:
+                    wells = _wellCodes(strings)
+                records[name + '_pos'] = wells[records[name]]
+        if VOLUME_COLUMN in columns:
+            volumes = parseVolumes(pd.Series(strings, dtype=object))
+            records[VOLUME_COLUMN + '_ul'] = volumes[records[VOLUME_COLUMN]]
+        return cls(columns, records, strings)
+
+    def __len__(self):
+        return len(self.records)
+
+    # the string table sorted (so the table sorts a column the same way as text) and, for every
+    # string table id, its position in that order
+    def _sortedStrings(self):
+        if self._categories is None:
+            table = np.array(self.strings, dtype=object)
+            order = np.argsort(table, kind='stable')
+            rank = np.empty(len(order), dtype=np.int64)
+            rank[order] = np.arange(len(order))
+            self._categories = pd.CategoricalDtype(pd.Index(table[order], dtype=object)), rank
+        return self._categories
+
+    # DataFrame with the values readWorklist() returns, as categorical columns that share one
+    # dtype; cells are codes, not strings. Row hashes are the same as for the parsed frame.
+    # A value typed into the table that is not in the worklist cannot be stored in such a column.
+    def frame(self):
+        dtype, rank = self._sortedStrings()
+        return pd.DataFrame({name: pd.Categorical.from_codes(rank[self.records[name]], dtype=dtype)
+                             for name in self.columns})
+
+    # row-major well indices for one plate size (-1 when unreadable or outside the plate)
+    def wellIndex(self, name, rows, columns):
+        pos = self.records[name + '_pos'].astype(np.int64)
+        row, column = pos >> 8, (pos & 0xFF) - 1
+        ok = (pos != NO_WELL) & (row < rows) & (column >= 0) & (column < columns)
+        return np.where(ok, row * columns + column, -1)
+
+    def volumes(self):
+        return self.records[VOLUME_COLUMN + '_ul']
+
+    def write(self, target, source):
+        stat = os.stat(source)
+        blobs = [s.encode("utf-8") for s in self.strings]
+        offsets = np.zeros(len(blobs) + 1, dtype='<u4')
+        np.cumsum([len(b) for b in blobs], out=offsets[1:])
+        header = json.dumps({
+            "version": VERSION,
+            "source": os.path.abspath(source),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "digest": fileDigest(source),
+            "columns": self.columns,
+            "dtype": self.records.dtype.descr,
+            "rows": len(self.records),
+        }).encode("utf-8")
+        start = -(-(len(MAGIC) + 4 + len(header)) // ALIGN) * ALIGN
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # write to a temp file first so a crash never leaves a half written cache behind
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(MAGIC + np.uint32(len(header)).tobytes() + header)
+                f.write(b"\0" * (start - f.tell()))
+                f.write(np.ascontiguousarray(self.records).tobytes())
+                f.write(np.uint32(len(blobs)).tobytes())
+                f.write(offsets.tobytes())
+                f.write(b"".join(blobs))
+            os.replace(temp, target)
+        except BaseException:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+
+
+def _readHeader(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        return None, 0
+    length = int(np.frombuffer(f.read(4), dtype='<u4')[0])
+    header = json.loads(f.read(length).decode("utf-8"))
+    start = -(-(len(MAGIC) + 4 + length) // ALIGN) * ALIGN
+    return header, start
+
+
+# compiled worklist from the cache, or None when missing or stale
+def openCompiled(path, columns, sheet=None):
+    target = cachePath(path, columns, sheet)
+    try:
+        with open(target, "rb") as f:
+            header, start = _readHeader(f)
+            if header is None or header["version"] != VERSION or header["columns"] != list(columns):
+                return None
+            stat = os.stat(path)
+            if stat.st_size != header["size"]:
+                return None
+            # same mtime: trust it; touched or copied file: compare the content
+            if stat.st_mtime_ns != header["mtime_ns"] and fileDigest(path) != header["digest"]:
+                return None
+            dtype = np.dtype([tuple(field) for field in header["dtype"]])
+            rows = header["rows"]
+            f.seek(start + rows * dtype.itemsize)
+            count = int(np.frombuffer(f.read(4), dtype='<u4')[0])
+            offsets = np.frombuffer(f.read(4 * (count + 1)), dtype='<u4')
+            blob = f.read(int(offsets[-1]))
+        strings = [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(count)]
+        records = np.memmap(target, dtype=dtype, mode='r', offset=start, shape=(rows,)) if rows else \
+            np.zeros(0, dtype=dtype)
+        return CompiledWorklist(columns, records, strings)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def loadCompiled(path, columns, sheet=None):
+    """Compiled worklist for path: from the cache when it is current, otherwise parsed and cached."""
+    compiled = openCompiled(path, columns, sheet)
+    if compiled is not None:
+        return compiled
+    compiled = CompiledWorklist.compile(readWorklist(path, columns, sheet=sheet), columns)
+    try:
+        compiled.write(cachePath(path, columns, sheet), path)
+    except OSError as e:
+        print(f"Worklist cache not written: {e}")
+    return compiled
+
+
+# drop-in for readWorklist() in the GUIs (categorical columns, see CompiledWorklist.frame)
+def readWorklistCached(path, columns, sheet=None):
+    return loadCompiled(path, columns, sheet).frame()
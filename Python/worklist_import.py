@@ -0,0 +1,143 @@
+# Multi-file worklist import: every file is read and checked in its own worker process, the
+# Tk loop only polls the futures, and the results are merged in the order the files were
+# picked with the file name and row number kept on every row.
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from worklist_cache import readWorklistCached
+
+# provenance columns added to merged worklists
+FILE_COLUMN = 'Source_file'
+ROW_COLUMN = 'File_row'
+# columns that must hold a well name, per layout
+WELL_COLUMNS = ('Source_well', 'Destination_well', 'Well')
+POLL_MS = 100
+
+_wellPattern = re.compile(r'^[A-Za-z]{1,2}0*[1-9][0-9]*$')
+
+
+# describe rows whose well names cannot be lit (1-based, as the operator sees them in Excel)
+def validateWorklist(frame):
+    problems = []
+    for column in WELL_COLUMNS:
+        if column not in frame.columns:
+            continue
+        bad = ~frame[column].astype(str).str.strip().str.match(_wellPattern)
+        if bad.any():
+            rows = (frame.index[bad] + 2).tolist()
+            shown = ', '.join(str(r) for r in rows[:10]) + (' ...' if len(rows) > 10 else '')
+            problems.append(f"{column}: {len(rows)} unreadable well name(s) on row {shown}")
+    return problems
+
+
+# runs in a worker process, so it only takes and returns picklable values
+def loadWorklistFile(path, columns):
+    frame = readWorklistCached(path, columns)
+    return frame, validateWorklist(frame)
+
+
+def mergeWorklists(paths, frames):
+    parts = []
+    for path, frame in zip(paths, frames):
+        frame = frame.copy()
+        frame[FILE_COLUMN] = os.path.basename(path)
+        frame[ROW_COLUMN] = range(1, len(frame.index) + 1)
+        parts.append(frame)
+    if not parts:
+        return pd.DataFrame()
+    return pd.concat(parts, ignore_index=True)
+
+
+class WorklistImport:
+    """
+    Start with start(); the Tk loop calls poll() (through after()) until it returns True.
+    on_progress(done, total, path) runs on the Tk thread for every finished file and
+    on_done(frame, problems) once at the end, unless the import was cancelled.
+    A file that fails to load is reported in problems and left out of the merge.
+    """
+    def __init__(self, master, paths, columns, on_done, on_progress=None, workers=None):
+        self.master = master
+        self.paths = list(paths)
+        self.columns = columns
+        self.on_done = on_done
+        self.on_progress = on_progress
+        self.workers = workers or min(len(self.paths), os.cpu_count() or 1)
+        self.executor = None
+        self.futures = []
+        self.reported = set()
+        self.cancelled = False
+
+    def start(self):
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.futures = [self.executor.submit(loadWorklistFile, path, self.columns) for path in self.paths]
+        self.master.after(POLL_MS, self.poll)
+
+    def cancel(self):
+        self.cancelled = True
+        if self.executor is not None:
+            # running files finish in the background; their results are dropped
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def poll(self):
+        if self.cancelled:
+            return True
+        for i, future in enumerate(self.futures):
+            if i not in self.reported and future.done():
+                self.reported.add(i)
+                if self.on_progress:
+                    self.on_progress(len(self.reported), len(self.futures), self.paths[i])
+        if len(self.reported) < len(self.futures):
+            self.master.after(POLL_MS, self.poll)
+            return False
+        self.executor.shutdown(wait=False)
+        paths, frames, problems = [], [], []
+        for path, future in zip(self.paths, self.futures):
+            name = os.path.basename(path)
+            try:
+                frame, fileProblems = future.result()
+            except Exception as e:
+                problems.append(f"{name}: not loaded ({e})")
+                continue
+            paths.append(path)
+            frames.append(frame)
+            problems.extend(f"{name}: {p}" for p in fileProblems)
+        self.on_done(mergeWorklists(paths, frames), problems)
+        return True
+
+
+def importWorklists(master, paths, columns, on_done):
+    """
+    Show a small progress window with a Cancel button while the files load.
+    on_done(frame, problems) is only called when the import was not cancelled.
+    """
+    import tkinter
+    from tkinter import ttk
+    dialog = tkinter.Toplevel(master)
+    dialog.title("Loading worklists")
+    dialog.transient(master)
+    status = tkinter.StringVar(dialog, value=f"0 of {len(paths)} files")
+    tkinter.Label(dialog, textvariable=status, width=40).pack(padx=10, pady=(10, 2))
+    bar = ttk.Progressbar(dialog, maximum=len(paths), length=280)
+    bar.pack(padx=10, pady=2)
+
+    def progress(done, total, path):
+        bar['value'] = done
+        status.set(f"{done} of {total} files ({os.path.basename(path)})")
+
+    def finished(frame, problems):
+        dialog.destroy()
+        on_done(frame, problems)
+
+    job = WorklistImport(master, paths, columns, finished, progress)
+
+    def cancel():
+        job.cancel()
+        dialog.destroy()
+
+    tkinter.Button(dialog, text="Cancel", command=cancel).pack(padx=10, pady=(2, 10))
+    dialog.protocol("WM_DELETE_WINDOW", cancel)
+    job.start()
+    return job
@@ -0,0 +1,161 @@
+# Worklist loading for the light guide GUIs: CSV plus native xlsx/xls/xlsb/ods,
+# read through the fastest Excel engine that is installed (calamine first).
+import os
+import re
+import pandas as pd
+
+CHERRYPICK_COLUMNS = ['Source_barcode', 'Destination_barcode', 'Source_well', 'Destination_well', 'Transfer_volume']
+SINGLE_PLATE_COLUMNS = ['Barcode', 'Well', 'Transfer_volume']
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm', '.xls', '.xlsb', '.ods')
+WORKLIST_FILETYPES = [("Worklists", "*.csv *.xlsx *.xlsm *.xls *.xlsb *.ods"), ("All files", "*.*")]
+
+# engines to try for each extension, fastest first
+EXCEL_ENGINES = {
+    '.xlsx': ['calamine', 'openpyxl'],
+    '.xlsm': ['calamine', 'openpyxl'],
+    '.xls': ['calamine', 'xlrd'],
+    '.xlsb': ['calamine', 'pyxlsb'],
+    '.ods': ['calamine', 'odf'],
+}
+
+# header spellings seen in vendor exports (Echo, Biomek, ...), compared after normalizeHeader
+COLUMN_ALIASES = {
+    'Source_barcode': ['sourcebarcode', 'sourceplatebarcode', 'srcbarcode', 'sourceplate'],
+    'Destination_barcode': ['destinationbarcode', 'destinationplatebarcode', 'destbarcode', 'destinationplate', 'destplate'],
+    'Source_well': ['sourcewell', 'srcwell'],
+    'Destination_well': ['destinationwell', 'destwell'],
+    'Transfer_volume': ['transfervolume', 'volume', 'transfervol', 'vol'],
+    'Barcode': ['barcode', 'platebarcode', 'plate'],
+    'Well': ['well', 'wellname', 'position'],
+}
+
+
+def normalizeHeader(name):
+    return re.sub(r'[^a-z0-9]', '', str(name).lower())
+
+
+def _excelEngines(path):
+    return EXCEL_ENGINES.get(os.path.splitext(path)[1].lower(), ['calamine', 'openpyxl'])
+
+
+def listSheets(path):
+    if os.path.splitext(path)[1].lower() not in EXCEL_EXTENSIONS:
+        return []
+    try:
+        from python_calamine import CalamineWorkbook
+        return list(CalamineWorkbook.from_path(path).sheet_names)
+    except ImportError:
+        pass
+    lastError = None
+    for engine in _excelEngines(path)[1:]:
+        try:
+            with pd.ExcelFile(path, engine=engine) as workbook:
+                return list(workbook.sheet_names)
+        except ImportError as e:
+            lastError = e
+    raise ImportError(f"No Excel engine available for {path}: {lastError}")
+
+
+def readTable(path, sheet=None):
+    """Read any CSV/spreadsheet table as strings, headers untouched."""
+    if os.path.splitext(path)[1].lower() not in EXCEL_EXTENSIONS:
+        return pd.read_csv(path, header=0, dtype=str, keep_default_na=False, encoding='utf-8-sig')
+    lastError = None
+    for engine in _excelEngines(path):
+        try:
+            return pd.read_excel(path, sheet_name=sheet if sheet is not None else 0, header=0,
+                                 dtype=str, keep_default_na=False, engine=engine)
+        except ImportError as e:
+            lastError = e
+    raise ImportError(f"No Excel engine available for {path}: {lastError}")
+
+
+def mapColumns(frame, columns, columnMap=None):
+    """
+    Rename the columns of a raw worklist to the names the GUIs expect.
+    Headers are matched by name (columnMap first, then COLUMN_ALIASES); when
+    they do not all match, fall back to position like the original
+    pd.read_csv(names=columns, header=0) did.
+    """
+    lookup = {}
+    for target in columns:
+        for alias in [target] + COLUMN_ALIASES.get(target, []):
+            lookup.setdefault(normalizeHeader(alias), target)
+    for source, target in (columnMap or {}).items():
+        lookup[normalizeHeader(source)] = target
+
+    renamed = {}
+    for header in frame.columns:
+        target = lookup.get(normalizeHeader(header))
+        if target in columns and target not in renamed.values():
+            renamed[header] = target
+    if len(renamed) == len(columns):
+        return frame.rename(columns=renamed)[columns]
+
+    if len(frame.columns) < len(columns):
+        raise ValueError(f"Expected {len(columns)} columns ({', '.join(columns)}), found {len(frame.columns)}")
+    frame = frame.iloc[:, :len(columns)]
+    frame.columns = columns
+    return frame
+
+
+def readWorklist(path, columns, sheet=None, columnMap=None):
+    frame = readTable(path, sheet)
+    frame = mapColumns(frame, columns, columnMap)
+    # drop trailing blank rows that spreadsheets like to keep
+    blank = (frame == '').all(axis=1)
+    if blank.any():
+        frame = frame[~blank].reset_index(drop=True)
+    return frame
+
+
+# "1ml", "250 uL", "2.5" -> microlitres (a bare number is taken as uL)
+VOLUME_UNITS = {'nl': 0.001, 'ul': 1.0, 'µl': 1.0, 'ml': 1000.0, 'l': 1000000.0}
+_volumePattern = re.compile(r'^\s*([0-9]*\.?[0-9]+)\s*([a-zµ]*)\s*$', re.IGNORECASE)
+
+
+def parseVolume(text):
+    match = _volumePattern.match(str(text))
+    if not match:
+        raise ValueError(f"Unreadable volume: {text!r}")
+    unit = match.group(2).lower() or 'ul'
+    if unit not in VOLUME_UNITS:
+        raise ValueError(f"Unknown volume unit: {text!r}")
+    return float(match.group(1)) * VOLUME_UNITS[unit]
+
+
+# vectorised parseVolume for a whole column; unreadable cells become NaN
+def parseVolumes(series):
+    parts = series.astype(str).str.extract(_volumePattern)
+    numbers = pd.to_numeric(parts[0], errors='coerce')
+    factors = parts[1].str.lower().replace('', 'ul').map(VOLUME_UNITS)
+    return (numbers * factors).to_numpy(dtype=float)
+
+
+def askSheetName(master, path):
+    """
+    Return the sheet to load: None for CSV, the only sheet, or the one the
+    operator picks. An empty string means the dialog was cancelled.
+    """
+    sheets = listSheets(path)
+    if len(sheets) <= 1:
+        return sheets[0] if sheets else None
+
+    import tkinter
+    dialog = tkinter.Toplevel(master)
+    dialog.title("Select sheet")
+    dialog.transient(master)
+    choice = tkinter.StringVar(dialog, value=sheets[0])
+    tkinter.Label(dialog, text=os.path.basename(path)).pack(padx=10, pady=(10, 2))
+    tkinter.OptionMenu(dialog, choice, *sheets).pack(padx=10, pady=2)
+    result = {}
+
+    def accept():
+        result['sheet'] = choice.get()
+        dialog.destroy()
+
+    tkinter.Button(dialog, text="OK", command=accept).pack(padx=10, pady=(2, 10))
+    dialog.grab_set()
+    master.wait_window(dialog)
+    return result.get('sheet', '')
@@ -0,0 +1,215 @@
+# Synthetic worklists for load testing: cherrypick and single-plate files in the column
+# layouts the GUIs read, at any size, plate density and barcode count, with an optional
+# share of deliberately broken rows. The bench command times what openFile does with
+# such a file (parse, cache compile, cached reopen, validation, volumes, reload hashes)
+# and how much memory the loaded worklist takes.
+#
+#   python worklist_synth.py generate big.csv --rows 1000000 --density 1536 --plates 40
+#   python worklist_synth.py bench --sizes 1000,100000,1000000 --layout single
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from plate_layout import wellNames
+from worklist_io import CHERRYPICK_COLUMNS, SINGLE_PLATE_COLUMNS, readWorklist, parseVolumes
+
+LAYOUTS = {'cherrypick': CHERRYPICK_COLUMNS, 'single': SINGLE_PLATE_COLUMNS}
+VOLUMES = np.array(['0.5ul', '1ul', '2ul', '5ul', '10ul', '25ul', '50ul', '100ul', '1ml', '2ml'], dtype=object)
+# kinds of damage, applied in turn to the rows picked as malformed, and what each looks like
+DAMAGE = ('well', 'volume', 'barcode')
+MALFORMED_WELLS = np.array(['', 'Z99', 'A0', '12A', 'A1B'], dtype=object)
+MALFORMED_VOLUMES = np.array(['', 'abc', '5 gallons', '-'], dtype=object)
+
+
+def plateBarcodes(prefix, count):
+    return np.array([f"{prefix}{i + 1:06d}" for i in range(count)], dtype=object)
+
+
+def generateWorklist(rows, layout='cherrypick', density=384, plates=4, malformed=0.0, seed=0):
+    """
+    Build a worklist frame of strings like the ones readWorklist returns.
+    cherrypick: rows are grouped by source plate (one of `plates` barcodes) with random
+    source wells; destination plates are filled well after well, column by column.
+    single: `plates` barcodes share the rows in blocks, wells cycle column by column.
+    malformed: share of rows (0..1) that get an unreadable well, volume or barcode.
+    Returns (frame, malformedRows) with the 0-based positions of the broken rows.
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout: {layout}")
+    rng = np.random.default_rng(seed)
+    wells = np.array(wellNames(density, byColumn=True), dtype=object)
+    plates = max(1, int(plates))
+    volumes = VOLUMES[rng.integers(0, len(VOLUMES), rows)]
+
+    if layout == 'cherrypick':
+        sourcePlate = np.sort(rng.integers(0, plates, rows))
+        destinations = plateBarcodes('DST', max(1, math.ceil(rows / density)))
+        order = np.arange(rows)
+        data = {
+            'Source_barcode': plateBarcodes('SRC', plates)[sourcePlate],
+            'Destination_barcode': destinations[order // density],
+            'Source_well': wells[rng.integers(0, density, rows)],
+            'Destination_well': wells[order % density],
+            'Transfer_volume': volumes,
+        }
+    else:
+        perPlate = max(1, math.ceil(rows / plates))
+        order = np.arange(rows)
+        data = {
+            'Barcode': plateBarcodes('PLT', plates)[order // perPlate],
+            'Well': wells[(order % perPlate) % density],
+            'Transfer_volume': volumes,
+        }
+
+    malformedRows = np.array([], dtype=np.int64)
+    if malformed > 0 and rows:
+        count = min(rows, max(1, int(round(rows * malformed))))
+        malformedRows = np.sort(rng.choice(rows, count, replace=False))
+        kind = np.arange(count) % len(DAMAGE)
+        wellColumn = 'Source_well' if layout == 'cherrypick' else 'Well'
+        barcodeColumn = 'Source_barcode' if layout == 'cherrypick' else 'Barcode'
+        target = malformedRows[kind == 0]
+        data[wellColumn][target] = MALFORMED_WELLS[np.arange(len(target)) % len(MALFORMED_WELLS)]
+        target = malformedRows[kind == 1]
+        data['Transfer_volume'][target] = MALFORMED_VOLUMES[np.arange(len(target)) % len(MALFORMED_VOLUMES)]
+        data[barcodeColumn][malformedRows[kind == 2]] = ''
+    return pd.DataFrame(data, columns=LAYOUTS[layout]), malformedRows
+
+
+# rows of a loaded worklist that cannot be used, per kind of damage: a well name that is not on
+# a plate of this density, a volume that does not parse, an empty barcode; 'rows' counts rows
+# with any of them
+def countMalformed(frame, layout='cherrypick', density=384):
+    wellColumn = 'Source_well' if layout == 'cherrypick' else 'Well'
+    barcodeColumn = 'Source_barcode' if layout == 'cherrypick' else 'Barcode'
+    plateWells = pd.Index(wellNames(density)).str.upper()
+    wells = frame[wellColumn].astype(str).str.strip().str.upper()
+    wells = wells.str.replace(r'^([A-Z]{1,2})0+(?=\d)', r'\1', regex=True)   # A01 -> A1
+    bad = {
+        'well': ~wells.isin(plateWells).to_numpy(),
+        'volume': np.isnan(parseVolumes(frame['Transfer_volume'])),
+        'barcode': (frame[barcodeColumn].astype(str).str.strip() == '').to_numpy(),
+    }
+    counts = {kind: int(rows.sum()) for kind, rows in bad.items()}
+    counts['rows'] = int(np.logical_or.reduce(list(bad.values())).sum())
+    return counts
+
+
+# same encoding as the sample files (utf-8 with a BOM)
+def writeWorklist(frame, path):
+    frame.to_csv(path, index=False, encoding='utf-8-sig')
+
+
+def _timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def benchmarkLoad(sizes, layout='cherrypick', density=384, plates=4, malformed=0.001, directory=None):
+    """
+    Time the openFile path for one generated file per size. Returns one dict per size
+    with seconds for each stage, the file size and memory in bytes (the parsed frame and the
+    frame reopened from the compiled cache), and the broken rows:
+    injected and found per kind of damage (DAMAGE), and 'flagged' rows with any damage.
+    The compiled cache goes to a scratch directory so the user's cache is not touched.
+    """
+    from worklist_import import validateWorklist
+    from worklist_watch import rowHashes
+    columns = LAYOUTS[layout]
+    results = []
+    with tempfile.TemporaryDirectory(dir=directory) as scratch:
+        previousCache = os.environ.get('MAPLE_CACHE_DIR')
+        os.environ['MAPLE_CACHE_DIR'] = os.path.join(scratch, 'cache')
+        try:
+            from worklist_cache import readWorklistCached
+            for size in sizes:
+                path = os.path.join(scratch, f"{layout}-{density}-{size}.csv")
+                (frame, broken), generate = _timed(generateWorklist, size, layout, density, plates, malformed)
+                _, write = _timed(writeWorklist, frame, path)
+                del frame
+
+                tracemalloc.start()
+                frame, parse = _timed(readWorklist, path, columns)
+                _current, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                resident = int(frame.memory_usage(deep=True).sum())
+                del frame
+
+                _, compile_ = _timed(readWorklistCached, path, columns)
+                frame, cached = _timed(readWorklistCached, path, columns)
+                cachedResident = int(frame.memory_usage(deep=True).sum())
+                _, validate = _timed(validateWorklist, frame)
+                _, volumes = _timed(parseVolumes, frame['Transfer_volume'])
+                _, hashes = _timed(rowHashes, frame)
+                injected = np.bincount(np.arange(len(broken)) % len(DAMAGE), minlength=len(DAMAGE))
+                found = countMalformed(frame, layout, density)
+                results.append({
+                    'rows': size, 'malformed': len(broken), 'flagged': found['rows'],
+                    'injected': dict(zip(DAMAGE, injected.tolist())),
+                    'found': {kind: found[kind] for kind in DAMAGE},
+                    'file_bytes': os.path.getsize(path), 'generate': generate, 'write': write,
+                    'parse': parse, 'parse_peak_bytes': peak, 'frame_bytes': resident,
+                    'compile': compile_, 'cached': cached, 'cached_frame_bytes': cachedResident, 'validate': validate,
+                    'volumes': volumes, 'hashes': hashes,
+                })
+                del frame
+                os.remove(path)
+        finally:
+            if previousCache is None:
+                os.environ.pop('MAPLE_CACHE_DIR', None)
+            else:
+                os.environ['MAPLE_CACHE_DIR'] = previousCache
+    return results
+
+
+def _printResults(results):
+    header = f"{'rows':>10} {'file MB':>8} {'parse s':>8} {'peak MB':>8} {'frame MB':>9} {'compile s':>9} " \
+             f"{'cached s':>9} {'cframe MB':>9} {'valid s':>8} {'vol s':>7} {'hash s':>7} {'broken':>7} {'flagged':>7}" + \
+             "".join(f" {kind + 's':>13}" for kind in DAMAGE)
+    print(header)
+    for r in results:
+        damage = "".join(f" {r['found'][kind]:>6}/{r['injected'][kind]:<6}" for kind in DAMAGE)
+        print(f"{r['rows']:>10} {r['file_bytes'] / 1e6:>8.1f} {r['parse']:>8.3f} {r['parse_peak_bytes'] / 1e6:>8.1f} "
+              f"{r['frame_bytes'] / 1e6:>9.1f} {r['compile']:>9.3f} {r['cached']:>9.3f} "
+              f"{r['cached_frame_bytes'] / 1e6:>9.1f} {r['validate']:>8.3f} "
+              f"{r['volumes']:>7.3f} {r['hashes']:>7.3f} {r['malformed']:>7} {r['flagged']:>7}{damage}")
+    if any(r['malformed'] for r in results):
+        print("per kind of damage: rows found / rows injected")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="M.A.P.L.E. synthetic worklists")
+    sub = parser.add_subparsers(dest="command", required=True)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--layout", choices=sorted(LAYOUTS), default="cherrypick")
+    common.add_argument("--density", type=int, choices=[96, 384, 1536], default=384)
+    common.add_argument("--plates", type=int, default=4, help="number of source (or single-plate) barcodes")
+    common.add_argument("--malformed", type=float, default=0.0, help="share of broken rows, e.g. 0.001")
+    common.add_argument("--seed", type=int, default=0)
+    generate = sub.add_parser("generate", parents=[common], help="write one synthetic worklist")
+    generate.add_argument("output")
+    generate.add_argument("--rows", type=int, default=10000)
+    bench = sub.add_parser("bench", parents=[common], help="time loading generated worklists of several sizes")
+    bench.add_argument("--sizes", default="1000,10000,100000,1000000")
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        frame, broken = generateWorklist(args.rows, args.layout, args.density, args.plates, args.malformed, args.seed)
+        writeWorklist(frame, args.output)
+        print(f"Wrote {len(frame.index)} rows ({len(broken)} malformed) to {args.output}")
+        return
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    _printResults(benchmarkLoad(sizes, args.layout, args.density, args.plates, args.malformed))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+# Live worklist reload: notice when the worklist file is saved again, diff the new rows against
+# the loaded ones by content and carry the operator's place and the completed rows over, so a
+# correction made mid-run does not send everyone back to row 0.
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+# how often the GUIs look at the file (ms, for Tk after())
+WATCH_INTERVAL_MS = 1000
+
+
+# one uint64 per row, computed from the cell contents only (not the index)
+def rowHashes(frame):
+    if len(frame.index) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+
+class WorklistDiff:
+    """
+    mapping[i] is the new row index of old row i, or -1 when that row was removed or edited.
+    Rows are matched by content; the common head and tail are matched in bulk and only the
+    rows in between are looked up, so a one-line correction costs O(rows) array compares.
+    """
+    def __init__(self, mapping, newCount):
+        self.mapping = mapping
+        self.newCount = newCount
+        matched = np.zeros(newCount, dtype=bool)
+        matched[mapping[mapping >= 0]] = True
+        # new rows that did not exist before (added or edited)
+        self.added = np.flatnonzero(~matched)
+        self.removed = np.flatnonzero(mapping < 0)
+
+    def unchanged(self):
+        return len(self.added) == 0 and len(self.removed) == 0 and \
+            bool((self.mapping == np.arange(len(self.mapping))).all())
+
+    # where the operator should be after the reload
+    def position(self, oldPosition):
+        if self.newCount == 0:
+            return 0
+        if 0 <= oldPosition < len(self.mapping) and self.mapping[oldPosition] >= 0:
+            return int(self.mapping[oldPosition])
+        # the current row was edited or removed: stay just after the last surviving row before it
+        before = self.mapping[:max(0, oldPosition)]
+        before = before[before >= 0]
+        position = int(before.max()) + 1 if len(before) else 0
+        return min(position, self.newCount - 1)
+
+    # completed rows that still exist, in new row numbers
+    def rows(self, oldRows):
+        oldRows = np.asarray(sorted(oldRows), dtype=np.int64)
+        oldRows = oldRows[(oldRows >= 0) & (oldRows < len(self.mapping))]
+        new = self.mapping[oldRows]
+        return set(int(i) for i in new[new >= 0])
+
+
+def diffWorklists(oldHashes, newHashes):
+    oldCount, newCount = len(oldHashes), len(newHashes)
+    mapping = np.full(oldCount, -1, dtype=np.int64)
+    shortest = min(oldCount, newCount)
+    # common head
+    differs = np.flatnonzero(oldHashes[:shortest] != newHashes[:shortest])
+    head = int(differs[0]) if len(differs) else shortest
+    mapping[:head] = np.arange(head)
+    # common tail (not overlapping the head)
+    limit = shortest - head
+    if limit:
+        differs = np.flatnonzero(oldHashes[oldCount - limit:][::-1] != newHashes[newCount - limit:][::-1])
+        tail = int(differs[0]) if len(differs) else limit
+    else:
+        tail = 0
+    if tail:
+        mapping[oldCount - tail:] = np.arange(newCount - tail, newCount)
+    # middle: match remaining rows by content, duplicates paired in order
+    available = {}
+    for j in range(head, newCount - tail):
+        available.setdefault(int(newHashes[j]), []).append(j)
+    for rows in available.values():
+        rows.reverse()
+    for i in range(head, oldCount - tail):
+        rows = available.get(int(oldHashes[i]))
+        if rows:
+            mapping[i] = rows.pop()
+    return WorklistDiff(mapping, newCount)
+
+
+class WorklistWatcher:
+    """
+    Polled from the Tk loop (no extra thread). A change is only reported once the file size and
+    mtime have been stable for one poll, so Excel's save-in-several-steps is read only once.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.signature = self._stat()
+        self._pending = None
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    # True once per finished save
+    def poll(self):
+        signature = self._stat()
+        if signature is None or signature == self.signature:
+            self._pending = None
+            return False
+        if signature != self._pending:
+            self._pending = signature
+            return False
+        self.signature = signature
+        self._pending = None
+        return True
+
+
+class WorklistReload:
+    """
+    Result of reloadWorklist(): the new frame, where to continue, which rows stay greyed out
+    and whether the current row's content changed (then the panels need the new wells).
+    """
+    def __init__(self, frame, hashes, diff, position, completed, currentChanged, seconds):
+        self.frame = frame
+        self.hashes = hashes
+        self.diff = diff
+        self.position = position
+        self.completed = completed
+        self.currentChanged = currentChanged
+        self.seconds = seconds
+
+    def summary(self):
+        return (f"Worklist reloaded in {self.seconds * 1000:.0f} ms: "
+                f"{len(self.diff.added)} new/edited, {len(self.diff.removed)} removed, "
+                f"now at row {self.position + 1} of {len(self.frame.index)}")
+
+
+def reloadWorklist(newFrame, oldHashes, position, completed):
+    started = time.perf_counter()
+    hashes = rowHashes(newFrame)
+    diff = diffWorklists(oldHashes, hashes)
+    newPosition = diff.position(position)
+    currentChanged = not (0 <= position < len(diff.mapping)) or diff.mapping[position] < 0
+    return WorklistReload(newFrame, hashes, diff, newPosition, diff.rows(completed), bool(currentChanged),
+                          time.perf_counter() - started)